@@ -0,0 +1,216 @@
+import math
+import threading
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA, BufferCircular, iterar_segmentos
+
+# Agregados por intervalo (1 min, 10 min, 1 h) para mirar rangos largos sin
+# mandar cada muestra cruda al navegador. Cada nivel guarda por intervalo
+# mínimo, máximo, media y cantidad de muestras de cada sensor, y se actualiza
+# de forma incremental con cada muestra: el intervalo abierto acumula y al
+# pasar al siguiente se cierra en un buffer circular de tamaño fijo.
+#
+# lttb() reduce cualquier serie a unos cientos de puntos conservando la forma
+# (Largest-Triangle-Three-Buckets), así cada gráfico tiene un tope de puntos
+# sin importar el rango pedido. media_movil() suaviza una serie de una pasada.
+
+CAMPOS = ("humedad", "agua", "temperatura", "humedad_ambiente")
+
+# (nombre, segundos por intervalo, intervalos guardados)
+NIVELES = (
+    ("1m", 60, 1440),      # 1 día
+    ("10m", 600, 1008),    # 7 días
+    ("1h", 3600, 2160),    # 90 días
+)
+
+BLOQUE_HISTORIAL = 1 << 20  # muestras por lectura al rehacer los niveles desde el disco
+
+DTYPE_AGREGADO = np.dtype([("t", "<f8"), ("n", "<u4")] + [
+    (f"{campo}_{medida}", "<f4" if medida != "media" else "<f8")
+    for campo in CAMPOS for medida in ("min", "max", "media")
+])
+
+
+class Agregador:
+    def __init__(self, segundos, capacidad):
+        self.segundos = segundos
+        self.cerrados = BufferCircular(capacidad, dtype=DTYPE_AGREGADO)
+        # Intervalo abierto en floats de Python (más barato que tocar un registro numpy por muestra)
+        self._t = None
+        self._n = 0
+        self._min = self._max = self._media = None
+        self._lock = threading.Lock()
+
+    def _inicio(self, t):
+        return math.floor(t / self.segundos) * self.segundos
+
+    def _registro_abierto(self):
+        registro = np.zeros((), dtype=DTYPE_AGREGADO)
+        registro["t"] = self._t
+        registro["n"] = self._n
+        for k, campo in enumerate(CAMPOS):
+            registro[f"{campo}_min"] = self._min[k]
+            registro[f"{campo}_max"] = self._max[k]
+            registro[f"{campo}_media"] = self._media[k]
+        return registro
+
+    def agregar(self, t, valores):
+        inicio = self._inicio(t)
+        with self._lock:
+            if inicio != self._t:
+                if self._t is not None:
+                    self.cerrados.agregar(self._registro_abierto())
+                self._t = inicio
+                self._n = 0
+                self._min = [float(v) for v in valores]
+                self._max = list(self._min)
+                self._media = [0.0] * len(CAMPOS)
+            self._n += 1
+            n = self._n
+            minimos, maximos, promedios = self._min, self._max, self._media
+            for k, valor in enumerate(valores):
+                if valor < minimos[k]:
+                    minimos[k] = valor
+                elif valor > maximos[k]:
+                    maximos[k] = valor
+                # Media incremental: sin sumas que crezcan sin límite
+                promedios[k] += (valor - promedios[k]) / n
+
+    def _resumir(self, muestras):
+        # Agregados por intervalo de un bloque de muestras crudas ordenadas por t
+        inicios = np.floor(muestras["t"] / self.segundos) * self.segundos
+        cortes = np.flatnonzero(np.diff(inicios)) + 1
+        bordes = np.concatenate(([0], cortes))
+        agregados = np.zeros(len(bordes), dtype=DTYPE_AGREGADO)
+        agregados["t"] = inicios[bordes]
+        agregados["n"] = np.diff(np.append(bordes, len(muestras)))
+        for campo in CAMPOS:
+            columna = muestras[campo].astype(np.float64)
+            agregados[f"{campo}_min"] = np.minimum.reduceat(columna, bordes)
+            agregados[f"{campo}_max"] = np.maximum.reduceat(columna, bordes)
+            agregados[f"{campo}_media"] = np.add.reduceat(columna, bordes) / agregados["n"]
+        return agregados
+
+    def cargar(self, muestras):
+        """Suma de una vez muestras crudas ordenadas por t, posteriores a las ya agregadas
+        (al arrancar: la ventana caliente o los segmentos en disco, de a bloques)."""
+        if len(muestras) == 0:
+            return
+        agregados = self._resumir(muestras)
+        with self._lock:
+            if self._t is not None:
+                primero = agregados[0]
+                if float(primero["t"]) == self._t:
+                    # El bloque sigue el intervalo abierto: se combinan
+                    n = self._n + int(primero["n"])
+                    for k, campo in enumerate(CAMPOS):
+                        primero[f"{campo}_min"] = min(self._min[k], float(primero[f"{campo}_min"]))
+                        primero[f"{campo}_max"] = max(self._max[k], float(primero[f"{campo}_max"]))
+                        primero[f"{campo}_media"] = (self._media[k] * self._n
+                                                     + float(primero[f"{campo}_media"]) * int(primero["n"])) / n
+                    primero["n"] = n
+                else:
+                    self.cerrados.agregar(self._registro_abierto())
+            self.cerrados.agregar_lote(agregados[:-1])
+            # El último intervalo queda abierto para seguir acumulando
+            ultimo = agregados[-1]
+            self._t = float(ultimo["t"])
+            self._n = int(ultimo["n"])
+            self._min = [float(ultimo[f"{campo}_min"]) for campo in CAMPOS]
+            self._max = [float(ultimo[f"{campo}_max"]) for campo in CAMPOS]
+            self._media = [float(ultimo[f"{campo}_media"]) for campo in CAMPOS]
+
+    def rango(self, desde, hasta):
+        """Intervalos que empiezan entre desde y hasta, incluido el abierto."""
+        partes = [self.cerrados.rango(self._inicio(desde), hasta)]
+        with self._lock:
+            if self._t is not None and self._inicio(desde) <= self._t <= hasta:
+                partes.append(self._registro_abierto().reshape(1))
+        return np.concatenate(partes)
+
+
+class MotorAgregados:
+    def __init__(self, niveles=NIVELES):
+        self.niveles = {nombre: Agregador(segundos, capacidad) for nombre, segundos, capacidad in niveles}
+
+    def agregar(self, t, humedad, agua, temperatura, humedad_ambiente):
+        valores = (humedad, agua, temperatura, humedad_ambiente)
+        for agregador in self.niveles.values():
+            agregador.agregar(t, valores)
+
+    def agregar_lote(self, muestras):
+        columnas = [muestras[campo].tolist() for campo in ("t",) + CAMPOS]
+        for t, humedad, agua, temperatura, humedad_ambiente in zip(*columnas):
+            self.agregar(t, humedad, agua, temperatura, humedad_ambiente)
+
+    def cargar(self, muestras):
+        for agregador in self.niveles.values():
+            agregador.cargar(muestras)
+
+    def cargar_historial(self, directorio, hasta, antes_de=np.inf, bloque=BLOQUE_HISTORIAL):
+        """Rehace cada nivel con los segmentos en disco que caen en su retención (hasta 90
+        días para el de 1 h) y son anteriores a `antes_de`, leyendo de a `bloque` muestras."""
+        inicios = {agregador: agregador._inicio(hasta - agregador.segundos * agregador.cerrados.capacidad)
+                   for agregador in self.niveles.values()}
+        for muestras in iterar_segmentos(directorio, min(inicios.values()), antes_de, bloque):
+            for agregador, inicio in inicios.items():
+                if muestras["t"][-1] >= inicio:
+                    agregador.cargar(muestras[np.searchsorted(muestras["t"], inicio, "left"):])
+
+    def nivel_para(self, segundos, max_intervalos):
+        """El nivel más fino que cubre `segundos` con a lo sumo `max_intervalos` intervalos."""
+        candidatos = list(self.niveles.values())
+        for agregador in candidatos:
+            if segundos / agregador.segundos <= max_intervalos:
+                return agregador
+        return candidatos[-1]
+
+    def rango(self, desde, hasta, max_intervalos):
+        return self.nivel_para(hasta - desde, max_intervalos).rango(desde, hasta)
+
+
+def medias(agregados):
+    """Agregados como muestras (medias de cada intervalo), para graficarlos igual que las crudas."""
+    muestras = np.zeros(len(agregados), dtype=DTYPE_MUESTRA)
+    muestras["t"] = agregados["t"]
+    for campo in CAMPOS:
+        muestras[campo] = agregados[f"{campo}_media"]
+    return muestras
+
+
+def lttb(x, y, umbral):
+    """Índices de los `umbral` puntos que conservan la forma de la serie (x creciente)."""
+    n = len(x)
+    if umbral >= n or umbral < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    indices = np.empty(umbral, dtype=np.intp)
+    indices[0] = 0
+    indices[-1] = n - 1
+    # umbral-2 cubetas entre el primer y el último punto, que siempre se conservan
+    bordes = np.linspace(1, n - 1, umbral - 1).astype(np.intp)
+    a = 0
+    for i in range(umbral - 2):
+        inicio, fin = bordes[i], bordes[i + 1]
+        if i + 2 < len(bordes):
+            siguiente = slice(bordes[i + 1], bordes[i + 2])
+        else:
+            siguiente = slice(n - 1, n)
+        xc = x[siguiente].mean()
+        yc = y[siguiente].mean()
+        # Área del triángulo (punto elegido antes, candidato, promedio de la cubeta siguiente)
+        areas = np.abs((x[a] - xc) * (y[inicio:fin] - y[a]) - (x[a] - x[inicio:fin]) * (yc - y[a]))
+        a = inicio + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def media_movil(t, valores, segundos):
+    """Media de los últimos `segundos` en cada muestra, con sumas acumuladas (sirve con muestreo irregular)."""
+    t = np.asarray(t, dtype=np.float64)
+    acumulado = np.concatenate(([0.0], np.cumsum(valores, dtype=np.float64)))
+    inicio = np.searchsorted(t, t - segundos, "left")
+    fin = np.arange(1, len(t) + 1)
+    return (acumulado[fin] - acumulado[inicio]) / (fin - inicio)
@@ -0,0 +1,181 @@
+import json
+import os
+import threading
+from collections import deque
+
+from instantanea import UMBRALES
+from metricas import contador
+
+# Motor de alertas en el camino de ingesta: se evalúa una vez por muestra guardada
+# (como etapa de la tubería), no una vez por cliente y por tick.
+#
+# Cada regla clasifica un sensor en "bajo" / "optimo" / "alto" con:
+#   histeresis  para salir de "bajo" hace falta superar bajo + histeresis (y para salir
+#               de "alto", bajar de alto - histeresis): un valor que ronda el umbral no
+#               hace parpadear la alerta
+#   duracion    el nivel nuevo tiene que sostenerse estos segundos antes de cambiar
+#   ventana     si es > 0 se evalúa la media (o el mínimo / máximo) de los últimos
+#               `ventana` segundos en lugar del valor crudo
+#
+# Solo los cambios de nivel se emiten: a los suscriptores, al historial en memoria y,
+# si hay ruta, a un registro NDJSON. Cada muestra cuesta O(1) por regla: la ventana
+# lleva una suma corrida (media) o una cola monótona (mínimo / máximo).
+
+AGREGADOS = ("media", "min", "max")
+MAX_HISTORIAL = 500
+
+transiciones = contador("alertas_transiciones_total", "Cambios de nivel de las reglas de alerta", ("regla", "nivel"))
+
+
+class Regla:
+    def __init__(self, nombre, campo, bajo=None, alto=None, histeresis=0.0, duracion=0.0, ventana=0.0,
+                 agregado="media"):
+        if agregado not in AGREGADOS:
+            raise ValueError(f"Agregado desconocido en la regla {nombre}: {agregado}")
+        self.nombre = nombre
+        self.campo = campo
+        self.bajo = bajo
+        self.alto = alto
+        self.histeresis = histeresis
+        self.duracion = duracion
+        self.ventana = ventana
+        self.agregado = agregado
+
+    def nivel(self, valor, actual):
+        if self.bajo is not None and valor < self.bajo + (self.histeresis if actual == "bajo" else 0):
+            return "bajo"
+        if self.alto is not None and valor > self.alto - (self.histeresis if actual == "alto" else 0):
+            return "alto"
+        return "optimo"
+
+
+# Las tres alertas del tablero, con los mismos umbrales que los niveles de la instantánea
+REGLAS_POR_DEFECTO = (
+    Regla("humedad", "humedad", *UMBRALES["humedad"], histeresis=2, duracion=5),
+    Regla("temperatura", "temperatura", *UMBRALES["temperatura"], histeresis=0.5, duracion=5),
+    Regla("humedad_ambiente", "humedad_ambiente", *UMBRALES["humedad_ambiente"], histeresis=2, duracion=5),
+)
+
+
+def anunciar(transicion):
+    # Suscriptor para la consola; el primer nivel de cada zona no es un cambio
+    if transicion["anterior"] is not None:
+        print(f"🔔 {transicion['zona']} {transicion['regla']}: {transicion['anterior']} → {transicion['nivel']} "
+              f"({transicion['valor']})")
+
+
+def cargar_reglas(ruta):
+    """Reglas desde un JSON con una lista de objetos con los argumentos de Regla."""
+    with open(ruta, encoding="utf-8") as archivo:
+        return [Regla(**regla) for regla in json.load(archivo)]
+
+
+class _Ventana:
+    # Media, mínimo o máximo de los últimos `segundos`, actualizado en O(1) amortizado
+    def __init__(self, segundos, agregado):
+        self.segundos = segundos
+        self.agregado = agregado
+        self.muestras = deque()  # (t, valor); con min/max solo las que todavía pueden ser extremo
+        self.suma = 0.0
+        self.signo = -1 if agregado == "max" else 1
+
+    def agregar(self, t, valor):
+        if self.agregado == "media":
+            self.muestras.append((t, valor))
+            self.suma += valor
+            while t - self.muestras[0][0] > self.segundos:
+                self.suma -= self.muestras.popleft()[1]
+            return self.suma / len(self.muestras)
+        # Cola monótona: se van las que ya no pueden ser el extremo mientras siga esta
+        while self.muestras and self.signo * self.muestras[-1][1] >= self.signo * valor:
+            self.muestras.pop()
+        self.muestras.append((t, valor))
+        while t - self.muestras[0][0] > self.segundos:
+            self.muestras.popleft()
+        return self.muestras[0][1]
+
+
+class _Estado:
+    __slots__ = ("nivel", "candidato", "desde", "ventana")
+
+    def __init__(self, regla):
+        self.nivel = None
+        self.candidato = None
+        self.desde = 0.0
+        self.ventana = _Ventana(regla.ventana, regla.agregado) if regla.ventana > 0 else None
+
+
+class MotorAlertas:
+    def __init__(self, reglas=REGLAS_POR_DEFECTO, ruta_registro=None, max_historial=MAX_HISTORIAL):
+        self.reglas = list(reglas)
+        self.ruta_registro = ruta_registro
+        if ruta_registro is not None:
+            os.makedirs(os.path.dirname(ruta_registro) or ".", exist_ok=True)
+        self.historial = deque(maxlen=max_historial)
+        self._estados = {}  # zona -> [_Estado por regla]
+        self._suscriptores = []
+        self._lock = threading.Lock()
+
+    def suscribir(self, funcion):
+        """funcion(transicion) con cada cambio de nivel; transicion es un dict."""
+        self._suscriptores.append(funcion)
+
+    def nivel(self, zona, nombre):
+        estados = self._estados.get(zona)
+        if estados is None:
+            return None
+        for regla, estado in zip(self.reglas, estados):
+            if regla.nombre == nombre:
+                return estado.nivel
+        return None
+
+    def ultimas(self, n=None):
+        with self._lock:
+            historial = list(self.historial)
+        return historial if n is None else historial[-n:]
+
+    def evaluar(self, zona, t, valores):
+        """Evalúa una muestra (valores: campo -> valor) y devuelve las transiciones que produjo."""
+        estados = self._estados.get(zona)
+        if estados is None:
+            estados = self._estados[zona] = [_Estado(regla) for regla in self.reglas]
+        cambios = []
+        for regla, estado in zip(self.reglas, estados):
+            valor = valores[regla.campo]
+            if estado.ventana is not None:
+                valor = estado.ventana.agregar(t, valor)
+            nuevo = regla.nivel(valor, estado.nivel)
+            if nuevo == estado.nivel:
+                estado.candidato = None
+                continue
+            if nuevo != estado.candidato:
+                estado.candidato = nuevo
+                estado.desde = t
+            # El primer nivel de cada zona se toma sin esperar
+            if estado.nivel is None or t - estado.desde >= regla.duracion:
+                cambios.append({"t": t, "zona": zona, "regla": regla.nombre, "anterior": estado.nivel,
+                                "nivel": nuevo, "valor": round(float(valor), 2)})
+                estado.nivel = nuevo
+                estado.candidato = None
+        if cambios:
+            self._emitir(cambios)
+        return cambios
+
+    def evaluar_lote(self, dispositivo, muestras, llegada=None):
+        # Etapa de la tubería: recorre el lote fila por fila (las reglas tienen estado)
+        campos = sorted({regla.campo for regla in self.reglas})
+        columnas = [muestras["t"].tolist()] + [muestras[campo].tolist() for campo in campos]
+        for fila in zip(*columnas):
+            self.evaluar(dispositivo.id, fila[0], dict(zip(campos, fila[1:])))
+
+    def _emitir(self, cambios):
+        with self._lock:
+            self.historial.extend(cambios)
+        for cambio in cambios:
+            transiciones.inc(cambio["regla"], cambio["nivel"])
+        if self.ruta_registro is not None:
+            with open(self.ruta_registro, "a", encoding="utf-8") as registro:
+                registro.writelines(json.dumps(cambio, ensure_ascii=False) + "\n" for cambio in cambios)
+        for funcion in self._suscriptores:
+            for cambio in cambios:
+                funcion(cambio)
@@ -0,0 +1,371 @@
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+
+# Almacenamiento de series de tiempo en dos niveles:
+#   - BufferCircular: ventana caliente en memoria, preasignada y de tamaño fijo.
+#   - SegmentosDisco: historial largo en archivos binarios de solo-anexado que se
+#     leen con np.memmap, sin cargarlos enteros en memoria.
+# Cada muestra es un registro de tamaño fijo con el instante en segundos epoch.
+# Los instantes nunca retroceden, así la columna "t" es un índice ordenado y
+# cualquier ventana de tiempo se resuelve con búsqueda binaria.
+
+DTYPE_MUESTRA = np.dtype([
+    ("t", "<f8"),
+    ("humedad", "<f4"),
+    ("agua", "<f4"),
+    ("temperatura", "<f4"),
+    ("humedad_ambiente", "<f4"),
+])
+
+_VACIO = np.empty(0, dtype=DTYPE_MUESTRA)
+
+# Epoch derivado del reloj monotónico: los ajustes finos de NTP no lo mueven. Pero en
+# una Raspberry sin RTC el reloj arranca atrasado y NTP lo corrige de golpe después del
+# boot: si el reloj de pared se separa más de SALTO_REANCLAJE segundos se toma la base
+# nueva, para no guardar toda la vida del proceso con la hora corrida. Si el salto es
+# hacia atrás el almacén igual conserva el orden (los instantes nunca retroceden).
+SALTO_REANCLAJE = 2.0
+_BASE_EPOCH = time.time() - time.monotonic()
+
+
+def instante_actual():
+    global _BASE_EPOCH
+    monotonico = time.monotonic()
+    base = time.time() - monotonico
+    if abs(base - _BASE_EPOCH) > SALTO_REANCLAJE:
+        _BASE_EPOCH = base
+    return _BASE_EPOCH + monotonico
+
+
+class BufferCircular:
+    def __init__(self, capacidad, dtype=DTYPE_MUESTRA):
+        self.capacidad = capacidad
+        self._datos = np.zeros(capacidad, dtype=dtype)
+        self._vacio = np.empty(0, dtype=dtype)
+        self._siguiente = 0
+        self._cantidad = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._cantidad
+
+    def agregar(self, registro):
+        with self._lock:
+            self._datos[self._siguiente] = registro
+            self._siguiente = (self._siguiente + 1) % self.capacidad
+            if self._cantidad < self.capacidad:
+                self._cantidad += 1
+
+    def agregar_lote(self, registros):
+        # Varias muestras con a lo sumo dos copias contiguas (si el lote cruza el final)
+        registros = registros[-self.capacidad:]
+        n = len(registros)
+        with self._lock:
+            inicio = self._siguiente
+            hasta_final = min(n, self.capacidad - inicio)
+            self._datos[inicio:inicio + hasta_final] = registros[:hasta_final]
+            self._datos[:n - hasta_final] = registros[hasta_final:]
+            self._siguiente = (inicio + n) % self.capacidad
+            self._cantidad = min(self._cantidad + n, self.capacidad)
+
+    def cargar(self, registros):
+        # Rellena el buffer vacío de una vez (p. ej. con la cola del historial en disco)
+        registros = registros[-self.capacidad:]
+        n = len(registros)
+        with self._lock:
+            self._datos[:n] = registros
+            self._siguiente = n % self.capacidad
+            self._cantidad = n
+
+    def _tramos(self):
+        # Los datos en orden cronológico como (a lo sumo) dos vistas contiguas
+        if self._cantidad < self.capacidad:
+            return (self._datos[:self._cantidad],)
+        return (self._datos[self._siguiente:], self._datos[:self._siguiente])
+
+    def ultimos(self, n):
+        """Copia de las últimas n muestras, de la más antigua a la más reciente."""
+        with self._lock:
+            n = min(n, self._cantidad)
+            if n == 0:
+                return self._vacio
+            indices = (self._siguiente - n + np.arange(n)) % self.capacidad
+            return self._datos[indices]
+
+    def rango(self, desde, hasta, copiar=True):
+        # Con copiar=False se devuelve una vista si la ventana no cruza el punto de
+        # vuelta del buffer: evita la copia, pero solo vale mientras no se sobrescriba.
+        with self._lock:
+            partes = []
+            for tramo in self._tramos():
+                t = tramo["t"]
+                inicio = np.searchsorted(t, desde, "left")
+                fin = np.searchsorted(t, hasta, "right")
+                if inicio < fin:
+                    partes.append(tramo[inicio:fin])
+            if not partes:
+                return self._vacio
+            if len(partes) == 1 and not copiar:
+                return partes[0]
+            return np.concatenate(partes)
+
+    def primer_instante(self):
+        with self._lock:
+            if self._cantidad == 0:
+                return None
+            if self._cantidad < self.capacidad:
+                return float(self._datos["t"][0])
+            return float(self._datos["t"][self._siguiente])
+
+
+class SegmentosDisco:
+    def __init__(self, directorio, registros_por_segmento=86400, intervalo_flush=1.0, max_segmentos=None):
+        self.directorio = directorio
+        self.registros_por_segmento = registros_por_segmento
+        self.intervalo_flush = intervalo_flush
+        self.max_segmentos = max_segmentos
+        os.makedirs(directorio, exist_ok=True)
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._registros_activo = 0
+        self._ultimo_flush = time.monotonic()
+        # Lista ordenada de (instante inicial, ruta); el nombre del archivo es el instante en ms
+        self._segmentos = []
+        for ruta in sorted(glob.glob(os.path.join(directorio, "seg_*.bin"))):
+            self._reparar(ruta)
+            inicio = int(os.path.basename(ruta)[4:-4]) / 1000
+            self._segmentos.append((inicio, ruta))
+
+    @staticmethod
+    def _reparar(ruta):
+        # Un corte de luz puede dejar un registro a medias al final del archivo
+        tam = os.path.getsize(ruta)
+        sobrante = tam % DTYPE_MUESTRA.itemsize
+        if sobrante:
+            with open(ruta, "r+b") as f:
+                f.truncate(tam - sobrante)
+
+    def _abrir_segmento(self, inicio):
+        ruta = os.path.join(self.directorio, f"seg_{int(inicio * 1000):015d}.bin")
+        self._archivo = open(ruta, "ab")
+        self._registros_activo = 0
+        self._segmentos.append((inicio, ruta))
+        if self.max_segmentos is not None:
+            while len(self._segmentos) > self.max_segmentos:
+                _, vieja = self._segmentos.pop(0)
+                os.remove(vieja)
+
+    def agregar(self, registro):
+        with self._lock:
+            if self._archivo is None or self._registros_activo >= self.registros_por_segmento:
+                if self._archivo is not None:
+                    self._archivo.close()
+                self._abrir_segmento(float(registro["t"]))
+            self._archivo.write(registro.tobytes())
+            self._registros_activo += 1
+            ahora = time.monotonic()
+            if ahora - self._ultimo_flush >= self.intervalo_flush:
+                self._archivo.flush()
+                self._ultimo_flush = ahora
+
+    def agregar_lote(self, registros):
+        # Una escritura por segmento tocado en lugar de una por muestra
+        with self._lock:
+            while len(registros):
+                if self._archivo is None or self._registros_activo >= self.registros_por_segmento:
+                    if self._archivo is not None:
+                        self._archivo.close()
+                    self._abrir_segmento(float(registros["t"][0]))
+                k = min(len(registros), self.registros_por_segmento - self._registros_activo)
+                self._archivo.write(registros[:k].tobytes())
+                self._registros_activo += k
+                registros = registros[k:]
+            ahora = time.monotonic()
+            if ahora - self._ultimo_flush >= self.intervalo_flush:
+                self._archivo.flush()
+                self._ultimo_flush = ahora
+
+    def _leer_segmento(self, ruta):
+        if os.path.getsize(ruta) == 0:
+            return _VACIO
+        return np.memmap(ruta, dtype=DTYPE_MUESTRA, mode="r")
+
+    def rango(self, desde, hasta):
+        """Muestras con desde <= t <= hasta, leídas de los segmentos que se solapan."""
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.flush()
+            segmentos = list(self._segmentos)
+        partes = []
+        for i, (inicio, ruta) in enumerate(segmentos):
+            fin = segmentos[i + 1][0] if i + 1 < len(segmentos) else float("inf")
+            if fin < desde or inicio > hasta:
+                continue
+            datos = self._leer_segmento(ruta)
+            t = datos["t"]
+            trozo = datos[np.searchsorted(t, desde, "left"):np.searchsorted(t, hasta, "right")]
+            if len(trozo):
+                partes.append(np.array(trozo))
+        if not partes:
+            return _VACIO
+        return np.concatenate(partes)
+
+    def cola(self, n):
+        """Últimas n muestras guardadas en disco (para restaurar el buffer al arrancar)."""
+        with self._lock:
+            segmentos = list(self._segmentos)
+        partes = []
+        for _, ruta in reversed(segmentos):
+            if n <= 0:
+                break
+            datos = self._leer_segmento(ruta)
+            trozo = datos[-n:] if len(datos) > n else datos
+            partes.append(np.array(trozo))
+            n -= len(trozo)
+        if not partes:
+            return _VACIO
+        return np.concatenate(partes[::-1])
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+
+def _segmentos(directorio):
+    # (inicio, inicio del siguiente, ruta) de cada segmento; el nombre es el instante inicial en ms
+    rutas = sorted(glob.glob(os.path.join(directorio, "seg_*.bin")))
+    inicios = [int(os.path.basename(ruta)[4:-4]) / 1000 for ruta in rutas]
+    return [(inicio, inicios[i + 1] if i + 1 < len(rutas) else float("inf"), ruta)
+            for i, (inicio, ruta) in enumerate(zip(inicios, rutas))]
+
+
+def _registros(ruta):
+    # Solo registros completos: el escritor puede estar a mitad de uno
+    return os.path.getsize(ruta) // DTYPE_MUESTRA.itemsize
+
+
+def _segmentos_solapados(directorio, desde, hasta):
+    # Memmap de los segmentos que pueden tener muestras en [desde, hasta)
+    for inicio, fin, ruta in _segmentos(directorio):
+        if fin < desde or inicio >= hasta:
+            continue
+        n = _registros(ruta)
+        if n:
+            yield np.memmap(ruta, dtype=DTYPE_MUESTRA, mode="r", shape=(n,))
+
+
+def vistas_segmentos(directorio, desde, hasta):
+    """Vistas de solo lectura (memmap, sin copiar) de las muestras con desde <= t < hasta,
+    una por segmento y en orden cronológico."""
+    for datos in _segmentos_solapados(directorio, desde, hasta):
+        t = datos["t"]
+        vista = datos[np.searchsorted(t, desde, "left"):np.searchsorted(t, hasta, "left")]
+        if len(vista):
+            yield vista
+
+
+def iterar_segmentos(directorio, desde, hasta, bloque=65536):
+    """Muestras con desde <= t < hasta de los segmentos de un directorio, en bloques de a lo
+    sumo `bloque` registros. Solo lectura: sirve desde otro proceso mientras la ingesta escribe."""
+    for vista in vistas_segmentos(directorio, desde, hasta):
+        for k in range(0, len(vista), bloque):
+            yield np.array(vista[k:k + bloque])
+
+
+def contar_segmentos(directorio, desde, hasta):
+    """Cantidad de muestras con desde <= t < hasta, sin leerlas (búsqueda binaria por segmento)."""
+    total = 0
+    for inicio, fin, ruta in _segmentos(directorio):
+        if fin < desde or inicio >= hasta:
+            continue
+        # Segmento entero dentro del rango: alcanza con el tamaño del archivo
+        # (el nombre trunca a ms, de ahí el margen)
+        if desde <= inicio and fin + 0.001 < hasta:
+            total += _registros(ruta)
+            continue
+        n = _registros(ruta)
+        if n:
+            t = np.memmap(ruta, dtype=DTYPE_MUESTRA, mode="r", shape=(n,))["t"]
+            total += int(np.searchsorted(t, hasta, "left") - np.searchsorted(t, desde, "left"))
+    return total
+
+
+def _hasta_incluido(tiempos, x):
+    return sum(int(np.searchsorted(t, x, "right")) for t in tiempos)
+
+
+def kesimo_instante(tiempos, k):
+    """Instante de la fila k (ascendente, desde 0) en la unión de varios arreglos de t ordenados:
+    el menor x con más de k filas en t <= x, por bisección sobre el valor (exacta hasta el último bit)."""
+    bajo = min(float(t[0]) for t in tiempos)
+    alto = max(float(t[-1]) for t in tiempos)
+    if _hasta_incluido(tiempos, bajo) > k:
+        return bajo
+    while True:
+        medio = (bajo + alto) / 2
+        if medio <= bajo or medio >= alto:
+            return alto
+        if _hasta_incluido(tiempos, medio) > k:
+            alto = medio
+        else:
+            bajo = medio
+
+
+class Almacen:
+    def __init__(self, directorio, capacidad_memoria=86400, **opciones_disco):
+        self.memoria = BufferCircular(capacidad_memoria)
+        self.disco = SegmentosDisco(directorio, **opciones_disco)
+        self.memoria.cargar(self.disco.cola(capacidad_memoria))
+        self._registro = np.zeros((), dtype=DTYPE_MUESTRA)
+        ultimos = self.memoria.ultimos(1)
+        self._ultimo_t = float(ultimos["t"][0]) if len(ultimos) else 0.0
+
+    def agregar(self, t, humedad, agua, temperatura, humedad_ambiente):
+        # Si el reloj del sistema retrocedió entre reinicios se conserva el orden
+        t = max(t, self._ultimo_t)
+        self._ultimo_t = t
+        registro = self._registro
+        registro["t"] = t
+        registro["humedad"] = humedad
+        registro["agua"] = agua
+        registro["temperatura"] = temperatura
+        registro["humedad_ambiente"] = humedad_ambiente
+        self.memoria.agregar(registro)
+        self.disco.agregar(registro)
+        return t
+
+    def agregar_lote(self, muestras):
+        """Agrega un arreglo de muestras ordenado por llegada. Corrige sus instantes en el
+        lugar (nunca retroceden, igual que agregar) y lo devuelve."""
+        if len(muestras) == 0:
+            return muestras
+        muestras["t"] = np.maximum.accumulate(np.maximum(muestras["t"], self._ultimo_t))
+        self._ultimo_t = float(muestras["t"][-1])
+        self.memoria.agregar_lote(muestras)
+        self.disco.agregar_lote(muestras)
+        return muestras
+
+    def ultimos(self, n):
+        return self.memoria.ultimos(n)
+
+    def rango(self, desde, hasta, copiar=True):
+        # Si la ventana cabe en memoria no se toca el disco
+        primero = self.memoria.primer_instante()
+        if primero is not None and desde >= primero:
+            return self.memoria.rango(desde, hasta, copiar)
+        return self.disco.rango(desde, hasta)
+
+    def ventana(self, segundos, ahora=None, copiar=True):
+        """Muestras de los últimos `segundos` (búsqueda binaria sobre el índice de tiempo)."""
+        if ahora is None:
+            ahora = instante_actual()
+        return self.rango(ahora - segundos, ahora, copiar)
+
+    def cerrar(self):
+        self.disco.cerrar()
@@ -0,0 +1,165 @@
+import bisect
+import json
+import threading
+from collections import deque
+
+import numpy as np
+
+from metricas import contador
+
+# Detección de anomalías y fallas de sensor en el camino de ingesta, antes de guardar.
+# Por cada sensor, con memoria constante:
+#
+#   fuera_de_rango  valores físicamente imposibles (humedad fuera de 0-100, DHT fuera
+#                   de su rango de medición)
+#   salto           cambio respecto de la última muestra aceptada mayor que
+#                   `salto + tasa * dt`; si el nuevo nivel se sostiene media ventana
+#                   y la mediana ya lo acompaña (un riego) se acepta
+#   atipico         lejos de la mediana móvil de las últimas VENTANA lecturas, en
+#                   unidades de MAD (desviación absoluta mediana, con un piso por sensor)
+#   trabado         el mismo valor exacto durante `trabado` segundos (un DHT colgado):
+#                   no se descarta, queda marcado y avisado
+#
+# Modos: "cuarentena" saca las muestras anómalas del flujo (no llegan al almacén, a los
+# gráficos ni a las alertas) y las deja en un registro aparte; "marcar" solo las cuenta
+# y registra; "desactivado" no hace nada.
+
+MODOS = ("cuarentena", "marcar", "desactivado")
+VENTANA = 15
+MIN_VENTANA = 5        # lecturas mínimas para juzgar contra la mediana
+UMBRAL_MAD = 6.0
+ESCALA_MAD = 1.4826    # MAD -> desviación estándar si el ruido fuera normal
+HUECO_REINICIO = 60.0  # segundos sin muestras tras los que se olvida la ventana
+MAX_CUARENTENA = 500
+
+# campo: (mínimo, máximo, salto por muestra, tasa por segundo, piso del MAD, segundos para "trabado")
+SENSORES = {
+    "humedad": (0.0, 100.0, 15.0, 1.0, 2.0, None),  # el suelo puede quedarse quieto horas
+    "temperatura": (-40.0, 80.0, 3.0, 0.1, 0.3, 900.0),
+    "humedad_ambiente": (0.0, 100.0, 10.0, 0.5, 1.0, 900.0),
+}
+
+anomalias = contador("anomalias_total", "Muestras marcadas por el detector de anomalías", ("zona", "sensor", "motivo"))
+
+
+class _Sensor:
+    __slots__ = ("minimo", "maximo", "salto", "tasa", "piso", "segundos_trabado", "ventana", "ordenada",
+                 "aceptado", "t_aceptado", "saltos", "anterior", "desde", "trabado")
+
+    def __init__(self, minimo, maximo, salto, tasa, piso, segundos_trabado):
+        self.minimo, self.maximo = minimo, maximo
+        self.salto, self.tasa, self.piso = salto, tasa, piso
+        self.segundos_trabado = segundos_trabado
+        self.ventana = deque()  # en orden de llegada
+        self.ordenada = []      # las mismas, ordenadas para la mediana
+        self.aceptado = None
+        self.t_aceptado = None
+        self.saltos = 0         # saltos seguidos respecto de la última aceptada
+        self.anterior = None
+        self.desde = 0.0
+        self.trabado = False
+
+    def olvidar(self):
+        self.ventana.clear()
+        self.ordenada.clear()
+
+    def revisar(self, t, valor):
+        """Motivo por el que la lectura es anómala, o None."""
+        # Trabado: se marca pero no descarta la lectura
+        if valor != self.anterior:
+            self.anterior, self.desde, self.trabado = valor, t, False
+        elif self.segundos_trabado is not None and t - self.desde >= self.segundos_trabado:
+            self.trabado = True
+
+        if not self.minimo <= valor <= self.maximo:
+            return "fuera_de_rango"
+
+        motivo = None
+        salto = self.aceptado is not None and abs(valor - self.aceptado) > self.salto + self.tasa * (t - self.t_aceptado)
+        n = len(self.ordenada)
+        if n >= MIN_VENTANA:
+            mediana = self.ordenada[n // 2] if n % 2 else (self.ordenada[n // 2 - 1] + self.ordenada[n // 2]) / 2
+            desvio = abs(valor - mediana)
+            # El MAD solo se calcula si el desvío pasa el piso (la escala nunca baja de ahí)
+            if desvio > UMBRAL_MAD * self.piso:
+                mad = sorted(abs(x - mediana) for x in self.ordenada)[n // 2] * ESCALA_MAD
+                if desvio > UMBRAL_MAD * max(mad, self.piso):
+                    motivo = "atipico"
+            # Un salto que ya sostiene la mayoría de la ventana es un cambio de nivel real
+            if salto and motivo is None and self.saltos >= VENTANA // 2:
+                salto = False
+        if salto:
+            motivo = "salto"
+        self.saltos = self.saltos + 1 if salto else 0
+
+        # También las anómalas entran a la ventana: si el cambio es real, la mediana lo alcanza
+        if len(self.ventana) >= VENTANA:
+            self.ordenada.pop(bisect.bisect_left(self.ordenada, self.ventana.popleft()))
+        self.ventana.append(valor)
+        bisect.insort(self.ordenada, valor)
+        if motivo is None:
+            self.aceptado, self.t_aceptado = valor, t
+        return motivo
+
+
+class DetectorAnomalias:
+    def __init__(self, zona, modo="cuarentena", ruta_registro=None, sensores=SENSORES):
+        if modo not in MODOS:
+            raise ValueError(f"Modo de anomalías desconocido: {modo}")
+        self.zona = zona
+        self.modo = modo
+        self.ruta_registro = ruta_registro
+        self.sensores = {campo: _Sensor(*limites) for campo, limites in sensores.items()}
+        self.cuarentena = deque(maxlen=MAX_CUARENTENA)
+        self.marcadas = 0
+        self._ultimo_t = None
+        self._lock = threading.Lock()
+
+    def trabados(self):
+        return {campo: sensor.trabado for campo, sensor in self.sensores.items()}
+
+    def filtrar(self, muestras):
+        """Revisa un lote en orden. En modo cuarentena devuelve las muestras aceptadas;
+        si no descarta nada devuelve None (el lote sigue igual)."""
+        if self.modo == "desactivado" or len(muestras) == 0:
+            return None
+        campos = list(self.sensores)
+        columnas = [muestras["t"].tolist()] + [muestras[campo].tolist() for campo in campos]
+        sensores = [self.sensores[campo] for campo in campos]
+        trabados_antes = [sensor.trabado for sensor in sensores]
+        rechazadas = []
+        marcas = []
+        for i, fila in enumerate(zip(*columnas)):
+            t = fila[0]
+            if self._ultimo_t is not None and t - self._ultimo_t > HUECO_REINICIO:
+                for sensor in sensores:
+                    sensor.olvidar()
+            self._ultimo_t = t
+            anomala = False
+            for campo, sensor, valor in zip(campos, sensores, fila[1:]):
+                motivo = sensor.revisar(t, valor)
+                if motivo is not None:
+                    anomala = True
+                    marcas.append({"t": t, "zona": self.zona, "sensor": campo, "motivo": motivo,
+                                   "valor": round(valor, 2)})
+            if anomala:
+                rechazadas.append(i)
+        for campo, sensor, antes in zip(campos, sensores, trabados_antes):
+            if sensor.trabado and not antes:
+                print(f"⚠️ Sensor {campo} de {self.zona} trabado en {sensor.anterior:g} "
+                      f"desde hace {self._ultimo_t - sensor.desde:.0f} s")
+        if marcas:
+            self._registrar(marcas, len(rechazadas))
+        if self.modo != "cuarentena" or not rechazadas:
+            return None
+        return np.delete(muestras, rechazadas)
+
+    def _registrar(self, marcas, n):
+        with self._lock:
+            self.cuarentena.extend(marcas)
+            self.marcadas += n
+        for marca in marcas:
+            anomalias.inc(self.zona, marca["sensor"], marca["motivo"])
+        if self.ruta_registro is not None:
+            with open(self.ruta_registro, "a", encoding="utf-8") as registro:
+                registro.writelines(json.dumps(marca) + "\n" for marca in marcas)
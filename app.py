@@ -1,125 +1,336 @@
-import serial
-import serial.tools.list_ports
-import threading
+import time
+_INICIO_ARRANQUE = time.perf_counter()
+
 import dash
-from dash import html, dcc
+from dash import html, dcc, Patch
 from dash.dependencies import Output, Input, State
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+from flask import Response, request, stream_with_context
 import plotly.graph_objs as go
 import numpy as np
-import time
-import sys
-from datetime import datetime, timedelta
+import os
+import atexit
+import math
+from functools import lru_cache
 from dash import dash_table
-from collections import deque
-
-# Detectar puerto Arduino
-def detectar_puerto_arduino():
-    puertos = serial.tools.list_ports.comports()
-    for puerto in puertos:
-        if "Arduino" in puerto.description or "CH340" in puerto.description:
-            return puerto.device
-    return None
-
-puerto = detectar_puerto_arduino()
-if puerto is None:
-    print("❌ Arduino no encontrado. Conéctalo al USB.")
-    sys.exit()
-
-try:
-    arduino = serial.Serial(puerto, 9600, timeout=1)
-    print(f"✅ Conectado al Arduino en {puerto}")
-except serial.SerialException as e:
-    print(f"❌ No se pudo abrir el puerto {puerto}:\n{e}")
-    sys.exit()
-
-# Variables globales
-humedad_valor = 0
-nivel_riego_valor = 0
-temperatura_valor = 0
-humedad_ambiente_valor = 0
-is_connected = True
-target_humedad = 0
-target_agua = 0
-target_temperatura = 0
-target_humedad_ambiente = 0
-data_history = deque(maxlen=10)
-
-def check_and_reconnect():
-    global arduino, is_connected, puerto
-    while True:
-        if not is_connected:
-            new_puerto = detectar_puerto_arduino()
-            if new_puerto and new_puerto == puerto:
-                try:
-                    arduino.close()
-                    arduino = serial.Serial(puerto, 9600, timeout=1)
-                    print(f"✅ Reconectado al Arduino en {puerto}")
-                    is_connected = True
-                except serial.SerialException as e:
-                    print(f"❌ Error al reconectar: {e}")
-        time.sleep(2)
-
-def leer_serial():
-    global humedad_valor, nivel_riego_valor, temperatura_valor, humedad_ambiente_valor, is_connected, target_humedad, target_agua, target_temperatura, target_humedad_ambiente, data_history
-    time.sleep(2)
-    while True:
-        try:
-            if arduino.in_waiting > 0:
-                data = arduino.readline().decode('utf-8').strip()
-                if "Humedad Suelo" in data and "Temperatura" in data and "Humedad Ambiente" in data:
-                    try:
-                        humedad_str = data.split("|")[0].split(":")[1].strip().replace("%", "")
-                        temperatura_str = data.split("|")[1].split(":")[1].strip().replace("°C", "")
-                        humedad_ambiente_str = data.split("|")[2].split(":")[1].strip().replace("%", "")
-                        target_humedad = int(humedad_str)
-                        target_agua = target_humedad
-                        target_temperatura = float(temperatura_str)
-                        target_humedad_ambiente = float(humedad_ambiente_str)
-                        is_connected = True
-                        timestamp = datetime.now().strftime("%H:%M:%S")
-                        data_history.append([timestamp, target_humedad, target_agua, target_temperatura, target_humedad_ambiente])
-                    except (ValueError, IndexError) as e:
-                        print(f"Dato inválido: {data}, Error: {e}")
-            time.sleep(0.05)
-        except (serial.SerialException, ValueError) as e:
-            print(f"Error en lectura serial: {e}")
-            is_connected = False
-            target_humedad = 0
-            target_agua = 0
-            target_temperatura = 0
-            target_humedad_ambiente = 0
-            time.sleep(1)
-
-threading.Thread(target=leer_serial, daemon=True).start()
-threading.Thread(target=check_and_reconnect, daemon=True).start()
-
-def obtener_valores_ultima_hora(data_history):
-    ahora = datetime.now()
-    una_hora_atras = ahora - timedelta(hours=1)
-    valores_ultima_hora = []
-    for row in data_history:
-        timestamp_str = row[0]
-        try:
-            timestamp = datetime.strptime(timestamp_str, "%H:%M:%S")
-            timestamp = timestamp.replace(year=ahora.year, month=ahora.month, day=ahora.day)
-            if timestamp >= una_hora_atras:
-                valores_ultima_hora.append(row)
-        except ValueError:
-            continue
-    return valores_ultima_hora
-
-# Estilos para tema oscuro
-external_stylesheets = [
-    dbc.themes.DARKLY,
-    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css",
-]
-external_scripts = [
-    "https://code.jquery.com/jquery-3.6.0.min.js",
-    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"
+from difusion import Difusor
+from ingesta import DIRECTORIO_DATOS, FILAS_HISTORIAL, PREFIJO_MEMORIA, conectar_salidas, crear_alertas, crear_gestor
+from exportacion import Consulta, ErrorConsulta, exportar
+from paginacion import consultar, recientes, valores_mostrados
+from memoria_compartida import LectorCompartido
+from metricas import REGISTRO, TIPO_CONTENIDO, histograma, recolector
+from recursos import Recursos, cachear_layout, comprimir_respuestas
+from instantanea import combinar_instantaneas
+from agregados import lttb, media_movil, medias
+from almacenamiento import DTYPE_MUESTRA, instante_actual
+
+# Ingesta: "local" lee las placas en este mismo proceso (como siempre); "compartida"
+# las lee de la memoria compartida que llena `python ingesta.py`, para poder servir
+# con varios procesos web (gunicorn) sin pelear por el puerto serie.
+MODO_INGESTA = os.environ.get("PROY_INGESTA", "local")
+
+# Canal push: cada lectura se publica una vez y llega a los navegadores por SSE
+difusor = Difusor()
+INTERVALO_RESPALDO_MS = 10000  # refresco de respaldo por si se pierde algún evento
+
+# Tiempo máximo esperado desde que arranca el proceso hasta que el tablero puede servir
+PRESUPUESTO_ARRANQUE_S = 3.0
+
+# Cada placa publica su propia instantánea; aquí solo se avisa a los navegadores
+def al_publicar(dispositivo, snap):
+    difusor.publicar({"zona": dispositivo.id, "estado": dispositivo.estado, "v": snap.version, "t": snap.t, "conectado": snap.conectado,
+                      "humedad": snap.humedad, "temperatura": snap.temperatura,
+                      "humedad_ambiente": snap.humedad_ambiente})
+
+if MODO_INGESTA == "compartida":
+    gestor = LectorCompartido(al_publicar, prefijo=PREFIJO_MEMORIA, filas_historial=FILAS_HISTORIAL,
+                              directorio_datos=DIRECTORIO_DATOS)
+else:
+    gestor = crear_gestor(al_publicar)
+
+# Alertas evaluadas una vez por muestra al ingerir (ver alertas.py). En modo compartida
+# cada proceso web lleva su motor a partir del anillo y el registro lo escribe la ingesta
+alertas = crear_alertas(registrar=MODO_INGESTA != "compartida")
+gestor.agregar_consumidor(alertas.evaluar_lote)
+
+# Las lecturas salen a otros programas desde quien lee las placas (en modo compartida, la ingesta)
+if MODO_INGESTA != "compartida":
+    for salida in conectar_salidas(gestor, alertas):
+        atexit.register(salida.detener)
+
+# Arranque no bloqueante: el historial en disco se abre ya y las placas se conectan en
+# segundo plano cuando el USB las enumera (así un reinicio tras un corte de luz no espera)
+gestor.iniciar()
+if MODO_INGESTA == "compartida":
+    print(f"⏳ Leyendo las placas desde la memoria compartida '{PREFIJO_MEMORIA}' (python ingesta.py)")
+elif not any(dispositivo.conectado for dispositivo in gestor.dispositivos.values()):
+    print("⏳ Arduino no encontrado todavía. Se conectará en cuanto aparezca en el USB.")
+atexit.register(gestor.detener)
+
+# Zonas: una por placa, más la vista agregada de todas
+ZONA_TODAS = "todas"
+
+def dispositivos_zona(zona):
+    if zona in gestor.dispositivos:
+        return [gestor.dispositivos[zona]]
+    return list(gestor.dispositivos.values())
+
+def instantanea_zona(zona):
+    if zona in gestor.dispositivos:
+        return gestor.dispositivos[zona].instantaneas.actual
+    # list(): el gestor puede sumar placas desde otro hilo mientras se recorre
+    return instantanea_agregada(tuple(d.instantaneas.actual for d in list(gestor.dispositivos.values())))
+
+@lru_cache(maxsize=4)
+def instantanea_agregada(snaps):
+    return combinar_instantaneas(snaps, FILAS_HISTORIAL)
+
+def opciones_zonas():
+    return [{"label": "Todas las zonas", "value": ZONA_TODAS}] + \
+           [{"label": f"Zona {id}", "value": id} for id in sorted(list(gestor.dispositivos))]
+
+# Posición animada de las agujas de cada zona: [humedad, agua, temperatura, humedad ambiental]
+valores_agujas = {}
+
+def filas_tabla(zonas, muestras):
+    # Filas de la tabla del historial; cada columna se convierte entera de una vez
+    # y recién al final se arman las filas.
+    columnas = {
+        "zona": zonas,
+        "timestamp": [hora[:19] for hora in _horas(muestras["t"])],
+        "humedad": valores_mostrados(muestras, "humedad").tolist(),
+        "temperatura": valores_mostrados(muestras, "temperatura").tolist(),
+        "humedad_ambiente": valores_mostrados(muestras, "humedad_ambiente").tolist(),
+    }
+    return [dict(zip(columnas, fila)) for fila in zip(*columnas.values())]
+
+# Gráficos de tendencia: la figura se arma una sola vez y en cada tick solo se
+# le agregan los puntos nuevos con extendData (recortados a la ventana).
+VENTANA_GRAFICOS = FILAS_HISTORIAL
+GRAFICOS = {
+    'humidity-bar-graph': {"campo": "humedad", "tipo": "bar", "color": '#007bff',
+                           "titulo": "Tendencia de Humedad Suelo", "yaxis_title": "Humedad (%)", "yaxis_range": [0, 100]},
+    'temperature-line-graph': {"campo": "temperatura", "tipo": "line", "color": '#ff4d4d',
+                               "titulo": "Tendencia de Temperatura", "yaxis_title": "Temperatura (°C)", "yaxis_range": [0, 50]},
+    'humedad-ambiente-bar-graph': {"campo": "humedad_ambiente", "tipo": "bar", "color": '#1cc88a',
+                                   "titulo": "Humedad Ambiental", "yaxis_title": "Humedad Ambiental (%)", "yaxis_range": [0, 100]},
+}
+
+# Rangos largos: cada gráfico se arma con a lo sumo MAX_PUNTOS_GRAFICO puntos.
+# Si el rango está en la ventana caliente se reducen las muestras crudas con LTTB;
+# si no, se usan las medias de los agregados (1 min / 10 min / 1 h) y luego LTTB.
+RANGO_VIVO = "vivo"
+RANGOS_GRAFICOS = [
+    {"label": "En vivo", "value": RANGO_VIVO},
+    {"label": "Última hora", "value": 3600},
+    {"label": "Últimas 6 horas", "value": 6 * 3600},
+    {"label": "Últimas 24 horas", "value": 24 * 3600},
+    {"label": "Últimos 7 días", "value": 7 * 24 * 3600},
 ]
+MAX_PUNTOS_GRAFICO = 300
+VENTANAS_MEDIA_MOVIL = 20  # la media móvil promedia 1/20 del rango (3 min en la última hora)
+
+def muestras_rango(dispositivo, desde, hasta):
+    # Si el buffer no se llenó nunca, tiene todo el historial y sirven las crudas
+    memoria = dispositivo.almacen.memoria
+    if len(memoria) < memoria.capacidad or desde >= memoria.primer_instante():
+        return memoria.rango(desde, hasta, copiar=False)
+    return medias(dispositivo.agregados.rango(desde, hasta, 4 * MAX_PUNTOS_GRAFICO))
+
+def _horas(t):
+    # Instantes con milisegundos (a más de 1 Hz no se pisan en el eje), en hora local.
+    # Vectorizado: epoch -> datetime64[ms] desplazado al huso local -> texto.
+    t = np.asarray(t, dtype=np.float64)
+    if not len(t):
+        return []
+    desfase_inicio = time.localtime(t[0]).tm_gmtoff
+    if desfase_inicio == time.localtime(t[-1]).tm_gmtoff:
+        local = t + desfase_inicio
+    else:
+        # El rango cruza un cambio de horario: desfase por muestra
+        local = t + np.array([time.localtime(x).tm_gmtoff for x in t])
+    ms = np.floor(local * 1000).astype("datetime64[ms]")
+    return [hora.replace("T", " ") for hora in np.datetime_as_string(ms, unit="ms").tolist()]
+
+def _valores(muestras, campo):
+    return np.round(muestras[campo].astype(float), 2).tolist()
+
+def _colores_barras(valores, color):
+    valores = np.asarray(valores)
+    return np.where((valores < 30) | (valores > 80), '#ff4d4d', color).tolist()
+
+def figura_tendencia(grafico, muestras, formato_eje="%H:%M:%S", media=None):
+    x = _horas(muestras["t"])
+    y = _valores(muestras, grafico["campo"])
+    fig = go.Figure()
+    if grafico["tipo"] == "bar":
+        fig.add_trace(go.Bar(x=x, y=y, marker_color=_colores_barras(y, grafico["color"])))
+    else:
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=y,
+            mode='lines+markers',
+            name='Temperatura (°C)',
+            line=dict(color=grafico["color"], width=2, shape='spline'),
+            marker=dict(size=8, color=grafico["color"])
+        ))
+    if media is not None:
+        fig.add_trace(go.Scatter(x=x, y=np.round(media, 2).tolist(), mode='lines', name='Media móvil',
+                                 line=dict(color='#f6c23e', width=2, dash='dash')))
+    fig.update_layout(
+        title=grafico["titulo"],
+        xaxis_title="Hora",
+        yaxis_title=grafico["yaxis_title"],
+        yaxis_range=grafico["yaxis_range"],
+        height=300,
+        margin=dict(t=40, b=40, l=40, r=40),
+        paper_bgcolor='#1e2b33',
+        plot_bgcolor='#1e2b33',
+        font={'color': '#e0e0e0'},
+        xaxis=dict(gridcolor='#4b5e6b', tickformat=formato_eje),
+        yaxis=dict(gridcolor='#4b5e6b')
+    )
+    return fig
+
+def figura_desconectada(texto="Desconectado"):
+    fig = go.Figure()
+    fig.add_annotation(
+        text=texto,
+        xref="paper", yref="paper",
+        x=0.5, y=0.5,
+        showarrow=False,
+        font=dict(size=20, color='#888'),
+        opacity=0.7
+    )
+    fig.update_layout(
+        height=300,
+        margin=dict(t=40, b=40, l=40, r=40),
+        paper_bgcolor='#1e2b33',
+        plot_bgcolor='#1e2b33',
+        font={'color': '#e0e0e0'}
+    )
+    return fig
+
+def extension_tendencia(grafico, muestras):
+    y = _valores(muestras, grafico["campo"])
+    nuevos = {"x": [_horas(muestras["t"])], "y": [y]}
+    if grafico["tipo"] == "bar":
+        nuevos["marker.color"] = [_colores_barras(y, grafico["color"])]
+    return nuevos, [0], VENTANA_GRAFICOS
+
+# Gauges: la figura se arma una sola vez por gauge y queda montada en el navegador;
+# en cada tick solo viaja un parche con el valor y los colores.
+GAUGES = {
+    'humedad-gauge': {"campo": "humedad", "colors": {'bar': '#4e73df', 'background': '#4b5e6b'},
+                      "title": "Humedad Suelo", "suffix": "%", "max_value": 100},
+    'agua-gauge': {"campo": "agua", "colors": {'bar': '#36b9cc', 'background': '#4b5e6b'},
+                   "title": "Agua", "suffix": "%", "max_value": 100},
+    'temperatura-gauge': {"campo": "temperatura", "colors": {'bar': '#e74a3b', 'background': '#4b5e6b'},
+                          "title": "Temperatura", "suffix": "°C", "max_value": 50},
+    'humedad-ambiente-gauge': {"campo": "humedad_ambiente", "colors": {'bar': '#1cc88a', 'background': '#4b5e6b'},
+                               "title": "Humedad Ambiental", "suffix": "%", "max_value": 100},
+}
+COLORES_INACTIVO = {'bar': '#cccccc', 'background': '#4b5e6b'}
+
+def mover_aguja(current_value, target_value, is_active=True):
+    # La aguja avanza como mucho 15 unidades por lectura hacia el valor real
+    if not is_active:
+        return 0
+    if abs(current_value - target_value) > 0:
+        current_value += np.sign(target_value - current_value) * min(15, abs(target_value - current_value))
+    return current_value
+
+def semicircular_gauge(value, colors, title, suffix="%", max_value=100):
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=value,
+        gauge={
+            'axis': {'range': [0, max_value], 'tickwidth': 1, 'tickcolor': '#e0e0e0'},
+            'bar': {'color': colors['bar']},
+            'bgcolor': colors['background'],
+            'borderwidth': 2,
+            'bordercolor': '#4b5e6b',
+            'steps': [{'range': [0, max_value], 'color': colors['background']}],
+            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': max_value}
+        },
+        number={'suffix': suffix, 'font': {'size': 40, 'color': colors['bar']}},
+        domain={'x': [0, 1], 'y': [0, 1]}
+    ))
+
+    fig.update_layout(
+        margin=dict(t=20, b=0, l=0, r=0),
+        height=150,
+        paper_bgcolor='#1e2b33',
+        plot_bgcolor='#1e2b33',
+        font={'color': '#e0e0e0'},
+        annotations=[dict(text=title, x=0.5, y=1.1, showarrow=False,
+                          font=dict(size=12, color='#e0e0e0'), xanchor='center')]
+    )
+    return fig
+
+def grafico_gauge(id_gauge):
+    gauge = GAUGES[id_gauge]
+    figura = semicircular_gauge(0, COLORES_INACTIVO, gauge["title"], gauge["suffix"], gauge["max_value"])
+    return dcc.Graph(id=f"{id_gauge}-grafico", figure=figura)
+
+def parche_gauge(value, colors, max_value=100):
+    parche = Patch()
+    indicador = parche['data'][0]
+    indicador['value'] = float(np.clip(value, 0, max_value))
+    indicador['gauge']['bar']['color'] = colors['bar']
+    indicador['gauge']['bgcolor'] = colors['background']
+    indicador['gauge']['steps'][0]['color'] = colors['background']
+    indicador['number']['font']['color'] = colors['bar']
+    return parche
+
+# Estilos para tema oscuro: Bootstrap (Darkly), Font Awesome y jQuery, desde los CDN o
+# empaquetados desde vendor/ para funcionar sin internet (ver recursos.py)
+recursos = Recursos()
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets, external_scripts=external_scripts)
+app = dash.Dash(__name__, external_stylesheets=recursos.estilos, external_scripts=recursos.scripts)
+server = app.server  # para gunicorn: app:server
+recursos.registrar(server)
+comprimir_respuestas(server)
+
+# Métricas en formato Prometheus (ver metricas.py)
+@app.server.route('/metrics')
+def metrics():
+    return Response(REGISTRO.exponer(), content_type=TIPO_CONTENIDO)
+
+# Flujo SSE que consume assets/eventos.js y vuelca en el dcc.Store 'eventos-sse'
+@app.server.route('/eventos')
+def eventos():
+    return Response(difusor.flujo_sse(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Exportación del historial en streaming (CSV, NDJSON, Arrow, Parquet); ver exportacion.py
+@app.server.route('/api/historial')
+def api_historial():
+    try:
+        consulta = Consulta(request.args, DIRECTORIO_DATOS,
+                            acepta_gzip='gzip' in request.headers.get('Accept-Encoding', ''))
+    except ErrorConsulta as e:
+        return {"error": str(e)}, 400
+    cuerpo, encabezados, mimetype = exportar(consulta, request.path)
+    return Response(stream_with_context(cuerpo), mimetype=mimetype, headers=encabezados)
+
+# Últimos cambios de nivel de las alertas: ?n=cantidad (por defecto todo el historial en memoria)
+@app.server.route('/api/alertas')
+def api_alertas():
+    try:
+        n = int(request.args['n']) if 'n' in request.args else None
+    except ValueError:
+        return {"error": "'n' tiene que ser un entero"}, 400
+    return {"alertas": alertas.ultimas(n)}
+
+duracion_callbacks = histograma("callback_segundos", "Duración de cada callback del tablero", ("callback",))
+recolector("clientes_sse", "Navegadores conectados al flujo de eventos", lambda: difusor.clientes)
+recolector("buffer_muestras", "Muestras en la ventana caliente de cada zona",
+           lambda: {(id,): len(d.almacen.memoria) for id, d in list(gestor.dispositivos.items())}, ("zona",))
+
+# Los callbacks se disparan con cada evento push (o al cambiar de zona); el intervalo queda solo de respaldo
+DISPARADORES = [Input('eventos-sse', 'data'), Input('interval-component', 'n_intervals'), Input('selector-zona', 'value')]
 
 app.layout = html.Div(id="main-container", className="hold-transition sidebar-mini layout-fixed", style={'backgroundColor': '#1e2b33'}, children=[
     html.Div(className="wrapper", children=[
@@ -127,7 +338,13 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
             html.Div(className="content-header", children=[
                 html.Div(className="container-fluid", children=[
                     html.Div(className="d-flex justify-content-between align-items-center", children=[
-                        html.H1("AgroDuino 🌱", className="m-0 text-center")
+                        html.H1("AgroDuino 🌱", className="m-0 text-center"),
+                        html.Div(className="d-flex", children=[
+                            dcc.Dropdown(id='selector-rango', options=RANGOS_GRAFICOS, value=RANGO_VIVO, clearable=False,
+                                         style={'minWidth': '180px', 'color': '#1e2b33'}, className="mr-2"),
+                            dcc.Dropdown(id='selector-zona', options=opciones_zonas(), value=ZONA_TODAS, clearable=False,
+                                         style={'minWidth': '220px', 'color': '#1e2b33'})
+                        ])
                     ]),
                     html.Div(className="mt-2", children=[
                         dbc.Alert(id="connection-alert", is_open=False, duration=5000, color="warning", dismissable=True, className="notification-alert mb-2"),
@@ -147,7 +364,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                         html.Div(className="col mr-2", children=[
                                             html.Div("Humedad del Suelo (%)", className="text-xs font-weight-bold text-info text-uppercase mb-1 text-center"),
                                             html.Div(html.I(className="fas fa-tint fa-2x", style={'color': '#4e73df'}), className="text-center mb-2"),
-                                            html.Div(id="humedad-gauge")
+                                            html.Div(id="humedad-gauge", children=grafico_gauge('humedad-gauge'))
                                         ])
                                     ])
                                 ])
@@ -160,7 +377,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                         html.Div(className="col mr-2", children=[
                                             html.Div("Porcentaje de Agua (%)", className="text-xs font-weight-bold text-info text-uppercase mb-1 text-center"),
                                             html.Div(html.I(className="fas fa-water fa-2x", style={'color': '#36b9cc'}), className="text-center mb-2"),
-                                            html.Div(id="agua-gauge")
+                                            html.Div(id="agua-gauge", children=grafico_gauge('agua-gauge'))
                                         ])
                                     ])
                                 ])
@@ -173,7 +390,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                         html.Div(className="col mr-2", children=[
                                             html.Div("Temperatura (°C)", className="text-xs font-weight-bold text-danger text-uppercase mb-1 text-center"),
                                             html.Div(html.I(className="fas fa-thermometer-half fa-2x", style={'color': '#e74a3b'}), className="text-center mb-2"),
-                                            html.Div(id="temperatura-gauge")
+                                            html.Div(id="temperatura-gauge", children=grafico_gauge('temperatura-gauge'))
                                         ])
                                     ])
                                 ])
@@ -186,7 +403,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                         html.Div(className="col mr-2", children=[
                                             html.Div("Humedad Ambiental (%)", className="text-xs font-weight-bold text-success text-uppercase mb-1 text-center"),
                                             html.Div(html.I(className="fas fa-cloud fa-2x", style={'color': '#1cc88a'}), className="text-center mb-2"),
-                                            html.Div(id="humedad-ambiente-gauge")
+                                            html.Div(id="humedad-ambiente-gauge", children=grafico_gauge('humedad-ambiente-gauge'))
                                         ])
                                     ])
                                 ])
@@ -241,11 +458,18 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                     dash_table.DataTable(
                                         id='data-table',
                                         columns=[
-                                            {"name": "Hora", "id": "timestamp"},
-                                            {"name": "Humedad Suelo (%)", "id": "humedad"},
-                                            {"name": "Temperatura (°C)", "id": "temperatura"},
-                                            {"name": "Humedad Ambiental (%)", "id": "humedad_ambiente"}
+                                            {"name": "Zona", "id": "zona"},
+                                            {"name": "Hora", "id": "timestamp", "type": "datetime"},
+                                            {"name": "Humedad Suelo (%)", "id": "humedad", "type": "numeric"},
+                                            {"name": "Temperatura (°C)", "id": "temperatura", "type": "numeric"},
+                                            {"name": "Humedad Ambiental (%)", "id": "humedad_ambiente", "type": "numeric"}
                                         ],
+                                        # Paginado, orden y filtro en el servidor: solo viaja la página visible
+                                        page_action='custom', page_current=0, page_size=FILAS_HISTORIAL, page_count=1,
+                                        sort_action='custom', sort_mode='single', sort_by=[],
+                                        filter_action='custom', filter_query='',
+                                        style_data={'backgroundColor': '#2c3b41', 'color': '#e0e0e0', 'border': '1px solid #4b5e6b'},
+                                        style_filter={'backgroundColor': '#1e2b33', 'color': '#e0e0e0'},
                                         style_table={'overflowX': 'auto', 'backgroundColor': '#1e2b33'},
                                         style_cell={'textAlign': 'center', 'padding': '8px', 'border': '1px solid #4b5e6b', 'backgroundColor': '#2c3b41', 'color': '#e0e0e0'},
                                         style_header={'backgroundColor': '#007bff', 'color': 'white', 'fontWeight': 'bold', 'border': 'none'},
@@ -269,7 +493,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                     ], className="card-title d-flex align-items-center justify-content-center", style={'color': '#4e73df'})
                                 ]),
                                 html.Div(className="card-body", children=[
-                                    dcc.Graph(id='humidity-bar-graph')
+                                    dcc.Graph(id='humidity-bar-graph', figure=figura_desconectada())
                                 ])
                             ])
                         ]),
@@ -282,7 +506,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                     ], className="card-title d-flex align-items-center justify-content-center", style={'color': '#e74a3b'})
                                 ]),
                                 html.Div(className="card-body", children=[
-                                    dcc.Graph(id='temperature-line-graph')
+                                    dcc.Graph(id='temperature-line-graph', figure=figura_desconectada())
                                 ])
                             ])
                         ]),
@@ -295,7 +519,7 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
                                     ], className="card-title d-flex align-items-center justify-content-center", style={'color': '#1cc88a'})
                                 ]),
                                 html.Div(className="card-body", children=[
-                                    dcc.Graph(id='humedad-ambiente-bar-graph')
+                                    dcc.Graph(id='humedad-ambiente-bar-graph', figure=figura_desconectada())
                                 ])
                             ])
                         ])
@@ -305,69 +529,54 @@ app.layout = html.Div(id="main-container", className="hold-transition sidebar-mi
         ]),
         html.Footer("© 2025 AgroDuino.", className="main-footer")
     ]),
-    dcc.Interval(id='interval-component', interval=1500, n_intervals=0)
+    dcc.Store(id='graficos-estado'),
+    dcc.Store(id='tabla-estado'),
+    dcc.Store(id='alertas-estado'),
+    dcc.Store(id='eventos-sse'),
+    dcc.Interval(id='interval-component', interval=INTERVALO_RESPALDO_MS, n_intervals=0)
 ])
+# El layout no cambia: se serializa una vez y los navegadores lo revalidan con ETag
+cachear_layout(app)
 
-def semicircular_gauge(current_value, target_value, colors, title, suffix="%", is_active=True, max_value=100):
-    if not is_active:
-        current_value = 0
-        colors = {'bar': '#cccccc', 'background': '#4b5e6b'}
-    elif abs(current_value - target_value) > 0:
-        current_value += np.sign(target_value - current_value) * min(15, abs(target_value - current_value))
-    val = np.clip(current_value, 0, max_value)
-
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=val,
-        gauge={
-            'axis': {'range': [0, max_value], 'tickwidth': 1, 'tickcolor': '#e0e0e0'},
-            'bar': {'color': colors['bar']},
-            'bgcolor': colors['background'],
-            'borderwidth': 2,
-            'bordercolor': '#4b5e6b',
-            'steps': [{'range': [0, max_value], 'color': colors['background']}],
-            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': max_value}
-        },
-        number={'suffix': suffix, 'font': {'size': 40, 'color': colors['bar']}},
-        domain={'x': [0, 1], 'y': [0, 1]}
-    ))
-
-    fig.update_layout(
-        margin=dict(t=20, b=0, l=0, r=0),
-        height=150,
-        paper_bgcolor='#1e2b33',
-        plot_bgcolor='#1e2b33',
-        font={'color': '#e0e0e0'},
-        annotations=[dict(text=title, x=0.5, y=1.1, showarrow=False,
-                          font=dict(size=12, color='#e0e0e0'), xanchor='center')]
-    )
-    return fig, current_value
+# Callback para las zonas: las placas que se enchufan en caliente aparecen en el selector
+@app.callback(
+    Output('selector-zona', 'options'),
+    [Input('eventos-sse', 'data'), Input('interval-component', 'n_intervals')],
+    [State('selector-zona', 'options')]
+)
+@duracion_callbacks.cronometrar("update_zonas")
+def update_zonas(evento, n, opciones_actuales):
+    opciones = opciones_zonas()
+    if opciones == opciones_actuales:
+        raise PreventUpdate
+    return opciones
 
 # Callback para gauges
 @app.callback(
-    [Output('humedad-gauge', 'children'),
-     Output('agua-gauge', 'children'),
-     Output('temperatura-gauge', 'children'),
-     Output('humedad-ambiente-gauge', 'children')],
-    [Input('interval-component', 'n_intervals')]
+    [Output(f'{id_gauge}-grafico', 'figure') for id_gauge in GAUGES],
+    DISPARADORES
 )
-def update_gauges(n):
-    global humedad_valor, nivel_riego_valor, temperatura_valor, humedad_ambiente_valor, is_connected, target_humedad, target_agua, target_temperatura, target_humedad_ambiente
-    fig_hum, humedad_valor = semicircular_gauge(humedad_valor, target_humedad,
-                                              colors={'bar': '#4e73df', 'background': '#4b5e6b'},
-                                              title="Humedad Suelo", is_active=is_connected)
-    fig_agua, nivel_riego_valor = semicircular_gauge(nivel_riego_valor, target_agua,
-                                                   colors={'bar': '#36b9cc', 'background': '#4b5e6b'},
-                                                   title="Agua", is_active=is_connected)
-    fig_temp, temperatura_valor = semicircular_gauge(temperatura_valor, target_temperatura,
-                                                   colors={'bar': '#e74a3b', 'background': '#4b5e6b'},
-                                                   title="Temperatura", suffix="°C", is_active=is_connected, max_value=50)
-    fig_hum_amb, humedad_ambiente_valor = semicircular_gauge(humedad_ambiente_valor, target_humedad_ambiente,
-                                                            colors={'bar': '#1cc88a', 'background': '#4b5e6b'},
-                                                            title="Humedad Ambiental", is_active=is_connected)
-    return dcc.Graph(figure=fig_hum), dcc.Graph(figure=fig_agua), dcc.Graph(figure=fig_temp), dcc.Graph(figure=fig_hum_amb)
-
-# Callback para notificaciones
+@duracion_callbacks.cronometrar("update_gauges")
+def update_gauges(evento, n, zona):
+    return gauges_instantanea(instantanea_zona(zona), zona)
+
+# Una vez por instantánea: todos los clientes comparten el resultado y la animación
+# de las agujas avanza una vez por lectura, no una vez por cliente.
+@lru_cache(maxsize=16)
+def gauges_instantanea(snap, zona):
+    agujas = valores_agujas.get(zona, (0,) * len(GAUGES))
+    nuevas = []
+    parches = []
+    for aguja, gauge in zip(agujas, GAUGES.values()):
+        aguja = mover_aguja(aguja, getattr(snap, gauge["campo"]), snap.conectado)
+        colores = gauge["colors"] if snap.conectado else COLORES_INACTIVO
+        nuevas.append(aguja)
+        parches.append(parche_gauge(aguja, colores, gauge["max_value"]))
+    valores_agujas[zona] = tuple(nuevas)
+    return parches
+
+# Callback para notificaciones: los niveles vienen del motor de alertas (con histéresis y
+# antirrebote); solo se envían las alertas que cambiaron desde lo último enviado
 @app.callback(
     [Output('connection-alert', 'children'),
      Output('connection-alert', 'is_open'),
@@ -380,208 +589,264 @@ def update_gauges(n):
      Output('temperatura-alert', 'color'),
      Output('humedad-ambiente-alert', 'children'),
      Output('humedad-ambiente-alert', 'is_open'),
-     Output('humedad-ambiente-alert', 'color')],
-    Input('interval-component', 'n_intervals')
+     Output('humedad-ambiente-alert', 'color'),
+     Output('alertas-estado', 'data')],
+    DISPARADORES,
+    [State('alertas-estado', 'data')]
 )
-def update_notifications(n):
-    global is_connected, target_humedad, target_temperatura, target_humedad_ambiente
-    if not is_connected:
-        return (
-            html.Div("⚠ Arduino no está conectado. Conéctalo para ver datos.", className="mb-0"), True, "warning",
-            html.Div(""), False, "success",  # Ocultar alerta de humedad
-            html.Div(""), False, "success",  # Ocultar alerta de temperatura
-            html.Div(""), False, "success"   # Ocultar alerta de humedad ambiental
-        )
-    
-    # Notificación para humedad del suelo
-    humedad_message = ""
-    humedad_color = "success"
-    if target_humedad < 30:
-        humedad_message = "⚠ Suelo muy seco, ¡necesita riego!"
-        humedad_color = "danger"
-    elif target_humedad > 80:
-        humedad_message = "✅ Suelo muy húmedo, no riegue."
-        humedad_color = "info"
+@duracion_callbacks.cronometrar("update_notifications")
+def update_notifications(evento, n, zona, enviado):
+    estado = estado_alertas(zona)
+    if estado == enviado:
+        raise PreventUpdate
+    salidas = []
+    for k, (valor, construir) in enumerate(zip(estado, CONSTRUCTORES_ALERTAS)):
+        if enviado is not None and enviado[k] == valor:
+            salidas += [dash.no_update] * 3
+        else:
+            salidas += construir(valor)
+    return salidas + [estado]
+
+# Mensaje y color de cada alerta según el nivel de su regla
+MENSAJES_HUMEDAD = {
+    "bajo": ("⚠ Suelo muy seco, ¡necesita riego!", "danger"),
+    "alto": ("✅ Suelo muy húmedo, no riegue.", "info"),
+    "optimo": ("🌱 Suelo en buen estado.", "success"),
+}
+MENSAJES_TEMPERATURA = {
+    "bajo": ("⚠ Temperatura demasiado baja, riesgo para las plantas.", "danger"),
+    "alto": ("⚠ Temperatura demasiado alta, riesgo para las plantas.", "danger"),
+    "optimo": ("✅ Temperatura óptima.", "success"),
+}
+MENSAJES_HUMEDAD_AMBIENTE = {
+    "bajo": ("⚠ Humedad ambiental baja, considere humidificar.", "danger"),
+    "alto": ("⚠ Humedad ambiental alta, riesgo de moho.", "warning"),
+    "optimo": ("✅ Humedad ambiental óptima.", "success"),
+}
+# Regla del motor de alertas que alimenta cada alerta del tablero
+REGLAS_TABLERO = {"humedad": MENSAJES_HUMEDAD, "temperatura": MENSAJES_TEMPERATURA,
+                  "humedad_ambiente": MENSAJES_HUMEDAD_AMBIENTE}
+
+def estado_alertas(zona):
+    """[conectado, [nivel, zonas en ese nivel] por regla del tablero], en forma JSON para el Store."""
+    if not instantanea_zona(zona).conectado:
+        return [False] + [None] * len(REGLAS_TABLERO)
+    conectadas = [d for d in dispositivos_zona(zona) if d.conectado]
+    estado = [True]
+    for regla in REGLAS_TABLERO:
+        # Sin muestras evaluadas todavía se usa el nivel de la instantánea
+        niveles = [(d.id, alertas.nivel(d.id, regla) or getattr(d.instantaneas.actual, f"nivel_{regla}"))
+                   for d in conectadas]
+        # Vista de todas: manda la primera zona fuera de rango y se nombran las que comparten su nivel
+        nivel = next((nivel for _, nivel in niveles if nivel != "optimo"), "optimo")
+        zonas = [id for id, n in niveles if n == nivel] if zona not in gestor.dispositivos and nivel != "optimo" else []
+        estado.append([nivel, zonas])
+    return estado
+
+def alerta_conexion(conectado):
+    if conectado:
+        return [html.Div(""), False, "warning"]  # Ocultar alerta de conexión
+    return [html.Div("⚠ Arduino no está conectado. Conéctalo para ver datos.", className="mb-0"), True, "warning"]
+
+def constructor_alerta(mensajes):
+    def construir(valor):
+        if valor is None:
+            return [html.Div(""), False, "success"]  # Sin conexión se oculta
+        nivel, zonas = valor
+        mensaje, color = mensajes[nivel]
+        if zonas:
+            mensaje = f"{mensaje} ({', '.join(zonas)})"
+        return [html.Div(mensaje, className="mb-0"), True, color]
+    return construir
+
+CONSTRUCTORES_ALERTAS = [alerta_conexion] + [constructor_alerta(mensajes) for mensajes in REGLAS_TABLERO.values()]
+
+# Callback para gráficos: figura completa solo al cargar o al cambiar la conexión,
+# después únicamente los puntos nuevos. Si no llegó nada, no se envía nada.
+@app.callback(
+    [Output(id_grafico, 'figure') for id_grafico in GRAFICOS] +
+    [Output(id_grafico, 'extendData') for id_grafico in GRAFICOS] +
+    [Output('graficos-estado', 'data')],
+    DISPARADORES + [Input('selector-rango', 'value')],
+    [State('graficos-estado', 'data')]
+)
+@duracion_callbacks.cronometrar("update_graphs")
+def update_graphs(evento, n, zona, rango, estado):
+    if rango != RANGO_VIVO:
+        # Rango largo: se redibuja solo cuando avanza un punto de su resolución
+        paso = max(rango / MAX_PUNTOS_GRAFICO, 1.0)
+        corte = math.floor(instante_actual() / paso) * paso
+        nuevo_estado = {"zona": zona, "rango": rango, "corte": corte}
+        if estado == nuevo_estado:
+            raise PreventUpdate
+        return figuras_rango(zona, rango, corte) + [nuevo_estado]
+
+    snap = instantanea_zona(zona)
+    conectado = snap.conectado
+    recientes = snap.historial
+    ultimo_t = float(recientes["t"][-1]) if len(recientes) else None
+    nuevo_estado = {"zona": zona, "rango": RANGO_VIVO, "conectado": conectado, "ultimo_t": ultimo_t}
+
+    if (estado is None or estado.get("zona") != zona or estado.get("rango") != RANGO_VIVO
+            or estado["conectado"] != conectado
+            or (conectado and estado["ultimo_t"] is None and ultimo_t is not None)):
+        return figuras_completas(snap) + [nuevo_estado]
+
+    if not conectado or ultimo_t is None or ultimo_t <= estado["ultimo_t"]:
+        raise PreventUpdate
+
+    return extensiones_desde(snap, estado["ultimo_t"]) + [nuevo_estado]
+
+# Los clientes al día piden la misma extensión (misma instantánea, mismo último instante)
+@lru_cache(maxsize=4)
+def figuras_completas(snap):
+    if snap.conectado and len(snap.historial):
+        figuras = [figura_tendencia(grafico, snap.historial) for grafico in GRAFICOS.values()]
     else:
-        humedad_message = "🌱 Suelo en buen estado."
-
-    # Notificación para temperatura
-    temperatura_message = ""
-    temperatura_color = "success"
-    if target_temperatura < 20:
-        temperatura_message = "⚠ Temperatura demasiado baja, riesgo para las plantas."
-        temperatura_color = "danger"
-    elif target_temperatura > 30:
-        temperatura_message = "⚠ Temperatura demasiado alta, riesgo para las plantas."
-        temperatura_color = "danger"
+        figuras = [figura_desconectada() for _ in GRAFICOS]
+    return figuras + [dash.no_update] * len(GRAFICOS)
+
+# Mismo corte, mismas figuras para todos los clientes
+@lru_cache(maxsize=8)
+def figuras_rango(zona, rango, corte):
+    paso = max(rango / MAX_PUNTOS_GRAFICO, 1.0)
+    partes = [muestras_rango(dispositivo, corte - rango, corte + paso) for dispositivo in dispositivos_zona(zona)]
+    muestras = np.concatenate(partes) if partes else np.empty(0, dtype=DTYPE_MUESTRA)
+    if len(partes) > 1:
+        muestras = muestras[np.argsort(muestras["t"], kind="stable")]
+    if not len(muestras):
+        figuras = [figura_desconectada("Sin datos en el rango") for _ in GRAFICOS]
     else:
-        temperatura_message = "✅ Temperatura óptima."
-
-    # Notificación para humedad ambiental
-    humedad_ambiente_message = ""
-    humedad_ambiente_color = "success"
-    if target_humedad_ambiente < 40:
-        humedad_ambiente_message = "⚠ Humedad ambiental baja, considere humidificar."
-        humedad_ambiente_color = "danger"
-    elif target_humedad_ambiente > 60:
-        humedad_ambiente_message = "⚠ Humedad ambiental alta, riesgo de moho."
-        humedad_ambiente_color = "warning"
+        formato_eje = "%d/%m %H:%M" if rango > 6 * 3600 else "%H:%M"
+        figuras = []
+        for grafico in GRAFICOS.values():
+            campo = grafico["campo"]
+            # La media móvil se calcula sobre la serie completa y se muestrea en los puntos que deja LTTB
+            indices = lttb(muestras["t"], muestras[campo], MAX_PUNTOS_GRAFICO)
+            media = media_movil(muestras["t"], muestras[campo], rango / VENTANAS_MEDIA_MOVIL)[indices]
+            figuras.append(figura_tendencia(grafico, muestras[indices], formato_eje, media))
+    return figuras + [dash.no_update] * len(GRAFICOS)
+
+@lru_cache(maxsize=16)
+def extensiones_desde(snap, desde_t):
+    nuevos = snap.historial[snap.historial["t"] > desde_t]
+    return [dash.no_update] * len(GRAFICOS) + [extension_tendencia(grafico, nuevos) for grafico in GRAFICOS.values()]
+
+# Tabla del historial: cada página se arma en el servidor (ver paginacion.py) y solo
+# viaja cuando cambia. La primera página por hora (la vista "en vivo") sigue a los
+# eventos; al hojear, ordenar o filtrar la vista queda fija en un corte de tiempo
+# para que las filas no se corran entre páginas mientras llegan lecturas.
+ORDEN_POR_DEFECTO = (("timestamp", "desc"),)
+ESTILO_FILA_ACTIVA = [{'if': {'state': 'active'}, 'backgroundColor': '#495057', 'color': '#e0e0e0'}]
+
+def _clave_orden(sort_by):
+    return tuple((orden["column_id"], orden["direction"]) for orden in sort_by or []) or ORDEN_POR_DEFECTO
+
+def _pagina_tabla(zonas, muestras, total, tamano):
+    firma = [total, len(muestras)] + ([float(muestras["t"][0]), float(muestras["t"][-1])] if len(muestras) else [])
+    return filas_tabla(zonas, muestras), max(1, math.ceil(total / tamano)), firma
+
+@lru_cache(maxsize=16)
+def pagina_en_vivo(zona, tamano, snap):
+    # snap solo entra en la clave: cambia con cada publicación de la zona
+    encontrada = recientes(dispositivos_zona(zona), DIRECTORIO_DATOS, tamano)
+    if encontrada is None:
+        encontrada = consultar(dispositivos_zona(zona), DIRECTORIO_DATOS, "", [], 0, tamano, np.inf)
+    zonas, muestras, total = encontrada
+    # La página siguiente parte justo después de la fila más nueva que se mostró
+    corte = float(np.nextafter(muestras["t"].max(), np.inf)) if len(muestras) else None
+    return _pagina_tabla(zonas, muestras, total, tamano) + (corte,)
+
+@lru_cache(maxsize=16)
+def pagina_consultada(zona, pagina, tamano, orden, filtro, corte):
+    sort_by = [{"column_id": columna, "direction": direccion} for columna, direccion in orden]
+    zonas, muestras, total = consultar(dispositivos_zona(zona), DIRECTORIO_DATOS, filtro, sort_by,
+                                       pagina * tamano, (pagina + 1) * tamano, corte)
+    return _pagina_tabla(zonas, muestras, total, tamano)
+
+def corte_tabla(zona):
+    ultimos = [float(d.almacen.ultimos(1)["t"][0]) for d in dispositivos_zona(zona) if len(d.almacen.memoria)]
+    return float(np.nextafter(max(ultimos), np.inf)) if ultimos else instante_actual()
+
+@app.callback(
+    [Output('data-table', 'data'),
+     Output('data-table', 'page_count'),
+     Output('data-table', 'style_data_conditional'),
+     Output('tabla-estado', 'data')],
+    DISPARADORES + [Input('data-table', 'page_current'), Input('data-table', 'page_size'),
+                    Input('data-table', 'sort_by'), Input('data-table', 'filter_query')],
+    State('tabla-estado', 'data')
+)
+@duracion_callbacks.cronometrar("update_table")
+def update_table(evento, n, zona, pagina, tamano, sort_by, filtro, estado):
+    estado = estado or {}
+    conectado = instantanea_zona(zona).conectado
+    orden = _clave_orden(sort_by)
+    filtro = filtro or ""
+    pagina = pagina or 0
+    tamano = tamano or FILAS_HISTORIAL
+    vivo = pagina == 0 and orden == ORDEN_POR_DEFECTO and not filtro
+    clave = [zona, tamano, [list(o) for o in orden], filtro]
+    por_evento = dash.callback_context.triggered_id in ('eventos-sse', 'interval-component')
+    if por_evento and not vivo and estado.get("conectado") == conectado:
+        raise PreventUpdate
+
+    corte = estado.get("corte")
+    if vivo:
+        filas, paginas, firma, corte = pagina_en_vivo(zona, tamano, instantanea_zona(zona))
     else:
-        humedad_ambiente_message = "✅ Humedad ambiental óptima."
+        if corte is None or estado.get("clave") != clave:
+            corte = corte_tabla(zona)
+        try:
+            filas, paginas, firma = pagina_consultada(zona, pagina, tamano, orden, filtro, corte)
+        except ErrorConsulta:
+            # Filtro que no se entiende: tabla vacía hasta que se corrija
+            filas, paginas, firma = [], 1, None
 
+    cambio = firma != estado.get("firma") or clave != estado.get("clave") or pagina != estado.get("pagina")
+    if not cambio and conectado == estado.get("conectado"):
+        raise PreventUpdate
     return (
-        html.Div(""), False, "warning",  # Ocultar alerta de conexión
-        html.Div(humedad_message, className="mb-0"), True, humedad_color,
-        html.Div(temperatura_message, className="mb-0"), True, temperatura_color,
-        html.Div(humedad_ambiente_message, className="mb-0"), True, humedad_ambiente_color
+        filas if cambio else dash.no_update,
+        paginas if cambio else dash.no_update,
+        (ESTILO_FILA_ACTIVA if not conectado else []) if conectado != estado.get("conectado") else dash.no_update,
+        {"clave": clave, "pagina": pagina, "corte": corte, "firma": firma, "conectado": conectado},
     )
 
-# Callback para tabla y gráficos
+# Callback para las tarjetas de riego y condiciones
 @app.callback(
-    [Output('data-table', 'data'),
-     Output('data-table', 'style_data_conditional'),
-     Output('data-table', 'style_data'),
-     Output('data-table', 'style_header'),
-     Output('humidity-bar-graph', 'figure'),
-     Output('temperature-line-graph', 'figure'),
-     Output('humedad-ambiente-bar-graph', 'figure'),
-     Output('tasks-text', 'children'),
+    [Output('tasks-text', 'children'),
      Output('tasks-bar-style', 'style'),
      Output('pending-text', 'children'),
      Output('pending-bar-style', 'style')],
-    [Input('interval-component', 'n_intervals')]
+    DISPARADORES
 )
-def update_table_and_graphs(n):
-    global is_connected, target_humedad, data_history
-    table_data = [{"timestamp": row[0], "humedad": row[1], "temperatura": row[3], "humedad_ambiente": row[4]} for row in data_history]
-    table_style_conditional = [{'if': {'state': 'active'}, 'backgroundColor': '#495057', 'color': '#e0e0e0'}] if not is_connected else []
-    table_style_data = {'backgroundColor': '#2c3b41', 'color': '#e0e0e0', 'border': '1px solid #4b5e6b'}
-    table_style_header = {'backgroundColor': '#007bff', 'color': 'white', 'fontWeight': 'bold', 'border': 'none'}
-
-    # Gráfico de humedad del suelo
-    bar_fig = go.Figure()
-    if is_connected and data_history:
-        timestamps = [row[0] for row in data_history]
-        humidities = [row[1] for row in data_history]
-        colors = ['#ff4d4d' if h < 30 or h > 80 else '#007bff' for h in humidities]
-        bar_fig.add_trace(go.Bar(x=timestamps, y=humidities, marker_color=colors))
-        bar_fig.update_layout(
-            title="Tendencia de Humedad Suelo",
-            xaxis_title="Hora",
-            yaxis_title="Humedad (%)",
-            yaxis_range=[0, 100],
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'},
-            xaxis=dict(gridcolor='#4b5e6b'),
-            yaxis=dict(gridcolor='#4b5e6b')
-        )
-    else:
-        bar_fig.add_annotation(
-            text="Desconectado",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5,
-            showarrow=False,
-            font=dict(size=20, color='#888'),
-            opacity=0.7
-        )
-        bar_fig.update_layout(
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'}
-        )
-
-    # Gráfico de temperatura
-    line_fig = go.Figure()
-    if is_connected and data_history:
-        timestamps = [row[0] for row in data_history]
-        temperatures = [row[3] for row in data_history]
-        colors = ['#ff4d4d' if t < 15 or t > 35 else '#ff4d4d' for t in temperatures]
-        line_fig.add_trace(go.Scatter(
-            x=timestamps,
-            y=temperatures,
-            mode='lines+markers',
-            name='Temperatura (°C)',
-            line=dict(color='#ff4d4d', width=2, shape='spline'),
-            marker=dict(size=8, color=colors)
-        ))
-        line_fig.update_layout(
-            title="Tendencia de Temperatura",
-            xaxis_title="Hora",
-            yaxis_title="Temperatura (°C)",
-            yaxis_range=[0, 50],
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'},
-            xaxis=dict(gridcolor='#4b5e6b'),
-            yaxis=dict(gridcolor='#4b5e6b')
-        )
-    else:
-        line_fig.add_annotation(
-            text="Desconectado",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5,
-            showarrow=False,
-            font=dict(size=20, color='#888'),
-            opacity=0.7
-        )
-        line_fig.update_layout(
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'}
-        )
-
-    # Gráfico de humedad ambiental
-    hum_amb_fig = go.Figure()
-    if is_connected and data_history:
-        timestamps = [row[0] for row in data_history]
-        hum_ambientes = [row[4] for row in data_history]
-        colors = ['#ff4d4d' if h < 30 or h > 80 else '#1cc88a' for h in hum_ambientes]
-        hum_amb_fig.add_trace(go.Bar(x=timestamps, y=hum_ambientes, marker_color=colors))
-        hum_amb_fig.update_layout(
-            title="Humedad Ambiental",
-            xaxis_title="Hora",
-            yaxis_title="Humedad Ambiental (%)",
-            yaxis_range=[0, 100],
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'},
-            xaxis=dict(gridcolor='#4b5e6b'),
-            yaxis=dict(gridcolor='#4b5e6b')
-        )
-    else:
-        hum_amb_fig.add_annotation(
-            text="Desconectado",
-            xref="paper", yref="paper",
-            x=0.5, y=0.5,
-            showarrow=False,
-            font=dict(size=20, color='#888'),
-            opacity=0.7
-        )
-        hum_amb_fig.update_layout(
-            height=300,
-            margin=dict(t=40, b=40, l=40, r=40),
-            paper_bgcolor='#1e2b33',
-            plot_bgcolor='#1e2b33',
-            font={'color': '#e0e0e0'}
-        )
-
-    valores_en_ultima_hora = obtener_valores_ultima_hora(data_history)
-    if is_connected:
-        tiempo_riego = (30 - target_humedad) * 2 if target_humedad < 30 else 0
-        tasks_text = f"Tiempo riego estimado: {tiempo_riego:.0f} min" if tiempo_riego > 0 else "Riego no necesario"
-        tasks_bar_width = f"{min(tiempo_riego * 3, 100)}%"
-        conteo_optimo = sum(1 for v in valores_en_ultima_hora if 30 <= v[1] <= 80)
+@duracion_callbacks.cronometrar("update_cards")
+def update_cards(evento, n, zona):
+    return tarjetas_instantanea(instantanea_zona(zona), zona)
+
+def duracion_legible(minutos):
+    return f"{minutos / 60:.1f} h" if minutos >= 90 else f"{minutos:.0f} min"
+
+# Las estimaciones salen del pronóstico incremental de cada placa (ver pronostico.py);
+# la instantánea cambia con cada lote, después de actualizar el pronóstico
+@lru_cache(maxsize=16)
+def tarjetas_instantanea(snap, zona):
+    estimaciones = [(d.id, d.pronostico.estimar()) for d in dispositivos_zona(zona) if d.conectado]
+    estimaciones = [(id, estimacion) for id, estimacion in estimaciones if estimacion is not None]
+    if snap.conectado and estimaciones:
+        # Vista de todas: manda la zona que más riego necesita (o la que antes se seca)
+        id, estimacion = max(estimaciones, key=lambda e: (e[1].minutos_riego, -(math.inf if e[1].minutos_hasta_seco is None
+                                                                                   else e[1].minutos_hasta_seco)))
+        sufijo = f" ({id})" if len(estimaciones) > 1 else ""
+        if estimacion.minutos_riego > 0:
+            tasks_text = f"Tiempo riego estimado: {estimacion.minutos_riego:.0f} min{sufijo}"
+        elif estimacion.minutos_hasta_seco is not None:
+            tasks_text = f"Riego no necesario, seco en ~{duracion_legible(estimacion.minutos_hasta_seco)}{sufijo}"
+        else:
+            tasks_text = "Riego no necesario"
+        tasks_bar_width = f"{min(estimacion.minutos_riego * 3, 100)}%"
+        conteo_optimo = sum(estimacion.optimas for _, estimacion in estimaciones)
         pending_text = f"Lecturas óptimas: {conteo_optimo}"
         pending_bar_width = f"{min(conteo_optimo * 10, 100)}%"
     else:
@@ -591,19 +856,18 @@ def update_table_and_graphs(n):
         pending_bar_width = "0%"
 
     return (
-        table_data,
-        table_style_conditional,
-        table_style_data,
-        table_style_header,
-        bar_fig,
-        line_fig,
-        hum_amb_fig,
         tasks_text,
         {"width": tasks_bar_width, "backgroundColor": "#1cc88a"},
         pending_text,
         {"width": pending_bar_width, "backgroundColor": "#f6c23e"}
     )
 
+tiempo_arranque = time.perf_counter() - _INICIO_ARRANQUE
+if tiempo_arranque > PRESUPUESTO_ARRANQUE_S:
+    print(f"⚠️ Arranque en {tiempo_arranque:.2f} s, por encima del presupuesto de {PRESUPUESTO_ARRANQUE_S:.1f} s")
+else:
+    print(f"✅ Tablero listo en {tiempo_arranque:.2f} s (presupuesto {PRESUPUESTO_ARRANQUE_S:.1f} s)")
+
 if __name__ == '__main__':
     # app.run(debug=True, use_reloader=False)
     app.run(host='0.0.0.0', port=8050, debug=True, use_reloader=False)
\ No newline at end of file
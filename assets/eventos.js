@@ -0,0 +1,20 @@
+// Canal push del tablero: cada lectura nueva llega por SSE desde /eventos y se
+// escribe en el dcc.Store 'eventos-sse', que es el que dispara los callbacks.
+// EventSource reintenta solo si se corta la conexión.
+(function () {
+    function conectar() {
+        if (!window.dash_clientside || !window.dash_clientside.set_props) {
+            setTimeout(conectar, 200);
+            return;
+        }
+        var fuente = new EventSource('/eventos');
+        fuente.onmessage = function (evento) {
+            try {
+                window.dash_clientside.set_props('eventos-sse', {data: JSON.parse(evento.data)});
+            } catch (e) {
+                // El layout todavía no está montado: el siguiente evento lo alcanzará
+            }
+        };
+    }
+    conectar();
+})();
@@ -0,0 +1,90 @@
+import contextlib
+import io
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA
+from anomalias import DetectorAnomalias
+from tramas import formatear_csv
+
+# Costo del detector de anomalías en línea y qué tan bien encuentra las fallas
+# inyectadas (picos a 0 %, saltos de temperatura, DHT trabado) en una señal sintética.
+# Se compara contra lo que puede mandar un puerto serie: la detección tiene que
+# entrar de sobra en el hilo de la tubería también en una Raspberry.
+
+N_MUESTRAS = 100_000
+FRECUENCIA_HZ = 10
+REPETICIONES = 3
+LOTES = (1, 16, 256)
+BAUDIOS = (9600, 115200)
+LENTITUD_RASPBERRY = 8  # estimación gruesa: una Raspberry Pi 3/4 contra un escritorio actual
+
+
+def generar(n, semilla=0):
+    azar = np.random.default_rng(semilla)
+    muestras = np.zeros(n, dtype=DTYPE_MUESTRA)
+    muestras["t"] = 1_700_000_000.0 + np.arange(n) / FRECUENCIA_HZ
+    # Suelo que se seca despacio con riegos cada ~2 h, DHT con ruido de 0.1
+    horas = np.arange(n) / FRECUENCIA_HZ / 3600
+    muestras["humedad"] = np.floor(70 - 20 * (horas % 2) + azar.normal(0, 0.5, n))
+    muestras["agua"] = muestras["humedad"]
+    muestras["temperatura"] = np.round(24 + 3 * np.sin(horas) + azar.normal(0, 0.1, n), 1)
+    muestras["humedad_ambiente"] = np.round(55 + 5 * np.cos(horas) + azar.normal(0, 0.3, n), 1)
+    inyectadas = np.zeros(n, dtype=bool)
+    picos = azar.choice(n, n // 1000, replace=False)
+    muestras["humedad"][picos] = 0
+    inyectadas[picos] = True
+    saltos = azar.choice(n, n // 2000, replace=False)
+    muestras["temperatura"][saltos] += 15
+    inyectadas[saltos] = True
+    # Un DHT trabado 20 min a la mitad de la serie
+    trabado = slice(n // 2, n // 2 + 20 * 60 * FRECUENCIA_HZ)
+    muestras["temperatura"][trabado] = muestras["temperatura"][n // 2]
+    muestras["humedad_ambiente"][trabado] = muestras["humedad_ambiente"][n // 2]
+    return muestras, inyectadas, trabado.stop
+
+
+def filtrar_por_lotes(muestras, lote):
+    detector = DetectorAnomalias("BENCH")
+    # Sin los avisos de consola del DHT trabado mientras se mide
+    with contextlib.redirect_stdout(io.StringIO()):
+        for inicio in range(0, len(muestras), lote):
+            detector.filtrar(muestras[inicio:inicio + lote])
+    return detector
+
+
+if __name__ == '__main__':
+    muestras, inyectadas, fin_trabado = generar(N_MUESTRAS)
+    largo_trama = len(formatear_csv(45, 23.5, 60.0)) + 2
+    print(f"{N_MUESTRAS} muestras, {int(inyectadas.sum())} anomalías inyectadas + un DHT trabado 20 min\n")
+    for lote in LOTES:
+        mejor = min(timeit.repeat(lambda: filtrar_por_lotes(muestras, lote), number=1, repeat=REPETICIONES))
+        por_segundo = N_MUESTRAS / mejor
+        print(f"lote {lote:>4}: {mejor * 1e6 / N_MUESTRAS:6.2f} µs/muestra  {por_segundo:10.0f} muestras/s")
+        for baudios in BAUDIOS:
+            tasa_serial = baudios / 10 / largo_trama
+            margen = por_segundo / LENTITUD_RASPBERRY / tasa_serial
+            print(f"           {baudios:>6} baudios ({tasa_serial:5.0f} tramas/s): margen x{margen:.0f} en una Raspberry (estimado)")
+
+    # Calidad: una pasada por lotes de 16, como llegan de la tubería a tasa moderada
+    print()
+    detector = DetectorAnomalias("BENCH")
+    aceptadas = np.ones(N_MUESTRAS, dtype=bool)
+    trabados = None
+    for inicio in range(0, N_MUESTRAS, 16):
+        lote = muestras[inicio:inicio + 16]
+        filtrado = detector.filtrar(lote)
+        if filtrado is not None:
+            aceptadas[inicio:inicio + 16] = np.isin(lote["t"], filtrado["t"])
+        if trabados is None and inicio + 16 >= fin_trabado:
+            trabados = detector.trabados()
+    detectadas = int(np.count_nonzero(inyectadas & ~aceptadas))
+    falsas = int(np.count_nonzero(~inyectadas & ~aceptadas))
+    print(f"Detectadas {detectadas}/{int(inyectadas.sum())}, descartadas sin estar inyectadas {falsas} "
+          f"({falsas / N_MUESTRAS:.3%})")
+    print(f"Sensores trabados al final de la falla: {trabados}")
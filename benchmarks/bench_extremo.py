@@ -0,0 +1,205 @@
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+
+from lector_serial import LectorLineas
+from tramas import ParserTramas
+from transportes import SimuladorSerial
+
+# Benchmark de punta a punta sin hardware, sobre el simulador serial (pty):
+#
+#   1. tasa máxima sostenible de líneas (simulador -> lector -> parser)
+#   2. costo de parseo por línea
+#   3. latencia de ingesta a render (trama escrita -> publicación -> callback de gráficos)
+#   4. CPU de los callbacks por cliente y por tick
+#
+# Uso: python benchmarks/bench_extremo.py [resultado.json]
+# Con un archivo de salida se guardan los números para comparar entre corridas en CI.
+
+TASAS = (1000, 5000, 20000, 50000, 100000)
+DURACION_S = 2.0
+SOSTENIBLE = 0.99  # fracción mínima de líneas recibidas para considerar sostenible la tasa
+N_PARSEO = 50000
+MUESTRAS_LATENCIA = 50
+TASA_LATENCIA = 10
+CLIENTES = (1, 5, 20)
+TICKS = 20
+
+
+def tasa_sostenible():
+    resultados = []
+    for tasa in TASAS:
+        simulador = SimuladorSerial("BENCH", tasa=tasa, semilla=0)
+        puerto = serial.Serial(simulador.device, 115200, timeout=0.1)
+        lector = LectorLineas(puerto, modo="selector", espera=0.1)
+        parser = ParserTramas()
+        simulador.iniciar()
+        fin = time.perf_counter() + DURACION_S
+        while time.perf_counter() < fin:
+            for linea in lector.leer_lineas():
+                parser.parsear(linea)
+        # Lo que quedó en vuelo
+        for _ in range(3):
+            for linea in lector.leer_lineas():
+                parser.parsear(linea)
+        simulador.detener()
+        lector.cerrar()
+        puerto.close()
+        esperadas = tasa * DURACION_S
+        # Si el propio simulador no llega a la tasa, el límite medido es el suyo y no el del lector
+        limitado = simulador.enviadas < SOSTENIBLE * esperadas
+        sostenible = not limitado and parser.validas >= SOSTENIBLE * simulador.enviadas
+        resultados.append({"tasa": tasa, "enviadas": simulador.enviadas, "validas": parser.validas,
+                           "sostenible": sostenible, "limitado_por_simulador": limitado})
+        nota = "ok" if sostenible else ("limitado por el simulador" if limitado else "NO sostenible")
+        print(f"  {tasa:>7} líneas/s: enviadas {simulador.enviadas:>7}, válidas {parser.validas:>7} "
+              f"({parser.validas / max(simulador.enviadas, 1):6.1%}) {nota}")
+    sostenibles = [r["tasa"] for r in resultados if r["sostenible"]]
+    return {"por_tasa": resultados, "maxima": max(sostenibles, default=0)}
+
+
+def costo_parseo():
+    generador = SimuladorSerial("BENCH", semilla=0).tramas()
+    lineas = [next(generador)[1] for _ in range(N_PARSEO)]
+    parser = ParserTramas()
+    inicio = time.perf_counter()
+    for linea in lineas:
+        parser.parsear(linea)
+    us = (time.perf_counter() - inicio) / N_PARSEO * 1e6
+    print(f"  {us:.2f} µs/línea ({parser.validas} válidas de {N_PARSEO})")
+    return {"us_por_linea": us}
+
+
+class SimuladorMarcado(SimuladorSerial):
+    """Simulador cuya humedad ambiente sube 0.1 por trama: el valor identifica a la trama
+    (no se repite en 600 tramas) y se anota cuándo salió cada una."""
+
+    def __init__(self, serial_number, tasa):
+        super().__init__(serial_number, tasa)
+        self.envios = {}  # humedad ambiente -> time.perf_counter() del envío
+
+    def tramas(self):
+        for k in itertools.count():
+            yield None, f"Humedad Suelo: 50% | Temperatura: 24.0°C | Humedad Ambiente: {20 + k % 600 / 10:.1f}%".encode("utf-8")
+
+    def _enviar(self, lote):
+        super()._enviar(lote)
+        for linea in lote:
+            self.envios[marca(float(linea.rsplit(b": ", 1)[1].rstrip(b"%")))] = self.ultimo_envio
+
+
+def marca(humedad_ambiente):
+    return round(humedad_ambiente, 1)
+
+
+class ClienteDash:
+    """Un navegador simulado: dispara todos los callbacks como lo haría el front con cada evento."""
+
+    def __init__(self, dash_app):
+        self.http = dash_app.server.test_client()
+        self.dependencias = json.loads(self.http.get('/_dash-dependencies').data)
+        self.props = {}
+
+    @staticmethod
+    def _salidas(salida):
+        if salida.startswith(".."):
+            return [dict(zip(("id", "property"), o.split("."))) for o in salida.strip(".").split("...")]
+        return dict(zip(("id", "property"), salida.split(".")))
+
+    def tick(self, evento, zona="todas"):
+        valores = {("eventos-sse", "data"): evento, ("interval-component", "n_intervals"): 0,
+                   ("selector-zona", "value"): zona, ("selector-rango", "value"): "vivo"}
+        for dependencia in self.dependencias:
+            entradas = [{"id": e["id"], "property": e["property"],
+                         "value": valores.get((e["id"], e["property"]))} for e in dependencia["inputs"]]
+            estados = [{"id": e["id"], "property": e["property"],
+                        "value": self.props.get((e["id"], e["property"]))} for e in dependencia["state"]]
+            cuerpo = {"output": dependencia["output"], "outputs": self._salidas(dependencia["output"]),
+                      "inputs": entradas, "state": estados, "changedPropIds": ["eventos-sse.data"]}
+            respuesta = self.http.post('/_dash-update-component', json=cuerpo)
+            # 204: el callback no actualizó nada (PreventUpdate); cualquier otra cosa es un error
+            if respuesta.status_code == 204:
+                continue
+            if respuesta.status_code != 200:
+                raise RuntimeError(f"Callback {dependencia['output']} respondió {respuesta.status_code}")
+            for id, props in respuesta.get_json().get("response", {}).items():
+                for prop, valor in props.items():
+                    self.props[(id, prop)] = valor
+
+
+def latencia_y_cpu():
+    os.environ.setdefault("PROY_DATOS", tempfile.mkdtemp(prefix="bench-datos-"))
+    import app
+    simulador = SimuladorMarcado("BENCH", tasa=TASA_LATENCIA)
+    # Instante en que se publicó cada lectura, para emparejarla con la trama que la produjo
+    publicados = {}
+    publicar = app.difusor.publicar
+
+    def publicar_cronometrado(datos):
+        if datos["zona"] == "BENCH" and datos["humedad_ambiente"] is not None:
+            publicados[marca(datos["humedad_ambiente"])] = time.perf_counter()
+        publicar(datos)
+    app.difusor.publicar = publicar_cronometrado
+    app.gestor.agregar_transporte(simulador.iniciar())
+
+    cliente = ClienteDash(app.app)
+    version = app.difusor.version
+    ingesta, render = [], []
+    while len(ingesta) < MUESTRAS_LATENCIA:
+        nuevo = app.difusor.esperar(version, timeout=5.0)
+        if nuevo is None:
+            raise RuntimeError("El simulador no publicó ninguna lectura")
+        version, mensaje = nuevo
+        evento = json.loads(mensaje)
+        if evento["zona"] != "BENCH" or evento["humedad_ambiente"] is None:
+            continue
+        clave = marca(evento["humedad_ambiente"])
+        enviado, publicado = simulador.envios.get(clave), publicados.get(clave)
+        if enviado is None or publicado is None:
+            continue
+        ingesta.append((publicado - enviado) * 1e3)
+        cliente.tick(evento, zona="BENCH")
+        render.append((time.perf_counter() - enviado) * 1e3)
+    p50_ingesta = statistics.median(ingesta)
+    p50_render = statistics.median(render)
+    print(f"  ingesta -> publicación: p50 {p50_ingesta:.2f} ms, máx {max(ingesta):.2f} ms")
+    print(f"  ingesta -> render:      p50 {p50_render:.2f} ms, máx {max(render):.2f} ms")
+
+    cpu = {}
+    for n in CLIENTES:
+        clientes = [ClienteDash(app.app) for _ in range(n)]
+        muestras = []
+        for _ in range(TICKS):
+            version, mensaje = app.difusor.esperar(version, timeout=5.0) or (version, None)
+            evento = json.loads(mensaje) if mensaje else None
+            inicio = time.process_time()
+            for c in clientes:
+                c.tick(evento)
+            muestras.append((time.process_time() - inicio) / n * 1e3)
+        cpu[n] = statistics.median(muestras)
+        print(f"  {n:>3} clientes: {cpu[n]:.2f} ms de CPU por cliente y tick")
+    return ({"ingesta_p50_ms": p50_ingesta, "render_p50_ms": p50_render},
+            {"cpu_ms_por_cliente": cpu})
+
+
+if __name__ == '__main__':
+    resultado = {}
+    print("Tasa máxima sostenible:")
+    resultado["tasa"] = tasa_sostenible()
+    print(f"  máxima sostenible: {resultado['tasa']['maxima']} líneas/s")
+    print("Costo de parseo:")
+    resultado["parseo"] = costo_parseo()
+    print("Latencia (simulador a %d Hz):" % TASA_LATENCIA)
+    resultado["latencia"], resultado["callbacks"] = latencia_y_cpu()
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "w") as archivo:
+            json.dump(resultado, archivo, indent=2)
+        print(f"✅ Resultados en {sys.argv[1]}")
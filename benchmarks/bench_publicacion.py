@@ -0,0 +1,89 @@
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA
+from publicacion import ServidorPublicacion, desconectados
+
+# Costo de repartir lecturas a muchos suscriptores locales: cuánto tarda la tubería
+# en publicar (lo que se le resta a la ingesta) y en cuánto llega todo a cada
+# suscriptor, con 1 a 50 programas conectados y uno trabado que no lee nunca.
+
+LOTES = 2000
+TAMANO_LOTE = 16
+SUSCRIPTORES = (1, 10, 50)
+
+
+class _Zona:
+    id = "BENCH"
+
+
+def lote():
+    muestras = np.zeros(TAMANO_LOTE, dtype=DTYPE_MUESTRA)
+    muestras["t"] = 1_700_000_000.0 + np.arange(TAMANO_LOTE) / 10
+    muestras["humedad"] = muestras["agua"] = 45
+    muestras["temperatura"] = 23.5
+    muestras["humedad_ambiente"] = 60
+    return muestras
+
+
+def medir(n_suscriptores, ruta):
+    servidor = ServidorPublicacion(f"unix:{ruta}", capacidad=LOTES * TAMANO_LOTE // 4)
+    cortados = desconectados._valores.get((servidor.direccion,), 0)
+    servidor.iniciar()
+    esperadas = LOTES * TAMANO_LOTE
+    terminados = []
+
+    def leer(conexion):
+        lineas = 0
+        with conexion, conexion.makefile("rb") as flujo:
+            for _ in flujo:
+                lineas += 1
+                if lineas == esperadas:
+                    break
+        terminados.append(time.perf_counter())
+
+    hilos = []
+    for _ in range(n_suscriptores):
+        conexion = socket.socket(socket.AF_UNIX)
+        conexion.connect(ruta)
+        hilos.append(threading.Thread(target=leer, args=(conexion,), daemon=True))
+    trabado = socket.socket(socket.AF_UNIX)
+    trabado.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    trabado.connect(ruta)
+    while len(servidor.suscriptores) < n_suscriptores + 1:
+        time.sleep(0.01)
+    for hilo in hilos:
+        hilo.start()
+
+    muestras = lote()
+    inicio = time.perf_counter()
+    for _ in range(LOTES):
+        servidor.publicar_lote(_Zona, muestras)
+    publicado = time.perf_counter() - inicio
+    for hilo in hilos:
+        hilo.join(60)
+    entregado = max(terminados) - inicio if len(terminados) == n_suscriptores else float("nan")
+    cortados = desconectados._valores.get((servidor.direccion,), 0) - cortados
+    trabado.close()
+    servidor.detener()
+    return publicado, entregado, cortados
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "bench.sock")
+        print(f"{LOTES} lotes de {TAMANO_LOTE} muestras ({LOTES * TAMANO_LOTE} registros NDJSON)\n")
+        for n in SUSCRIPTORES:
+            publicado, entregado, cortados = medir(n, ruta)
+            registros = LOTES * TAMANO_LOTE
+            print(f"{n:>3} suscriptores: tubería {publicado * 1e6 / registros:5.2f} µs/registro  "
+                  f"entrega completa {entregado:6.2f} s ({registros * n / entregado:9.0f} registros/s en total)  "
+                  f"trabado {'desconectado' if cortados else 'SIGUE CONECTADO'}")
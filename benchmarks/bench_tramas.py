@@ -0,0 +1,51 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tramas import ParserTramas, formatear_csv
+
+# Compara el parser compilado con el parseo original de leer_serial
+# (decode + split/strip/replace por campo) sobre el mismo lote de líneas.
+
+N_LINEAS = 10000
+REPETICIONES = 5
+
+
+def parsear_original(linea):
+    data = linea.decode('utf-8').strip()
+    if "Humedad Suelo" in data and "Temperatura" in data and "Humedad Ambiente" in data:
+        try:
+            humedad_str = data.split("|")[0].split(":")[1].strip().replace("%", "")
+            temperatura_str = data.split("|")[1].split(":")[1].strip().replace("°C", "")
+            humedad_ambiente_str = data.split("|")[2].split(":")[1].strip().replace("%", "")
+            return int(humedad_str), float(temperatura_str), float(humedad_ambiente_str)
+        except (ValueError, IndexError):
+            return None
+    return None
+
+
+def generar_lineas(n):
+    texto, csv = [], []
+    for i in range(n):
+        hum, temp, hum_amb = i % 100, 15 + (i % 200) / 10, 30 + (i % 500) / 10
+        texto.append(f"Humedad Suelo: {hum}% | Temperatura: {temp:.1f}°C | Humedad Ambiente: {hum_amb:.1f}%".encode())
+        csv.append(formatear_csv(hum, temp, hum_amb))
+    return texto, csv
+
+
+def medir(nombre, funcion, lineas):
+    mejor = min(timeit.repeat(lambda: [funcion(l) for l in lineas], number=1, repeat=REPETICIONES))
+    print(f"{nombre:<28} {mejor * 1e6 / len(lineas):8.2f} µs/línea  {len(lineas) / mejor:12.0f} líneas/s")
+    return mejor
+
+
+if __name__ == '__main__':
+    texto, csv = generar_lineas(N_LINEAS)
+    parser = ParserTramas()
+    base = medir("original (split/replace)", parsear_original, texto)
+    t_texto = medir("compilado (texto)", parser.parsear, texto)
+    t_csv = medir("compilado (CSV+checksum)", parser.parsear, csv)
+    print(f"\nAceleración texto: x{base / t_texto:.2f}   CSV: x{base / t_csv:.2f}")
+    print(f"Tramas inválidas: {parser.invalidas}")
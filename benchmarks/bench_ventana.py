@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA, Almacen
+
+# Tiempo de la consulta "últimos N minutos" con horas de datos a alta frecuencia.
+
+HORAS = 6
+FRECUENCIA_HZ = 20
+REPETICIONES = 200
+
+
+if __name__ == '__main__':
+    n = HORAS * 3600 * FRECUENCIA_HZ
+    with tempfile.TemporaryDirectory() as directorio:
+        almacen = Almacen(directorio, capacidad_memoria=n)
+        ahora = 1_700_000_000.0
+        t = ahora - HORAS * 3600 + np.arange(n) / FRECUENCIA_HZ
+        # Se carga directo al buffer: aquí interesa la consulta, no la ingesta
+        datos = np.zeros(n, dtype=DTYPE_MUESTRA)
+        datos["t"] = t
+        datos["humedad"] = np.random.default_rng(0).uniform(0, 100, n)
+        almacen.memoria.cargar(datos)
+
+        print(f"{n} muestras ({HORAS} h a {FRECUENCIA_HZ} Hz)")
+        for minutos in (1, 5, 15, 60):
+            copia = timeit.timeit(lambda: almacen.ventana(minutos * 60, ahora=ahora), number=REPETICIONES)
+            vista = timeit.timeit(lambda: almacen.ventana(minutos * 60, ahora=ahora, copiar=False), number=REPETICIONES)
+            filas = len(almacen.ventana(minutos * 60, ahora=ahora))
+            print(f"últimos {minutos:>2} min: {filas:>7} filas  "
+                  f"vista {vista / REPETICIONES * 1e3:8.3f} ms  copia {copia / REPETICIONES * 1e3:8.3f} ms")
+        almacen.cerrar()
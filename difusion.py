@@ -0,0 +1,56 @@
+import json
+import threading
+import time
+
+# Difusión de lecturas hacia los navegadores. El hilo de ingesta publica cada
+# muestra una sola vez (ya serializada) y cada cliente conectado por SSE espera
+# la siguiente versión. Es de "último valor": un cliente lento se salta versiones
+# intermedias en lugar de acumularlas, así el costo de publicar no depende de
+# cuántos clientes haya.
+
+
+class Difusor:
+    def __init__(self):
+        self._condicion = threading.Condition()
+        self._version = 0
+        self._mensaje = None
+        self.clientes = 0
+
+    @property
+    def version(self):
+        return self._version
+
+    def publicar(self, datos):
+        mensaje = json.dumps(datos, separators=(",", ":"))
+        with self._condicion:
+            self._version += 1
+            self._mensaje = mensaje
+            self._condicion.notify_all()
+
+    def esperar(self, version, timeout=None):
+        """Bloquea hasta que haya una versión posterior a `version`; None si vence el timeout."""
+        with self._condicion:
+            if not self._condicion.wait_for(lambda: self._version > version, timeout):
+                return None
+            return self._version, self._mensaje
+
+    def flujo_sse(self, intervalo_minimo=0.1, keepalive=15.0):
+        """Generador de eventos SSE para una respuesta HTTP en streaming."""
+        with self._condicion:
+            self.clientes += 1
+        try:
+            version = 0
+            # Sugerencia de reintento para el EventSource del navegador
+            yield "retry: 2000\n\n"
+            while True:
+                nuevo = self.esperar(version, timeout=keepalive)
+                if nuevo is None:
+                    yield ": keepalive\n\n"
+                    continue
+                version, mensaje = nuevo
+                yield f"id: {version}\ndata: {mensaje}\n\n"
+                # A tasas altas se agrupan las muestras: como mucho un evento por intervalo
+                time.sleep(intervalo_minimo)
+        finally:
+            with self._condicion:
+                self.clientes -= 1
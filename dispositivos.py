@@ -0,0 +1,441 @@
+import asyncio
+import functools
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import serial
+import serial.tools.list_ports
+
+import numpy as np
+
+from agregados import MotorAgregados
+from almacenamiento import DTYPE_MUESTRA, Almacen, instante_actual
+from anomalias import DetectorAnomalias
+from instantanea import PublicadorInstantaneas
+from lector_serial import LectorLineas
+from metricas import aperturas_fallidas, errores_lectura, latencia_ingesta, reconexiones
+from pronostico import Pronostico
+from tramas import ParserTramas
+from tuberia import Tuberia
+
+# Motor asyncio de las placas (una por cama/zona del invernadero). Un único bucle
+# de eventos, en su propio hilo, es dueño de todas las conexiones: abre, lee,
+# cierra y reconecta cada puerto desde la tarea de esa placa, así nunca se cierra
+# un puerto mientras otra parte del programa lo está leyendo.
+#
+# Estados de cada placa:
+#   conectado    -> llegan tramas válidas
+#   degradado    -> puerto abierto pero sin tramas válidas hace un rato
+#   reconectando -> puerto cerrado; se reintenta con espera exponencial
+#
+# Los escaneos de puertos se disparan por fallos de lectura (o por hotplug con
+# pyudev en Linux, si está instalado) en lugar de sondear cada pocos segundos.
+# Además de los puertos USB se escanean los transportes agregados a mano
+# (ver transportes.py), que se abren igual que una placa real.
+#
+# El bucle solo lee y parsea: las muestras pasan por la tubería (tuberia.py) a un
+# hilo que descarta las anómalas, guarda el resto, actualiza los agregados y el
+# pronóstico y publica la instantánea por lotes.
+
+DESCRIPCIONES_ARDUINO = ("Arduino", "CH340")
+
+CONECTADO = "conectado"
+DEGRADADO = "degradado"
+RECONECTANDO = "reconectando"
+
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+
+def detectar_puertos_arduino():
+    return [puerto for puerto in serial.tools.list_ports.comports()
+            if any(descripcion in puerto.description for descripcion in DESCRIPCIONES_ARDUINO)]
+
+
+def id_dispositivo(puerto):
+    # El número de serie USB sobrevive a reconexiones en otro puerto; si no hay, el nombre del puerto
+    base = getattr(puerto, "serial_number", None) or puerto.device
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", base)
+
+
+class Dispositivo:
+    def __init__(self, id, puerto, directorio, al_publicar, filas_historial=10, capacidad_memoria=86400,
+                 modo_lectura="bloqueante", baudios=9600, intervalo_reporte=60, modo_anomalias="cuarentena"):
+        self.id = id
+        self.puerto = puerto
+        self.baudios = baudios
+        self.modo_lectura = modo_lectura
+        self.filas_historial = filas_historial
+        self.intervalo_reporte = intervalo_reporte
+        self.arduino = None
+        self.lector = None
+        self.estado = RECONECTANDO
+        self.intentos = 0
+        self.lectura = None
+        self.ultima_trama = 0.0
+        self.parser = ParserTramas()
+        # Lo que el detector saca del flujo queda en datos/<id>/cuarentena.ndjson
+        self.anomalias = DetectorAnomalias(id, modo_anomalias, os.path.join(directorio, "cuarentena.ndjson"))
+        self.almacen = Almacen(directorio, capacidad_memoria=capacidad_memoria)
+        # Los agregados se rehacen al arrancar con los segmentos en disco (cada nivel con su
+        # retención: 1 día, 7 días, 90 días) y el pronóstico con la ventana caliente; después
+        # crecen con cada muestra
+        recientes = self.almacen.ultimos(capacidad_memoria)
+        self.agregados = MotorAgregados()
+        self.agregados.cargar_historial(directorio, instante_actual())
+        self.pronostico = Pronostico()
+        self.pronostico.cargar(recientes)
+        self.instantaneas = PublicadorInstantaneas()
+        self._al_publicar = al_publicar
+        self._ultimo_reporte = time.monotonic()
+        # Totales de los lectores anteriores: cada reconexión crea un lector nuevo
+        self._lineas_previas = 0
+        self._bytes_previos = 0
+        self.aperturas = 0
+        # Publican el lector (cambios de estado) y el consumidor de la tubería (lotes)
+        self._lock_publicar = threading.Lock()
+
+    @property
+    def conectado(self):
+        return self.estado != RECONECTANDO
+
+    @property
+    def lineas_leidas(self):
+        return self._lineas_previas + (self.lector.lineas_totales if self.lector is not None else 0)
+
+    @property
+    def bytes_leidos(self):
+        return self._bytes_previos + (self.lector.bytes_totales if self.lector is not None else 0)
+
+    def publicar(self, t=None, valores=None):
+        # valores: (humedad, temperatura, humedad ambiental) de la última muestra guardada
+        if valores is None and self.lectura is not None:
+            valores = (self.lectura.humedad, self.lectura.temperatura, self.lectura.humedad_ambiente)
+        if self.conectado and valores is not None:
+            humedad, temperatura, humedad_ambiente = valores
+        else:
+            humedad, temperatura, humedad_ambiente = 0, 0, 0
+        with self._lock_publicar:
+            snap = self.instantaneas.publicar(t, self.conectado, humedad, humedad, temperatura, humedad_ambiente,
+                                              self.almacen.ultimos(self.filas_historial))
+            self._al_publicar(self, snap)
+
+    def cambiar_estado(self, estado):
+        if estado != self.estado:
+            self.estado = estado
+            self.publicar()
+
+    def abrir(self):
+        self.arduino = serial.Serial(self.puerto, self.baudios, timeout=1)
+        self.lector = LectorLineas(self.arduino, modo=self.modo_lectura)
+        self.ultima_trama = time.monotonic()
+        self.intentos = 0
+        if self.aperturas:
+            reconexiones.inc(self.id)
+        self.aperturas += 1
+
+    def cerrar(self):
+        if self.lector is not None:
+            self._lineas_previas += self.lector.lineas_totales
+            self._bytes_previos += self.lector.bytes_totales
+            self.lector.cerrar()
+            self.lector = None
+        if self.arduino is not None:
+            try:
+                self.arduino.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.arduino = None
+
+    def procesar(self, lineas):
+        """Parsea las líneas y devuelve las muestras válidas con su instante de llegada."""
+        filas = []
+        for linea in lineas:
+            lectura = self.parser.parsear(linea)
+            if lectura is None:
+                continue
+            self.lectura = lectura
+            filas.append((instante_actual(), lectura.humedad, lectura.humedad, lectura.temperatura,
+                          lectura.humedad_ambiente))
+        if filas:
+            self.ultima_trama = time.monotonic()
+            self.estado = CONECTADO
+        return np.array(filas, dtype=DTYPE_MUESTRA)
+
+    def reportar_si_toca(self):
+        if time.monotonic() - self._ultimo_reporte < self.intervalo_reporte or self.lector is None:
+            return
+        stats = self.lector.estadisticas()
+        tramas = self.parser.estadisticas()
+        print(f"📈 Serial {self.id}: {stats['lineas_s']:.1f} líneas/s, {stats['bytes_s']:.0f} B/s, "
+              f"resto {stats['resto_bytes']} B, descartadas {stats['lineas_descartadas']} | "
+              f"tramas válidas {tramas['validas']}, inválidas {tramas['invalidas']} "
+              f"(checksum {tramas['checksum_erroneo']}), anómalas {self.anomalias.marcadas} | {self.estado}")
+        self._ultimo_reporte = time.monotonic()
+
+
+# Etapas de la tubería, en orden: consumidor(dispositivo, muestras, llegada)
+
+def filtrar_anomalias(dispositivo, muestras, llegada):
+    # En modo cuarentena devuelve el lote sin las muestras anómalas (ver anomalias.py)
+    return dispositivo.anomalias.filtrar(muestras)
+
+
+def almacenar(dispositivo, muestras, llegada):
+    # Corrige los instantes en el lugar: las etapas siguientes ven los guardados
+    dispositivo.almacen.agregar_lote(muestras)
+
+
+def actualizar_agregados(dispositivo, muestras, llegada):
+    dispositivo.agregados.agregar_lote(muestras)
+
+
+def actualizar_pronostico(dispositivo, muestras, llegada):
+    dispositivo.pronostico.agregar_lote(muestras)
+
+
+def publicar_lote(dispositivo, muestras, llegada):
+    ultima = muestras[-1]
+    dispositivo.publicar(float(ultima["t"]),
+                         (int(ultima["humedad"]), float(ultima["temperatura"]), float(ultima["humedad_ambiente"])))
+    if llegada is not None:
+        latencia_ingesta.observar(time.perf_counter() - llegada, dispositivo.id)
+
+
+ETAPAS = (filtrar_anomalias, almacenar, actualizar_agregados, actualizar_pronostico, publicar_lote)
+
+
+class GestorDispositivos:
+    def __init__(self, directorio, al_publicar, max_dispositivos=32, espera_base=0.5, espera_maxima=30.0,
+                 tiempo_degradado=10.0, tiempo_sin_datos=60.0, intervalo_descubrimiento=30.0,
+                 opciones_tuberia=None, **opciones_dispositivo):
+        self.directorio = directorio
+        self.max_dispositivos = max_dispositivos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.tiempo_degradado = tiempo_degradado
+        self.tiempo_sin_datos = tiempo_sin_datos
+        self.intervalo_descubrimiento = intervalo_descubrimiento
+        self.dispositivos = {}
+        self._al_publicar = al_publicar
+        self._opciones = opciones_dispositivo
+        self._loop = None
+        self._pedir_escaneo = None
+        self._despertar = {}
+        self.transportes = []
+        self._listo = threading.Event()
+        # Lecturas bloqueantes (Windows) y escaneos de puertos, fuera del bucle
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_dispositivos + 1, thread_name_prefix="serial")
+        # Etapas después del parseo; se pueden sumar más con agregar_consumidor()
+        self.tuberia = Tuberia(ETAPAS, **(opciones_tuberia or {}))
+
+    # --- ciclo de vida -------------------------------------------------
+
+    def iniciar(self, espera_inicial=0.0):
+        """Arranca el bucle en su hilo. Por defecto no espera al primer escaneo: las placas se
+        conectan en segundo plano a medida que aparecen."""
+        self.cargar_conocidos()
+        self.tuberia.iniciar()
+        threading.Thread(target=lambda: asyncio.run(self._principal()), name="motor-serial", daemon=True).start()
+        if espera_inicial:
+            self._listo.wait(espera_inicial)
+        return len(self.dispositivos)
+
+    def cargar_conocidos(self):
+        """Registra las placas que ya tienen historial en disco, aunque no estén enchufadas,
+        para que el tablero muestre su historial desde el arranque."""
+        if not os.path.isdir(self.directorio):
+            return 0
+        cargados = 0
+        for id in sorted(os.listdir(self.directorio)):
+            directorio = os.path.join(self.directorio, id)
+            if id in self.dispositivos or not os.path.isdir(directorio):
+                continue
+            if len(self.dispositivos) >= self.max_dispositivos:
+                break
+            # Sin puerto: queda en "reconectando" hasta que un escaneo la encuentre
+            dispositivo = Dispositivo(id, None, directorio, self._al_publicar, **self._opciones)
+            self.dispositivos[id] = dispositivo
+            dispositivo.publicar()
+            cargados += 1
+        return cargados
+
+    def agregar_transporte(self, transporte):
+        """Suma un puerto que no enumera el USB (simulador o reproducción de una captura)."""
+        self.transportes.append(transporte)
+        self.pedir_escaneo()
+
+    def agregar_consumidor(self, consumidor):
+        """Suma una etapa al final de la tubería (alertas, exportadores...)."""
+        self.tuberia.agregar_consumidor(consumidor)
+
+    def tareas_pendientes(self):
+        """Trabajos encolados en el ejecutor (lecturas bloqueantes y escaneos) sin hilo libre."""
+        return self._ejecutor._work_queue.qsize()
+
+    def pedir_escaneo(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._pedir_escaneo.set)
+
+    def detener(self):
+        # Primero se vacía la cola para no perder lo ya leído
+        self.tuberia.detener()
+        for dispositivo in list(self.dispositivos.values()):
+            dispositivo.almacen.cerrar()
+
+    async def _principal(self):
+        self._loop = asyncio.get_running_loop()
+        self._pedir_escaneo = asyncio.Event()
+        for dispositivo in list(self.dispositivos.values()):
+            self._registrar(dispositivo)
+        self._iniciar_hotplug()
+        await self._escanear()
+        self._listo.set()
+        while True:
+            try:
+                await asyncio.wait_for(self._pedir_escaneo.wait(), self.intervalo_descubrimiento)
+            except asyncio.TimeoutError:
+                pass
+            self._pedir_escaneo.clear()
+            await self._escanear()
+
+    def _iniciar_hotplug(self):
+        # Linux con pyudev: se escanea cuando el kernel avisa que se enchufó o quitó un tty
+        if pyudev is None:
+            return
+        try:
+            monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+            monitor.filter_by(subsystem="tty")
+            observador = pyudev.MonitorObserver(monitor, callback=lambda _dispositivo: self.pedir_escaneo(),
+                                                name="hotplug")
+            observador.daemon = True
+            observador.start()
+        except (OSError, ValueError) as e:
+            print(f"❌ Hotplug no disponible: {e}")
+
+    # --- escaneo -------------------------------------------------------
+
+    async def _escanear(self):
+        puertos = await self._loop.run_in_executor(self._ejecutor, detectar_puertos_arduino)
+        puertos += self.transportes
+        for puerto in puertos:
+            id = id_dispositivo(puerto)
+            dispositivo = self.dispositivos.get(id)
+            if dispositivo is None:
+                if len(self.dispositivos) >= self.max_dispositivos:
+                    print(f"❌ Límite de {self.max_dispositivos} placas alcanzado, se ignora {puerto.device}")
+                    continue
+                # Abrir el historial, los agregados y el pronóstico lleva su tiempo: fuera del
+                # bucle, así las demás placas siguen leyendo mientras tanto
+                dispositivo = await self._loop.run_in_executor(
+                    self._ejecutor, functools.partial(Dispositivo, id, puerto.device, os.path.join(self.directorio, id),
+                                                      self._al_publicar, **self._opciones))
+                self.dispositivos[id] = dispositivo
+                await self._intentar_abrir(dispositivo)
+                self._registrar(dispositivo)
+            elif not dispositivo.conectado:
+                # Volvió a aparecer (quizá en otro puerto): se despierta su tarea sin esperar el backoff
+                dispositivo.puerto = puerto.device
+                self._despertar[id].set()
+
+    def _registrar(self, dispositivo):
+        self._despertar[dispositivo.id] = asyncio.Event()
+        self._loop.create_task(self._ciclo(dispositivo), name=f"serial-{dispositivo.id}")
+
+    async def _intentar_abrir(self, dispositivo):
+        try:
+            await self._loop.run_in_executor(self._ejecutor, dispositivo.abrir)
+        except (serial.SerialException, OSError) as e:
+            dispositivo.intentos += 1
+            aperturas_fallidas.inc(dispositivo.id)
+            print(f"❌ No se pudo abrir {dispositivo.id} en {dispositivo.puerto}: {e}")
+            return False
+        print(f"✅ Conectado al Arduino {dispositivo.id} en {dispositivo.puerto}")
+        dispositivo.cambiar_estado(CONECTADO)
+        return True
+
+    # --- lectura por placa --------------------------------------------
+
+    def _espera_reintento(self, dispositivo):
+        espera = min(self.espera_maxima, self.espera_base * 2 ** max(dispositivo.intentos - 1, 0))
+        return espera * random.uniform(0.8, 1.2)
+
+    async def _ciclo(self, dispositivo):
+        while True:
+            if dispositivo.arduino is None:
+                despertar = self._despertar[dispositivo.id]
+                if dispositivo.puerto is None:
+                    # Placa conocida solo por su historial: se espera a que un escaneo la encuentre
+                    await despertar.wait()
+                else:
+                    try:
+                        await asyncio.wait_for(despertar.wait(), self._espera_reintento(dispositivo))
+                    except asyncio.TimeoutError:
+                        pass
+                despertar.clear()
+                if not await self._intentar_abrir(dispositivo):
+                    # Sigue sin abrir: quizá cambió de puerto, que lo averigüe un escaneo
+                    self._pedir_escaneo.set()
+                continue
+            try:
+                await self._leer(dispositivo)
+            except (serial.SerialException, OSError, ValueError) as e:
+                errores_lectura.inc(dispositivo.id)
+                print(f"Error en lectura serial {dispositivo.id}: {e}")
+                self._perder(dispositivo)
+
+    def _perder(self, dispositivo):
+        dispositivo.cerrar()
+        dispositivo.intentos = max(dispositivo.intentos, 1)
+        dispositivo.cambiar_estado(RECONECTANDO)
+        self._pedir_escaneo.set()
+
+    async def _leer(self, dispositivo):
+        if os.name == "posix":
+            # El bucle despierta la tarea solo cuando el descriptor tiene bytes
+            listo = asyncio.Event()
+            fd = dispositivo.arduino.fileno()
+            self._loop.add_reader(fd, listo.set)
+            try:
+                while dispositivo.arduino is not None:
+                    try:
+                        await asyncio.wait_for(listo.wait(), self.tiempo_degradado)
+                    except asyncio.TimeoutError:
+                        self._revisar_silencio(dispositivo)
+                        continue
+                    listo.clear()
+                    await self._esperar_lugar()
+                    llegada = time.perf_counter()
+                    self.tuberia.encolar(dispositivo, dispositivo.procesar(dispositivo.lector.leer_disponibles()), llegada)
+                    self._revisar_silencio(dispositivo)
+                    dispositivo.reportar_si_toca()
+            finally:
+                if dispositivo.arduino is not None:
+                    self._loop.remove_reader(fd)
+        else:
+            # Windows: los puertos COM no van en el selector; lectura bloqueante en el ejecutor
+            while dispositivo.arduino is not None:
+                await self._esperar_lugar()
+                lineas = await self._loop.run_in_executor(self._ejecutor, dispositivo.lector.leer_lineas)
+                # La lectura bloqueante vuelve apenas llegan los bytes: se mide desde aquí
+                self.tuberia.encolar(dispositivo, dispositivo.procesar(lineas), time.perf_counter())
+                self._revisar_silencio(dispositivo)
+                dispositivo.reportar_si_toca()
+
+    async def _esperar_lugar(self):
+        # Contrapresión (política "esperar"): no se lee más hasta que la cola tenga lugar
+        while self.tuberia.politica == "esperar" and self.tuberia.llena():
+            await asyncio.sleep(max(self.tuberia.intervalo_lote, 0.01))
+
+    def _revisar_silencio(self, dispositivo):
+        silencio = time.monotonic() - dispositivo.ultima_trama
+        if silencio >= self.tiempo_sin_datos:
+            raise serial.SerialException(f"sin tramas válidas hace {silencio:.0f} s")
+        if silencio >= self.tiempo_degradado:
+            dispositivo.cambiar_estado(DEGRADADO)
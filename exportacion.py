@@ -0,0 +1,290 @@
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import urlencode
+
+import numpy as np
+
+from almacenamiento import contar_segmentos, iterar_segmentos, kesimo_instante, vistas_segmentos
+
+# Exportación del historial por HTTP: GET /api/historial
+#
+#   desde, hasta   epoch en segundos o fecha ISO 8601 (por defecto: las últimas 24 h)
+#   zona           una o varias separadas por coma (por defecto todas las que tienen datos)
+#   sensores       subconjunto de humedad,agua,temperatura,humedad_ambiente
+#   formato        csv | ndjson | arrow | parquet (estos dos necesitan pyarrow)
+#   limite         filas por página; si quedan más, la respuesta trae X-Siguiente-Desde
+#                  y un Link rel="next" con la consulta de la página siguiente
+#   gzip=1         comprime (también si el cliente manda Accept-Encoding: gzip)
+#
+# Todo sale de los segmentos en disco con generadores, por bloques: ni la consulta
+# ni la respuesta se cargan enteras en memoria y el tablero sigue atendiendo.
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+SENSORES = ("humedad", "agua", "temperatura", "humedad_ambiente")
+FORMATOS = {
+    "csv": "text/csv",  # Flask agrega el charset a los text/*
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+LIMITE_POR_DEFECTO = 100_000
+LIMITE_MAXIMO = 1_000_000
+RANGO_POR_DEFECTO = 24 * 3600
+VENTANA_MEZCLA = 600.0  # segundos que se ordenan juntos al mezclar varias zonas
+BLOQUE = 65536
+
+
+class ErrorConsulta(ValueError):
+    pass
+
+
+def leer_instante(texto, por_defecto):
+    if texto is None or texto == "":
+        return por_defecto
+    try:
+        return float(texto)
+    except ValueError:
+        pass
+    try:
+        # Sin zona horaria se toma como hora local, igual que el tablero
+        return datetime.fromisoformat(texto.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        raise ErrorConsulta(f"Instante inválido: {texto}")
+
+
+def _lista(texto, validos, nombre):
+    if not texto:
+        return list(validos)
+    elegidos = [x.strip() for x in texto.split(",") if x.strip()]
+    desconocidos = [x for x in elegidos if x not in validos]
+    if desconocidos:
+        raise ErrorConsulta(f"Valor de '{nombre}' desconocido: {', '.join(desconocidos)}")
+    return elegidos
+
+
+def zonas_con_datos(directorio_datos):
+    if not os.path.isdir(directorio_datos):
+        return []
+    return sorted(zona for zona in os.listdir(directorio_datos)
+                  if os.path.isdir(os.path.join(directorio_datos, zona)))
+
+
+class Consulta:
+    def __init__(self, parametros, directorio_datos, acepta_gzip=False):
+        ahora = time.time()
+        self.hasta = leer_instante(parametros.get("hasta"), ahora)
+        self.desde = leer_instante(parametros.get("desde"), self.hasta - RANGO_POR_DEFECTO)
+        if self.desde >= self.hasta:
+            raise ErrorConsulta("'desde' tiene que ser anterior a 'hasta'")
+        self.zonas = _lista(parametros.get("zona"), zonas_con_datos(directorio_datos), "zona")
+        self.sensores = _lista(parametros.get("sensores"), SENSORES, "sensores")
+        self.formato = parametros.get("formato", "csv")
+        if self.formato not in FORMATOS:
+            raise ErrorConsulta(f"Formato desconocido: {self.formato}")
+        if self.formato in ("arrow", "parquet") and pa is None:
+            raise ErrorConsulta(f"El formato {self.formato} necesita pyarrow instalado")
+        try:
+            self.limite = min(int(parametros.get("limite", LIMITE_POR_DEFECTO)), LIMITE_MAXIMO)
+        except ValueError:
+            raise ErrorConsulta("'limite' tiene que ser un entero")
+        if self.limite < 1:
+            raise ErrorConsulta("'limite' tiene que ser positivo")
+        # Parquet ya viene comprimido por columna
+        self.gzip = self.formato != "parquet" and (parametros.get("gzip") == "1" or acepta_gzip)
+        self.directorios = {zona: os.path.join(directorio_datos, zona) for zona in self.zonas}
+        self.parametros = dict(parametros)
+
+    def _contar(self, hasta):
+        return sum(contar_segmentos(directorio, self.desde, hasta) for directorio in self.directorios.values())
+
+    def fin_de_pagina(self):
+        """Instante donde corta esta página (exclusivo): `hasta`, o antes si hay más de `limite` filas."""
+        if self._contar(self.hasta) <= self.limite:
+            return self.hasta
+        # Corte en el instante de la primera fila que no entra: pasan exactamente `limite`
+        # filas (menos solo si hay empates justo en el borde, que no se pueden partir)
+        tiempos = [vista["t"] for directorio in self.directorios.values()
+                   for vista in vistas_segmentos(directorio, self.desde, self.hasta)]
+        corte = kesimo_instante(tiempos, self.limite)
+        # Si todas comparten el instante de `desde` se estira la página: si no, no avanzaría
+        return corte if corte > self.desde else float(np.nextafter(corte, np.inf))
+
+    def url_siguiente(self, ruta, corte):
+        return f"{ruta}?{urlencode({**self.parametros, 'desde': repr(corte)})}"
+
+
+class _CursorZona:
+    # Lee los bloques de una zona de a poco y entrega lo que cae antes de cada corte
+    def __init__(self, bloques):
+        self._bloques = bloques
+        self._pendiente = None
+
+    def primero(self):
+        """Instante de la próxima muestra sin entregar, o None si la zona se terminó."""
+        while self._pendiente is None or not len(self._pendiente):
+            self._pendiente = next(self._bloques, None)
+            if self._pendiente is None:
+                return None
+        return float(self._pendiente["t"][0])
+
+    def antes_de(self, fin):
+        partes = []
+        while True:
+            if self._pendiente is None:
+                self._pendiente = next(self._bloques, None)
+                if self._pendiente is None:
+                    break
+            corte = np.searchsorted(self._pendiente["t"], fin, "left")
+            partes.append(self._pendiente[:corte])
+            if corte < len(self._pendiente):
+                self._pendiente = self._pendiente[corte:]
+                break
+            self._pendiente = None
+        return np.concatenate(partes) if len(partes) > 1 else (partes[0] if partes else None)
+
+
+def _bloques_mezclados(consulta, hasta):
+    # Cada zona se lee en orden; por ventanas de tiempo se juntan y ordenan las de todas
+    cursores = {zona: _CursorZona(iterar_segmentos(directorio, consulta.desde, hasta, BLOQUE))
+                for zona, directorio in consulta.directorios.items()}
+    while True:
+        # Cada ventana arranca en la muestra pendiente más vieja: se salta el tiempo sin
+        # datos (también el que hay entre `desde` y la primera muestra guardada)
+        primeros = [t for t in (cursor.primero() for cursor in cursores.values()) if t is not None]
+        if not primeros:
+            break
+        inicio = max(min(primeros), consulta.desde)
+        if inicio >= hasta:
+            break
+        fin = min(inicio + VENTANA_MEZCLA, hasta)
+        partes, zonas = [], []
+        for zona, cursor in cursores.items():
+            datos = cursor.antes_de(fin)
+            if datos is not None and len(datos):
+                partes.append(datos)
+                zonas.append(np.full(len(datos), zona, dtype=object))
+        if partes:
+            muestras = np.concatenate(partes)
+            orden = np.argsort(muestras["t"], kind="stable")
+            yield np.concatenate(zonas)[orden], muestras[orden]
+        # Cede el GIL entre ventanas para no frenar los callbacks del tablero
+        time.sleep(0)
+
+
+def _tiempos(t):
+    # "t" y "fecha" salen del mismo instante truncado al milisegundo, así nunca difieren
+    ms = np.floor(np.asarray(t, dtype=np.float64) * 1000).astype(np.int64)
+    return (np.char.mod("%.3f", ms / 1000).tolist(),
+            np.datetime_as_string(ms.astype("datetime64[ms]"), unit="ms", timezone="UTC").tolist())
+
+
+def _csv(consulta, bloques):
+    yield (",".join(["zona", "t", "fecha"] + consulta.sensores) + "\n").encode("utf-8")
+    for zonas, muestras in bloques:
+        columnas = [zonas.tolist(), *_tiempos(muestras["t"])]
+        columnas += [np.char.mod("%.2f", muestras[sensor]).tolist() for sensor in consulta.sensores]
+        yield "".join(",".join(fila) + "\n" for fila in zip(*columnas)).encode("utf-8")
+
+
+def _ndjson(consulta, bloques):
+    claves = ["zona", "t", "fecha"] + consulta.sensores
+    for zonas, muestras in bloques:
+        segundos, fechas = _tiempos(muestras["t"])
+        columnas = [[json.dumps(z) for z in zonas.tolist()], segundos, [f'"{f}"' for f in fechas]]
+        columnas += [np.char.mod("%.2f", muestras[sensor]).tolist() for sensor in consulta.sensores]
+        yield "".join("{" + ",".join(f'"{clave}":{valor}' for clave, valor in zip(claves, fila)) + "}\n"
+                      for fila in zip(*columnas)).encode("utf-8")
+
+
+class _Colector:
+    # Archivo de solo escritura que acumula lo que escribe pyarrow hasta que el generador lo entrega
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+        self.closed = False
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def vaciar(self):
+        datos = b"".join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _tabla_arrow(consulta, zonas, muestras):
+    columnas = {"zona": pa.array(zonas.tolist(), type=pa.string()),
+                "t": pa.array(muestras["t"]),
+                "fecha": pa.array(np.floor(muestras["t"] * 1000).astype("int64"), type=pa.timestamp("ms", tz="UTC"))}
+    for sensor in consulta.sensores:
+        columnas[sensor] = pa.array(muestras[sensor])
+    return pa.table(columnas)
+
+
+def _esquema_arrow(consulta):
+    campos = [("zona", pa.string()), ("t", pa.float64()), ("fecha", pa.timestamp("ms", tz="UTC"))]
+    return pa.schema(campos + [(sensor, pa.float32()) for sensor in consulta.sensores])
+
+
+def _arrow(consulta, bloques):
+    colector = _Colector()
+    with pa.ipc.new_stream(pa.PythonFile(colector, mode="w"), _esquema_arrow(consulta)) as escritor:
+        for zonas, muestras in bloques:
+            escritor.write_table(_tabla_arrow(consulta, zonas, muestras))
+            yield colector.vaciar()
+    yield colector.vaciar()
+
+
+def _parquet(consulta, bloques):
+    # Un row group por ventana; el pie del archivo sale al final
+    colector = _Colector()
+    with pq.ParquetWriter(pa.PythonFile(colector, mode="w"), _esquema_arrow(consulta)) as escritor:
+        for zonas, muestras in bloques:
+            escritor.write_table(_tabla_arrow(consulta, zonas, muestras))
+            yield colector.vaciar()
+    yield colector.vaciar()
+
+
+def _gzip(partes):
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for parte in partes:
+        comprimido = compresor.compress(parte)
+        if comprimido:
+            yield comprimido
+    yield compresor.flush()
+
+
+def exportar(consulta, ruta):
+    """(generador de bytes, encabezados, mimetype) de la página pedida."""
+    corte = consulta.fin_de_pagina()
+    serializar = {"csv": _csv, "ndjson": _ndjson, "arrow": _arrow, "parquet": _parquet}[consulta.formato]
+    cuerpo = serializar(consulta, _bloques_mezclados(consulta, corte))
+    encabezados = {"Cache-Control": "no-store", "X-Accel-Buffering": "no"}
+    if consulta.gzip:
+        cuerpo = _gzip(cuerpo)
+        encabezados["Content-Encoding"] = "gzip"
+    if corte < consulta.hasta:
+        encabezados["X-Siguiente-Desde"] = repr(corte)
+        encabezados["Link"] = f'<{consulta.url_siguiente(ruta, corte)}>; rel="next"'
+    extension = {"arrow": "arrows"}.get(consulta.formato, consulta.formato)
+    encabezados["Content-Disposition"] = f'attachment; filename="historial.{extension}"'
+    return cuerpo, encabezados, FORMATOS[consulta.formato]
@@ -0,0 +1,139 @@
+import os
+import signal
+import threading
+
+from alertas import REGLAS_POR_DEFECTO, MotorAlertas, anunciar, cargar_reglas
+from dispositivos import GestorDispositivos
+from memoria_compartida import PREFIJO, EscritorCompartido
+from metricas import recolector, registrar_ingesta, servir
+from publicacion import CAPACIDAD, PuenteMQTT, ServidorPublicacion
+
+# Lado de ingesta: configuración de las placas y proceso dedicado.
+#
+# app.py usa crear_gestor() para leer las placas dentro del mismo proceso
+# (modo "local", el de siempre). Para servir con varios procesos web se corre
+# esta ingesta aparte, que es la única dueña de los puertos serie y publica en
+# memoria compartida, y el tablero se arranca en modo "compartida":
+#
+#   python ingesta.py
+#   PROY_INGESTA=compartida gunicorn -w 4 -b 0.0.0.0:8050 --threads 8 app:server
+
+# Historial: buffer circular en memoria + segmentos en disco que sobreviven a reinicios.
+# Cada placa guarda el suyo en datos/<id de la placa>/
+DIRECTORIO_DATOS = os.environ.get("PROY_DATOS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos"))
+CAPACIDAD_MEMORIA = 86400  # muestras en la ventana caliente (~1 día a 1 Hz, 2 MB)
+FILAS_HISTORIAL = 10
+
+# Lectura serial: en POSIX el motor asyncio espera los bytes con el bucle de eventos;
+# en Windows usa este modo del lector ("bloqueante") dentro de un hilo del ejecutor.
+MODO_LECTURA = "bloqueante"
+INTERVALO_REPORTE = 60  # segundos entre reportes de rendimiento
+MAX_DISPOSITIVOS = 32
+
+# Tubería entre el lector y el almacén (ver tuberia.py): muestras por lote, espera
+# máxima para juntar un lote, tamaño de la cola y qué hacer cuando se llena
+TAMANO_LOTE = int(os.environ.get("PROY_TAMANO_LOTE", "256"))
+INTERVALO_LOTE = float(os.environ.get("PROY_INTERVALO_LOTE", "0"))
+CAPACIDAD_COLA = int(os.environ.get("PROY_CAPACIDAD_COLA", "65536"))
+POLITICA_COLA = os.environ.get("PROY_POLITICA_COLA", "descartar_viejas")
+
+# Anomalías de los sensores antes de guardar (ver anomalias.py): cuarentena | marcar | desactivado
+MODO_ANOMALIAS = os.environ.get("PROY_ANOMALIAS", "cuarentena")
+
+# Alertas (ver alertas.py): reglas de un JSON propio o las de siempre con los umbrales
+# de instantanea.py. Los cambios de nivel quedan registrados en datos/alertas.ndjson
+REGLAS_ALERTAS = os.environ.get("PROY_ALERTAS")
+REGISTRO_ALERTAS = os.path.join(DIRECTORIO_DATOS, "alertas.ndjson")
+
+# Salida de lecturas para otros programas (ver publicacion.py): direcciones separadas
+# por coma ("unix:/tmp/agroduino.sock,tcp:0.0.0.0:7070"), formato ndjson | msgpack,
+# registros por suscriptor y qué hacer con uno lento (desconectar | descartar).
+# PROY_MQTT=host[:puerto] agrega un puente a un broker MQTT bajo PROY_TEMA_MQTT
+PUBLICAR = os.environ.get("PROY_PUBLICAR", "")
+FORMATO_PUBLICACION = os.environ.get("PROY_FORMATO_PUBLICACION", "ndjson")
+CAPACIDAD_SUSCRIPTOR = int(os.environ.get("PROY_CAPACIDAD_SUSCRIPTOR", str(CAPACIDAD)))
+POLITICA_SUSCRIPTOR = os.environ.get("PROY_POLITICA_SUSCRIPTOR", "desconectar")
+MQTT = os.environ.get("PROY_MQTT")
+TEMA_MQTT = os.environ.get("PROY_TEMA_MQTT", "agroduino")
+
+# Placas simuladas para correr sin hardware (demo, CI, benchmarks): cantidad de
+# simuladores, su tasa en tramas/s y, opcionalmente, una captura grabada a repetir
+SIMULADORES = int(os.environ.get("PROY_SIMULADORES", "0"))
+TASA_SIMULADOR = float(os.environ.get("PROY_TASA_SIMULADOR", "1"))
+CAPTURA = os.environ.get("PROY_CAPTURA")
+
+# Nombre base de los segmentos de memoria compartida
+PREFIJO_MEMORIA = os.environ.get("PROY_MEMORIA", PREFIJO)
+
+# La ingesta dedicada no tiene servidor web: si se define, expone /metrics en este puerto
+PUERTO_METRICAS = int(os.environ.get("PROY_PUERTO_METRICAS", "0"))
+
+
+def crear_gestor(al_publicar):
+    gestor = GestorDispositivos(DIRECTORIO_DATOS, al_publicar, max_dispositivos=MAX_DISPOSITIVOS,
+                                filas_historial=FILAS_HISTORIAL, capacidad_memoria=CAPACIDAD_MEMORIA,
+                                modo_lectura=MODO_LECTURA, intervalo_reporte=INTERVALO_REPORTE,
+                                modo_anomalias=MODO_ANOMALIAS,
+                                opciones_tuberia={"tamano_lote": TAMANO_LOTE, "intervalo_lote": INTERVALO_LOTE,
+                                                  "capacidad": CAPACIDAD_COLA, "politica": POLITICA_COLA})
+    if SIMULADORES or CAPTURA:
+        from transportes import SimuladorSerial, ReproductorCaptura
+        for k in range(SIMULADORES):
+            gestor.agregar_transporte(SimuladorSerial(f"SIM{k}", tasa=TASA_SIMULADOR).iniciar())
+        if CAPTURA:
+            gestor.agregar_transporte(ReproductorCaptura(CAPTURA, tasa=TASA_SIMULADOR).iniciar())
+    registrar_ingesta(gestor)
+    return gestor
+
+
+def crear_alertas(registrar=True):
+    """Motor de alertas; con registrar=False no escribe el registro (procesos web en modo compartida)."""
+    reglas = cargar_reglas(REGLAS_ALERTAS) if REGLAS_ALERTAS else REGLAS_POR_DEFECTO
+    alertas = MotorAlertas(reglas, REGISTRO_ALERTAS if registrar else None)
+    if registrar:
+        alertas.suscribir(anunciar)
+    return alertas
+
+
+def conectar_salidas(gestor, alertas):
+    """Servidores de publicación y puente MQTT configurados, al final de la tubería."""
+    servidores = [ServidorPublicacion(direccion.strip(), FORMATO_PUBLICACION, CAPACIDAD_SUSCRIPTOR,
+                                      POLITICA_SUSCRIPTOR).iniciar()
+                  for direccion in PUBLICAR.split(",") if direccion.strip()]
+    salidas = list(servidores)
+    if MQTT:
+        puente = PuenteMQTT(MQTT, TEMA_MQTT, CAPACIDAD_SUSCRIPTOR).iniciar()
+        if puente is not None:
+            salidas.append(puente)
+    for salida in salidas:
+        gestor.agregar_consumidor(salida.publicar_lote)
+        alertas.suscribir(salida.publicar_alerta)
+    if servidores:
+        recolector("publicacion_suscriptores", "Programas conectados a cada salida de publicación",
+                   lambda: {(servidor.direccion,): len(servidor.suscriptores) for servidor in servidores}, ("salida",))
+    return salidas
+
+
+if __name__ == '__main__':
+    escritor = EscritorCompartido(PREFIJO_MEMORIA, capacidad=CAPACIDAD_MEMORIA, max_dispositivos=MAX_DISPOSITIVOS)
+    gestor = crear_gestor(escritor.al_publicar)
+    alertas = crear_alertas()
+    gestor.agregar_consumidor(alertas.evaluar_lote)
+    salidas = conectar_salidas(gestor, alertas)
+    gestor.iniciar()
+    print(f"✅ Ingesta publicando en memoria compartida '{PREFIJO_MEMORIA}'")
+    if PUERTO_METRICAS:
+        servir(PUERTO_METRICAS)
+        print(f"📈 Métricas en http://0.0.0.0:{PUERTO_METRICAS}/metrics")
+
+    fin = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: fin.set())
+    try:
+        fin.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gestor.detener()
+        for salida in salidas:
+            salida.detener()
+        escritor.cerrar()
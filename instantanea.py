@@ -0,0 +1,92 @@
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA
+
+# Instantánea inmutable y versionada del estado del tablero. La ingesta arma una
+# nueva con cada lectura y la publica reemplazando una sola referencia, así los
+# callbacks siempre ven un estado completo y coherente (nunca uno a medio
+# actualizar) y pueden memorizar su salida por instantánea.
+
+# Umbrales (bajo, alto) de cada sensor para los niveles derivados
+UMBRALES = {
+    "humedad": (30, 80),
+    "temperatura": (20, 30),
+    "humedad_ambiente": (40, 60),
+}
+
+
+def nivel(valor, bajo, alto):
+    if valor < bajo:
+        return "bajo"
+    if valor > alto:
+        return "alto"
+    return "optimo"
+
+
+# eq=False: el hash es por identidad, así sirve de clave para functools.lru_cache
+@dataclass(frozen=True, eq=False)
+class Instantanea:
+    version: int
+    t: float
+    conectado: bool
+    humedad: int
+    agua: int
+    temperatura: float
+    humedad_ambiente: float
+    nivel_humedad: str
+    nivel_temperatura: str
+    nivel_humedad_ambiente: str
+    historial: np.ndarray  # últimas muestras, de solo lectura
+
+
+def _solo_lectura(arreglo):
+    arreglo.setflags(write=False)
+    return arreglo
+
+
+def crear_instantanea(version, t, conectado, humedad, agua, temperatura, humedad_ambiente, historial):
+    return Instantanea(
+        version, t, conectado, humedad, agua, temperatura, humedad_ambiente,
+        nivel(humedad, *UMBRALES["humedad"]),
+        nivel(temperatura, *UMBRALES["temperatura"]),
+        nivel(humedad_ambiente, *UMBRALES["humedad_ambiente"]),
+        _solo_lectura(historial),
+    )
+
+
+def combinar_instantaneas(snaps, filas_historial):
+    """Vista agregada de varias zonas: promedio de las conectadas e historial combinado por instante."""
+    conectadas = [snap for snap in snaps if snap.conectado]
+    if snaps:
+        historial = np.concatenate([snap.historial for snap in snaps])
+        historial = historial[np.argsort(historial["t"], kind="stable")][-filas_historial:]
+    else:
+        historial = np.empty(0, dtype=DTYPE_MUESTRA)
+    instantes = [snap.t for snap in snaps if snap.t is not None]
+    if not conectadas:
+        return crear_instantanea(sum(snap.version for snap in snaps), max(instantes, default=None), False,
+                                 0, 0, 0.0, 0.0, historial)
+    n = len(conectadas)
+    humedad = round(sum(snap.humedad for snap in conectadas) / n)
+    return crear_instantanea(
+        sum(snap.version for snap in snaps), max(instantes, default=None), True,
+        humedad, humedad,
+        sum(snap.temperatura for snap in conectadas) / n,
+        sum(snap.humedad_ambiente for snap in conectadas) / n,
+        historial,
+    )
+
+
+class PublicadorInstantaneas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.actual = crear_instantanea(0, None, False, 0, 0, 0.0, 0.0, np.empty(0, dtype=DTYPE_MUESTRA))
+
+    def publicar(self, t, conectado, humedad, agua, temperatura, humedad_ambiente, historial):
+        with self._lock:
+            self.actual = crear_instantanea(self.actual.version + 1, t, conectado, humedad, agua,
+                                            temperatura, humedad_ambiente, historial)
+            return self.actual
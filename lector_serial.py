@@ -0,0 +1,133 @@
+import os
+import select
+import selectors
+import time
+
+# Lector de líneas por eventos: se despierta sólo cuando llegan bytes al puerto,
+# lee bloques completos en un buffer reutilizable y separa las líneas él mismo.
+
+MODOS_LECTURA = ("bloqueante", "selector")
+
+
+class LectorLineas:
+    def __init__(self, puerto, modo="bloqueante", tam_bloque=4096, max_linea=1024, espera=1.0):
+        if modo not in MODOS_LECTURA:
+            raise ValueError(f"Modo de lectura desconocido: {modo}")
+        if modo == "selector" and os.name != "posix":
+            # En Windows los puertos COM no se pueden registrar en un selector
+            modo = "bloqueante"
+        self.puerto = puerto
+        self.modo = modo
+        self.max_linea = max_linea
+        self.espera = espera
+        self._buffer = bytearray(tam_bloque)
+        self._vista = memoryview(self._buffer)
+        self._resto = bytearray()
+        self._selector = None
+        if modo == "selector":
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(puerto.fileno(), selectors.EVENT_READ)
+
+        # Contadores de rendimiento
+        self.lineas_totales = 0
+        self.bytes_totales = 0
+        self.lineas_descartadas = 0
+        self._ultimo_reporte = time.monotonic()
+        self._lineas_reporte = 0
+        self._bytes_reporte = 0
+
+    def _leer_listos(self):
+        # Lee sin bloquear lo que el sistema ya tiene en el buffer del puerto
+        disponibles = self.puerto.in_waiting
+        if disponibles == 0:
+            # El descriptor está listo pero sin datos: el puerto se cerró o desconectó
+            raise OSError("Puerto serial listo sin datos (¿desconectado?)")
+        n = min(disponibles, len(self._buffer))
+        return self.puerto.readinto(self._vista[:n])
+
+    def _leer_bloque(self):
+        # Devuelve cuántos bytes quedaron en el buffer (0 si venció la espera)
+        if self._selector is not None:
+            if not self._selector.select(self.espera):
+                return 0
+            return self._leer_listos()
+
+        # Modo bloqueante: read(1) duerme hasta que llega el primer byte o vence el timeout
+        primero = self.puerto.read(1)
+        if not primero:
+            return 0
+        self._buffer[0] = primero[0]
+        n = min(self.puerto.in_waiting, len(self._buffer) - 1)
+        if n > 0:
+            n = self.puerto.readinto(self._vista[1:1 + n])
+        return 1 + n
+
+    def leer_lineas(self):
+        """Espera datos y devuelve la lista de líneas completas (bytes, sin fin de línea)."""
+        return self._separar(self._leer_bloque())
+
+    def leer_disponibles(self):
+        """Como leer_lineas pero sin esperar, para cuando un bucle de eventos avisó que hay datos (POSIX)."""
+        fd = self.puerto.fileno()
+        try:
+            n = os.readv(fd, [self._vista])
+        except BlockingIOError:
+            n = 0
+        if n == 0:
+            # Un read vacío puede ser un aviso repetido (los datos ya se leyeron en el
+            # despertar anterior). Solo es desconexión si el descriptor sigue listo sin datos.
+            listos, _, _ = select.select([fd], [], [], 0)
+            if not listos:
+                return []
+            n = os.readv(fd, [self._vista])
+            if n == 0:
+                raise OSError("Puerto serial listo sin datos (¿desconectado?)")
+        return self._separar(n)
+
+    def _separar(self, n):
+        if n == 0:
+            return []
+        self.bytes_totales += n
+        self._bytes_reporte += n
+        self._resto += self._vista[:n]
+
+        fin = self._resto.rfind(b"\n")
+        if fin < 0:
+            if len(self._resto) > self.max_linea:
+                # Basura sin salto de línea: se descarta para no crecer sin límite
+                self.lineas_descartadas += 1
+                self._resto.clear()
+            return []
+
+        lineas = self._resto[:fin].split(b"\n")
+        del self._resto[:fin + 1]
+        lineas = [linea.rstrip(b"\r") for linea in lineas]
+        self.lineas_totales += len(lineas)
+        self._lineas_reporte += len(lineas)
+        return lineas
+
+    @property
+    def bytes_pendientes(self):
+        return len(self._resto)
+
+    def estadisticas(self):
+        """Rendimiento desde la última llamada: líneas/s, bytes/s y bytes de línea parcial."""
+        ahora = time.monotonic()
+        transcurrido = max(ahora - self._ultimo_reporte, 1e-9)
+        stats = {
+            "lineas_s": self._lineas_reporte / transcurrido,
+            "bytes_s": self._bytes_reporte / transcurrido,
+            "resto_bytes": len(self._resto),
+            "lineas_totales": self.lineas_totales,
+            "bytes_totales": self.bytes_totales,
+            "lineas_descartadas": self.lineas_descartadas,
+        }
+        self._ultimo_reporte = ahora
+        self._lineas_reporte = 0
+        self._bytes_reporte = 0
+        return stats
+
+    def cerrar(self):
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
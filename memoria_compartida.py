@@ -0,0 +1,447 @@
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from agregados import MotorAgregados
+from almacenamiento import DTYPE_MUESTRA, instante_actual
+from dispositivos import RECONECTANDO
+from instantanea import PublicadorInstantaneas
+from pronostico import Pronostico
+
+# Memoria compartida entre el proceso de ingesta y los procesos web.
+#
+# Solo el proceso de ingesta (ingesta.py) abre los puertos serie. Cada placa
+# escribe sus muestras en un anillo dentro de un segmento de memoria
+# compartida, y el proceso publica ahí también su último estado. Los procesos
+# web (varios workers de gunicorn, por ejemplo) mapean esos segmentos y los leen
+# sin copiar los datos por un socket.
+#
+# Un solo escritor por segmento. La coherencia se logra con un contador de
+# secuencia (seqlock): el escritor lo deja impar mientras escribe y par al
+# terminar. El lector repite la lectura si lo vio impar o si cambió en el medio.
+#
+# Segmentos:
+#   <prefijo>_indice      -> ids de las placas registradas
+#   <prefijo>_<id placa>  -> cabecera + anillo de muestras (DTYPE_MUESTRA)
+
+PREFIJO = "agroduino"
+
+DTYPE_CABECERA = np.dtype([
+    ("secuencia", "<u8"),
+    ("version", "<u8"),
+    ("siguiente", "<u8"),
+    ("cantidad", "<u8"),
+    ("capacidad", "<u8"),
+    ("t", "<f8"),            # instante de la última lectura publicada (nan si no hubo)
+    ("latido", "<f8"),       # última vez que el escritor tocó el segmento
+    ("estado", "S16"),
+    ("conectado", "u1"),
+    ("humedad", "<f4"),
+    ("temperatura", "<f4"),
+    ("humedad_ambiente", "<f4"),
+])
+TAM_CABECERA = 128
+
+DTYPE_INDICE = np.dtype([("secuencia", "<u8"), ("creado", "<f8"), ("cantidad", "<u4")])
+TAM_ID = 64
+
+_VACIO = np.empty(0, dtype=DTYPE_MUESTRA)
+
+
+def _adjuntar(nombre):
+    # Solo quien crea el segmento lo borra. Antes de Python 3.13 el resource_tracker
+    # también lo borraría al salir cualquier lector, así que se le quita el registro.
+    try:
+        return shared_memory.SharedMemory(name=nombre, track=False)
+    except TypeError:
+        segmento = shared_memory.SharedMemory(name=nombre)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segmento._name, "shared_memory")
+        return segmento
+
+
+def _crear(nombre, tam):
+    try:
+        viejo = shared_memory.SharedMemory(name=nombre)
+    except FileNotFoundError:
+        pass
+    else:
+        # Quedó de una ingesta anterior que no terminó bien
+        viejo.close()
+        viejo.unlink()
+    return shared_memory.SharedMemory(name=nombre, create=True, size=tam)
+
+
+def _leer_coherente(cabecera, funcion, intentos=1000):
+    for _ in range(intentos):
+        antes = int(cabecera["secuencia"])
+        if antes % 2 == 0:
+            resultado = funcion()
+            if int(cabecera["secuencia"]) == antes:
+                return resultado
+        time.sleep(0)
+    raise TimeoutError("El escritor de memoria compartida no suelta el segmento")
+
+
+class AnilloCompartido:
+    def __init__(self, segmento, creador=False):
+        self.segmento = segmento
+        self.creador = creador
+        self._cabecera = np.ndarray((), dtype=DTYPE_CABECERA, buffer=segmento.buf)
+        self.capacidad = int(self._cabecera["capacidad"])
+        self._datos = np.ndarray(self.capacidad, dtype=DTYPE_MUESTRA, buffer=segmento.buf, offset=TAM_CABECERA)
+        self._lock = threading.Lock()  # entre hilos del escritor
+
+    @classmethod
+    def crear(cls, nombre, capacidad):
+        segmento = _crear(nombre, TAM_CABECERA + capacidad * DTYPE_MUESTRA.itemsize)
+        cabecera = np.ndarray((), dtype=DTYPE_CABECERA, buffer=segmento.buf)
+        cabecera[...] = np.zeros((), dtype=DTYPE_CABECERA)
+        cabecera["capacidad"] = capacidad
+        cabecera["t"] = np.nan
+        return cls(segmento, creador=True)
+
+    @classmethod
+    def abrir(cls, nombre):
+        return cls(_adjuntar(nombre))
+
+    # --- escritura (solo el proceso de ingesta) -------------------------
+
+    def _escribir(self, funcion):
+        with self._lock:
+            cabecera = self._cabecera
+            cabecera["secuencia"] += 1
+            try:
+                funcion(cabecera)
+                cabecera["latido"] = time.time()
+            finally:
+                cabecera["secuencia"] += 1
+
+    def agregar(self, registros):
+        registros = registros[-self.capacidad:]
+
+        def escribir(cabecera):
+            siguiente = int(cabecera["siguiente"])
+            n = len(registros)
+            indices = (siguiente + np.arange(n)) % self.capacidad
+            self._datos[indices] = registros
+            cabecera["siguiente"] = (siguiente + n) % self.capacidad
+            cabecera["cantidad"] = min(int(cabecera["cantidad"]) + n, self.capacidad)
+        if len(registros):
+            self._escribir(escribir)
+
+    def publicar(self, estado, conectado, t, humedad, temperatura, humedad_ambiente):
+        def escribir(cabecera):
+            cabecera["version"] += 1
+            cabecera["estado"] = estado.encode("ascii")
+            cabecera["conectado"] = conectado
+            cabecera["t"] = np.nan if t is None else t
+            cabecera["humedad"] = humedad
+            cabecera["temperatura"] = temperatura
+            cabecera["humedad_ambiente"] = humedad_ambiente
+        self._escribir(escribir)
+
+    # --- lectura (cualquier proceso) ------------------------------------
+
+    def cabecera(self):
+        return _leer_coherente(self._cabecera, self._cabecera.copy)
+
+    @property
+    def version(self):
+        return int(self._cabecera["version"])
+
+    def __len__(self):
+        return int(self._cabecera["cantidad"])
+
+    def _tramos(self):
+        cantidad = int(self._cabecera["cantidad"])
+        siguiente = int(self._cabecera["siguiente"])
+        if cantidad < self.capacidad:
+            return (self._datos[:cantidad],)
+        return (self._datos[siguiente:], self._datos[:siguiente])
+
+    def ultimos(self, n):
+        """Copia de las últimas n muestras, de la más antigua a la más reciente."""
+        def leer():
+            cantidad = min(n, int(self._cabecera["cantidad"]))
+            if cantidad == 0:
+                return _VACIO
+            indices = (int(self._cabecera["siguiente"]) - cantidad + np.arange(cantidad)) % self.capacidad
+            return self._datos[indices]
+        return _leer_coherente(self._cabecera, leer)
+
+    def rango(self, desde, hasta, copiar=True):
+        # Con copiar=False puede devolver una vista sobre la memoria compartida: sin
+        # copia, pero solo vale hasta que el escritor dé la vuelta al anillo
+        def leer():
+            partes = []
+            for tramo in self._tramos():
+                t = tramo["t"]
+                inicio = np.searchsorted(t, desde, "left")
+                fin = np.searchsorted(t, hasta, "right")
+                if inicio < fin:
+                    partes.append(tramo[inicio:fin])
+            if not partes:
+                return _VACIO
+            if len(partes) == 1 and not copiar:
+                return partes[0]
+            return np.concatenate(partes)
+        return _leer_coherente(self._cabecera, leer)
+
+    def posteriores(self, t):
+        """Copia de las muestras con instante estrictamente mayor que t."""
+        return self.rango(np.nextafter(t, np.inf), np.inf)
+
+    def primer_instante(self):
+        def leer():
+            tramos = self._tramos()
+            return float(tramos[0]["t"][0]) if len(tramos[0]) else None
+        return _leer_coherente(self._cabecera, leer)
+
+    def cerrar(self):
+        # Las vistas numpy tienen que soltarse antes de cerrar el mapeo
+        self._cabecera = self._datos = None
+        self.segmento.close()
+        if self.creador:
+            self.segmento.unlink()
+
+
+class IndiceCompartido:
+    def __init__(self, segmento, max_dispositivos, creador=False):
+        self.segmento = segmento
+        self.creador = creador
+        self.max_dispositivos = max_dispositivos
+        self._cabecera = np.ndarray((), dtype=DTYPE_INDICE, buffer=segmento.buf)
+        self._ids = np.ndarray(max_dispositivos, dtype=f"S{TAM_ID}", buffer=segmento.buf,
+                               offset=DTYPE_INDICE.itemsize)
+
+    @classmethod
+    def crear(cls, prefijo, max_dispositivos):
+        segmento = _crear(f"{prefijo}_indice", DTYPE_INDICE.itemsize + max_dispositivos * TAM_ID)
+        cabecera = np.ndarray((), dtype=DTYPE_INDICE, buffer=segmento.buf)
+        cabecera[...] = np.zeros((), dtype=DTYPE_INDICE)
+        cabecera["creado"] = time.time()
+        return cls(segmento, max_dispositivos, creador=True)
+
+    @classmethod
+    def abrir(cls, prefijo):
+        segmento = _adjuntar(f"{prefijo}_indice")
+        return cls(segmento, (segmento.size - DTYPE_INDICE.itemsize) // TAM_ID)
+
+    @property
+    def creado(self):
+        return float(self._cabecera["creado"])
+
+    def registrar(self, id):
+        cabecera = self._cabecera
+        cantidad = int(cabecera["cantidad"])
+        if cantidad >= self.max_dispositivos:
+            raise ValueError(f"Índice de memoria compartida lleno ({self.max_dispositivos} placas)")
+        cabecera["secuencia"] += 1
+        self._ids[cantidad] = id.encode("ascii")
+        cabecera["cantidad"] = cantidad + 1
+        cabecera["secuencia"] += 1
+
+    def ids(self):
+        def leer():
+            return [id.decode("ascii") for id in self._ids[:int(self._cabecera["cantidad"])]]
+        return _leer_coherente(self._cabecera, leer)
+
+    def cerrar(self):
+        self._cabecera = self._ids = None
+        self.segmento.close()
+        if self.creador:
+            self.segmento.unlink()
+
+
+def nombre_segmento(prefijo, id):
+    return f"{prefijo}_{id}"
+
+
+# --- lado de la ingesta ---------------------------------------------------
+
+class EscritorCompartido:
+    """Espeja en memoria compartida lo que publica cada placa del GestorDispositivos."""
+
+    def __init__(self, prefijo=PREFIJO, capacidad=86400, max_dispositivos=32):
+        self.prefijo = prefijo
+        self.capacidad = capacidad
+        self.indice = IndiceCompartido.crear(prefijo, max_dispositivos)
+        self.anillos = {}
+        self._ultimo_t = {}
+        self._lock = threading.Lock()
+
+    def al_publicar(self, dispositivo, snap):
+        with self._lock:
+            anillo = self.anillos.get(dispositivo.id)
+            if anillo is None:
+                anillo = AnilloCompartido.crear(nombre_segmento(self.prefijo, dispositivo.id), self.capacidad)
+                # El anillo arranca con el historial que la placa ya trae de disco
+                historial = dispositivo.almacen.ultimos(self.capacidad)
+                anillo.agregar(historial)
+                self._ultimo_t[dispositivo.id] = float(historial["t"][-1]) if len(historial) else -np.inf
+                self.anillos[dispositivo.id] = anillo
+                self.indice.registrar(dispositivo.id)
+        # Del almacén y no de snap.historial: un lote de la tubería puede traer más filas que el historial
+        nuevas = dispositivo.almacen.memoria.rango(self._ultimo_t[dispositivo.id], np.inf)
+        nuevas = nuevas[nuevas["t"] > self._ultimo_t[dispositivo.id]]
+        if len(nuevas):
+            anillo.agregar(nuevas)
+            self._ultimo_t[dispositivo.id] = float(nuevas["t"][-1])
+        anillo.publicar(dispositivo.estado, snap.conectado, snap.t, snap.humedad, snap.temperatura,
+                        snap.humedad_ambiente)
+
+    def cerrar(self):
+        for anillo in self.anillos.values():
+            anillo.cerrar()
+        self.indice.cerrar()
+
+
+# --- lado web -------------------------------------------------------------
+
+class _AlmacenCompartido:
+    # Lo que el tablero usa de un Almacen, respaldado por el anillo compartido
+    def __init__(self, anillo):
+        self.memoria = anillo
+
+    def ultimos(self, n):
+        return self.memoria.ultimos(n)
+
+    def ventana(self, segundos, ahora=None, copiar=True):
+        if ahora is None:
+            ahora = instante_actual()
+        return self.memoria.rango(ahora - segundos, ahora, copiar)
+
+
+class DispositivoCompartido:
+    def __init__(self, id, anillo, filas_historial=10, directorio=None):
+        self.id = id
+        self.anillo = anillo
+        self.filas_historial = filas_historial
+        self.almacen = _AlmacenCompartido(anillo)
+        self.instantaneas = PublicadorInstantaneas()
+        # Cada proceso web lleva sus propios agregados y pronóstico, alimentados con las muestras
+        # del anillo; los agregados de rangos largos arrancan con lo anterior en disco
+        recientes = anillo.ultimos(anillo.capacidad)
+        self.agregados = MotorAgregados()
+        if directorio is not None and os.path.isdir(directorio):
+            self.agregados.cargar_historial(directorio, instante_actual(),
+                                            float(recientes["t"][0]) if len(recientes) else np.inf)
+        self.agregados.cargar(recientes)
+        self.pronostico = Pronostico()
+        self.pronostico.cargar(recientes)
+        ultimos = anillo.ultimos(1)
+        self._ultimo_t = float(ultimos["t"][0]) if len(ultimos) else -np.inf
+        self._version = -1
+        self.estado = RECONECTANDO
+
+    @property
+    def conectado(self):
+        return self.estado != RECONECTANDO
+
+    def sincronizar(self, consumidores=()):
+        """Trae lo nuevo del anillo; devuelve la instantánea si cambió algo, si no None."""
+        version = self.anillo.version
+        if version == self._version:
+            return None
+        cabecera = self.anillo.cabecera()
+        nuevas = self.anillo.posteriores(self._ultimo_t)
+        if len(nuevas):
+            self.agregados.agregar_lote(nuevas)
+            self.pronostico.agregar_lote(nuevas)
+            self._ultimo_t = float(nuevas["t"][-1])
+            # Las mismas etapas extra que en la tubería de la ingesta local (alertas...)
+            for consumidor in consumidores:
+                try:
+                    consumidor(self, nuevas, None)
+                except Exception as e:
+                    print(f"❌ Error en la etapa {getattr(consumidor, '__name__', consumidor)} con {self.id}: {e}")
+        self._version = int(cabecera["version"])
+        self.estado = cabecera["estado"].item().decode("ascii") or RECONECTANDO
+        t = float(cabecera["t"])
+        conectado = bool(cabecera["conectado"])
+        humedad = int(cabecera["humedad"])
+        return self.instantaneas.publicar(None if np.isnan(t) else t, conectado, humedad, humedad,
+                                          float(cabecera["temperatura"]), float(cabecera["humedad_ambiente"]),
+                                          self.anillo.ultimos(self.filas_historial))
+
+
+class LectorCompartido:
+    """Hace las veces de GestorDispositivos en un proceso web: mismas `dispositivos`, sin puertos."""
+
+    def __init__(self, al_publicar, prefijo=PREFIJO, filas_historial=10, intervalo=0.05, directorio_datos=None,
+                 **_opciones):
+        self.prefijo = prefijo
+        self.directorio_datos = directorio_datos
+        self.filas_historial = filas_historial
+        self.intervalo = intervalo
+        self.dispositivos = {}
+        self._al_publicar = al_publicar
+        self.consumidores = []
+        self._indice = None
+        self._creado = None
+        self._detener = threading.Event()
+
+    def iniciar(self, espera_inicial=0.0):
+        threading.Thread(target=self._vigilar, name="lector-compartido", daemon=True).start()
+        return len(self.dispositivos)
+
+    def detener(self):
+        self._detener.set()
+
+    def agregar_consumidor(self, consumidor):
+        self.consumidores.append(consumidor)
+
+    def _conectar_indice(self):
+        try:
+            indice = IndiceCompartido.abrir(self.prefijo)
+        except FileNotFoundError:
+            return False
+        if indice.creado != self._creado:
+            # Ingesta nueva (o reiniciada): los anillos viejos ya no se actualizan
+            if self._indice is not None:
+                self._indice.cerrar()
+            self._indice = indice
+            self._creado = indice.creado
+            viejos, self.dispositivos = self.dispositivos, {}
+            for dispositivo in viejos.values():
+                dispositivo.estado = RECONECTANDO
+                try:
+                    dispositivo.anillo.cerrar()
+                except BufferError:
+                    # Un callback todavía lee el anillo: el mapeo se suelta cuando termine
+                    pass
+        else:
+            indice.cerrar()
+        return True
+
+    def _vigilar(self):
+        ultimo_indice = 0.0
+        while not self._detener.is_set():
+            ahora = time.monotonic()
+            if self._indice is None or ahora - ultimo_indice >= 1.0:
+                # Cada segundo: ¿arrancó o se reinició la ingesta?, ¿hay placas nuevas?
+                ultimo_indice = ahora
+                if self._conectar_indice():
+                    for id in self._indice.ids():
+                        if id not in self.dispositivos:
+                            try:
+                                anillo = AnilloCompartido.abrir(nombre_segmento(self.prefijo, id))
+                            except FileNotFoundError:
+                                continue
+                            directorio = (os.path.join(self.directorio_datos, id)
+                                          if self.directorio_datos is not None else None)
+                            self.dispositivos = {**self.dispositivos,
+                                                 id: DispositivoCompartido(id, anillo, self.filas_historial, directorio)}
+            for dispositivo in list(self.dispositivos.values()):
+                try:
+                    snap = dispositivo.sincronizar(self.consumidores)
+                except TimeoutError as e:
+                    print(f"❌ Memoria compartida {dispositivo.id}: {e}")
+                    continue
+                if snap is not None:
+                    self._al_publicar(dispositivo, snap)
+            self._detener.wait(self.intervalo)
@@ -0,0 +1,233 @@
+import bisect
+import functools
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentación en formato de texto de Prometheus, sin dependencias.
+#
+#   Contador     se incrementa con cada evento (reconexiones, errores)
+#   Histograma   cuenta observaciones por cubeta (latencias, duración de callbacks)
+#   Recolector   valores que se leen recién al exponer: contadores que ya llevan
+#                el lector y el parser, profundidad de colas, memoria. Así el
+#                camino caliente (cada línea serial) no paga nada extra.
+#
+# app.py los expone en GET /metrics; la ingesta dedicada (python ingesta.py) en su
+# propio puerto con servir() si se define PROY_PUERTO_METRICAS.
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+PREFIJO = "agroduino"
+LIMITES_LATENCIA = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _etiquetas(nombres, valores, extra=""):
+    partes = [f'{nombre}="{_escapar(valor)}"' for nombre, valor in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = f"{PREFIJO}_{nombre}"
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+        lineas += self._lineas()
+        return "\n".join(lineas)
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores = {}
+
+    def inc(self, *etiquetas, cantidad=1):
+        with self._lock:
+            self._valores[etiquetas] = self._valores.get(etiquetas, 0) + cantidad
+
+    def _lineas(self):
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}" for clave, valor in valores.items()]
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+        self._series = {}  # etiquetas -> [cuentas por cubeta (la última es +Inf), suma]
+
+    def observar(self, valor, *etiquetas):
+        cubeta = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.limites) + 1), 0.0]
+            serie[0][cubeta] += 1
+            serie[1] += valor
+
+    def cronometrar(self, *etiquetas):
+        """Decorador que observa la duración de cada llamada (también si lanza una excepción)."""
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                inicio = time.perf_counter()
+                try:
+                    return funcion(*args, **kwargs)
+                finally:
+                    self.observar(time.perf_counter() - inicio, *etiquetas)
+            return envoltura
+        return decorador
+
+    def _lineas(self):
+        with self._lock:
+            series = {clave: (list(cuentas), suma) for clave, (cuentas, suma) in self._series.items()}
+        lineas = []
+        for clave, (cuentas, suma) in series.items():
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + (float("inf"),), cuentas):
+                acumulado += cuenta
+                le = 'le="' + _numero(limite) + '"'
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}")
+        return lineas
+
+
+class Recolector(_Metrica):
+    def __init__(self, nombre, ayuda, funcion, etiquetas=(), tipo="gauge"):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.tipo = tipo
+        # funcion() -> {tupla de etiquetas: valor}, o un número si no hay etiquetas
+        self.funcion = funcion
+
+    def _lineas(self):
+        valores = self.funcion()
+        if not isinstance(valores, dict):
+            valores = {(): valores}
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}" for clave, valor in valores.items()]
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica):
+        # Registrar de nuevo el mismo nombre reemplaza la anterior (p. ej. un gestor nuevo)
+        with self._lock:
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def exponer(self):
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return "\n".join(metrica.exponer() for metrica in metricas) + "\n"
+
+
+REGISTRO = Registro()
+
+
+def contador(nombre, ayuda, etiquetas=()):
+    return REGISTRO.registrar(Contador(nombre, ayuda, etiquetas))
+
+
+def histograma(nombre, ayuda, etiquetas=(), limites=LIMITES_LATENCIA):
+    return REGISTRO.registrar(Histograma(nombre, ayuda, etiquetas, limites))
+
+
+def recolector(nombre, ayuda, funcion, etiquetas=(), tipo="gauge"):
+    return REGISTRO.registrar(Recolector(nombre, ayuda, funcion, etiquetas, tipo))
+
+
+def memoria_residente():
+    # /proc da la memoria actual; donde no existe, el pico que informa getrusage
+    try:
+        with open("/proc/self/statm") as archivo:
+            return int(archivo.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico if os.uname().sysname == "Darwin" else pico * 1024
+
+
+recolector("memoria_residente_bytes", "Memoria residente del proceso", memoria_residente)
+
+
+# --- ingesta -------------------------------------------------------------
+
+reconexiones = contador("reconexiones_total", "Reaperturas del puerto tras perder la conexión", ("zona",))
+aperturas_fallidas = contador("aperturas_fallidas_total", "Intentos de abrir el puerto que fallaron", ("zona",))
+errores_lectura = contador("errores_lectura_total", "Errores de lectura serial", ("zona",))
+latencia_ingesta = histograma("serial_a_instantanea_segundos",
+                              "Desde que llegan los bytes al puerto hasta publicar la instantánea", ("zona",))
+
+
+def registrar_ingesta(gestor):
+    """Contadores y medidores de las placas de un GestorDispositivos, leídos al exponer."""
+    def por_zona(valor, solo_conectadas=False):
+        return lambda: {(id,): valor(d) for id, d in list(gestor.dispositivos.items())
+                        if d.conectado or not solo_conectadas}
+
+    recolector("lineas_leidas_total", "Líneas recibidas por el puerto serie",
+               por_zona(lambda d: d.lineas_leidas), ("zona",), "counter")
+    recolector("bytes_leidos_total", "Bytes recibidos por el puerto serie",
+               por_zona(lambda d: d.bytes_leidos), ("zona",), "counter")
+    recolector("tramas_validas_total", "Tramas reconocidas", por_zona(lambda d: d.parser.validas), ("zona",), "counter")
+    recolector("tramas_invalidas_total", "Tramas que no se pudieron parsear",
+               por_zona(lambda d: d.parser.invalidas), ("zona",), "counter")
+    recolector("segundos_sin_tramas", "Tiempo desde la última trama válida (retraso de ingesta)",
+               por_zona(lambda d: time.monotonic() - d.ultima_trama, solo_conectadas=True), ("zona",))
+    recolector("linea_parcial_bytes", "Bytes pendientes de una línea incompleta",
+               por_zona(lambda d: d.lector.bytes_pendientes if d.lector is not None else 0), ("zona",))
+    recolector("sensor_trabado", "1 si el sensor repite exactamente el mismo valor hace demasiado",
+               lambda: {(id, sensor): int(trabado) for id, d in list(gestor.dispositivos.items())
+                        for sensor, trabado in d.anomalias.trabados().items()}, ("zona", "sensor"))
+    recolector("cola_tuberia", "Muestras leídas que esperan a los consumidores de la tubería",
+               lambda: gestor.tuberia.pendientes)
+    recolector("cola_ejecutor", "Tareas esperando en el ejecutor serial (lecturas bloqueantes, escaneos)",
+               gestor.tareas_pendientes)
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        cuerpo = REGISTRO.exponer().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", TIPO_CONTENIDO)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def servir(puerto, host="0.0.0.0"):
+    """GET /metrics en un hilo propio, para procesos sin servidor web (la ingesta dedicada)."""
+    servidor = ThreadingHTTPServer((host, puerto), _Manejador)
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    return servidor
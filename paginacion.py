@@ -0,0 +1,285 @@
+import operator
+import os
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from almacenamiento import DTYPE_MUESTRA, contar_segmentos, kesimo_instante, vistas_segmentos
+from exportacion import ErrorConsulta
+
+# Tabla del historial paginada, ordenada y filtrada en el servidor (DataTable con
+# page_action='custom'): el navegador solo recibe las filas de la página visible,
+# así se puede recorrer el historial completo (millones de filas) sin mandarlo.
+#
+# Las filas salen del mismo almacén que el resto del tablero: lo reciente del buffer
+# en memoria y lo anterior de los segmentos en disco, abiertos con memmap.
+#   - Orden por hora sin filtros de valores: la página se ubica por posición con
+#     búsquedas binarias sobre la columna "t"; no se lee nada fuera de la página.
+#   - Orden por un sensor o con filtros de valores: se recorre el historial por
+#     bloques conservando solo las mejores `fin` filas (nunca más de la mitad del total).
+#
+# Filtros con la sintaxis de filter_query de Dash, unidos con &&:
+#   {humedad} > 30 && {temperatura} <= 25.5 && {timestamp} datestartswith 2026-10-17
+# La hora se compara por prefijo ("2026-10", "2026-10-17 08") y los sensores con el
+# valor tal como se muestra en la tabla.
+
+COLUMNA_HORA = "timestamp"
+COLUMNA_ZONA = "zona"
+SENSORES = ("humedad", "agua", "temperatura", "humedad_ambiente")
+ENTEROS = ("humedad", "agua")  # la tabla los muestra truncados
+BLOQUE = 65536
+
+_OPERADORES = {
+    ">=": operator.ge, "ge": operator.ge, "<=": operator.le, "le": operator.le,
+    ">": operator.gt, "gt": operator.gt, "<": operator.lt, "lt": operator.lt,
+    "!=": operator.ne, "ne": operator.ne, "=": operator.eq, "eq": operator.eq,
+    "contains": None, "datestartswith": None,
+}
+_PARTE = re.compile(r"^\s*\{(?P<columna>[^}]+)\}\s*[is]?(?P<operador>>=|<=|!=|>|<|=|ge|le|gt|lt|ne|eq|contains|datestartswith)"
+                    r"\s*(?P<valor>.*?)\s*$")
+# Formato de prefijo -> largo del intervalo que abarca (años y meses se calculan aparte)
+_PREFIJOS = {"%Y": None, "%Y-%m": None, "%Y-%m-%d": timedelta(days=1), "%Y-%m-%d %H": timedelta(hours=1),
+             "%Y-%m-%d %H:%M": timedelta(minutes=1), "%Y-%m-%d %H:%M:%S": timedelta(seconds=1)}
+
+
+def _sin_comillas(valor):
+    if len(valor) >= 2 and valor[0] == valor[-1] and valor[0] in "'\"`":
+        return valor[1:-1].replace("\\" + valor[0], valor[0])
+    return valor
+
+
+def _intervalo_prefijo(texto):
+    # "2026-10-17" -> [00:00 de ese día, 00:00 del siguiente), en hora local como la tabla
+    texto = texto.strip().replace("T", " ")
+    for formato, largo in _PREFIJOS.items():
+        try:
+            inicio = datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+        if formato == "%Y":
+            fin = inicio.replace(year=inicio.year + 1)
+        elif formato == "%Y-%m":
+            fin = inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+        else:
+            fin = inicio + largo
+        return inicio.timestamp(), fin.timestamp()
+    raise ErrorConsulta(f"Fecha inválida: {texto}")
+
+
+def valores_mostrados(muestras, campo):
+    """La columna como la muestra la tabla: los filtros comparan contra lo que se ve."""
+    if campo in ENTEROS:
+        return muestras[campo].astype(int)
+    return np.round(muestras[campo].astype(float), 2)
+
+
+class Filtro:
+    def __init__(self, filter_query):
+        self.desde = -np.inf
+        self.hasta = np.inf
+        self.zonas = []       # (operador, texto) sobre el id de la placa
+        self.condiciones = []  # (campo, operador, valor) sobre los sensores
+        for parte in (filter_query or "").split(" && "):
+            if parte.strip():
+                self._agregar(parte)
+
+    def _agregar(self, parte):
+        encontrado = _PARTE.match(parte)
+        if not encontrado:
+            raise ErrorConsulta(f"Filtro inválido: {parte}")
+        columna, nombre = encontrado["columna"], encontrado["operador"]
+        valor = _sin_comillas(encontrado["valor"])
+        if columna == COLUMNA_HORA:
+            # Cada operador se traduce a un borde del intervalo de tiempo pedido
+            inicio, fin = _intervalo_prefijo(valor)
+            if nombre in ("=", "eq", "contains", "datestartswith"):
+                self.desde, self.hasta = max(self.desde, inicio), min(self.hasta, fin)
+            elif nombre in (">", "gt"):
+                self.desde = max(self.desde, fin)
+            elif nombre in (">=", "ge"):
+                self.desde = max(self.desde, inicio)
+            elif nombre in ("<", "lt"):
+                self.hasta = min(self.hasta, inicio)
+            elif nombre in ("<=", "le"):
+                self.hasta = min(self.hasta, fin)
+            else:
+                raise ErrorConsulta(f"Operador '{nombre}' no disponible para la hora")
+        elif columna == COLUMNA_ZONA:
+            if nombre not in ("=", "eq", "!=", "ne", "contains"):
+                raise ErrorConsulta(f"Operador '{nombre}' no disponible para la zona")
+            self.zonas.append((nombre, valor))
+        elif columna in SENSORES:
+            funcion = _OPERADORES[nombre]
+            if funcion is None:
+                raise ErrorConsulta(f"Operador '{nombre}' no disponible para {columna}")
+            try:
+                self.condiciones.append((columna, funcion, float(valor)))
+            except ValueError:
+                raise ErrorConsulta(f"Valor inválido para {columna}: {valor}")
+        else:
+            raise ErrorConsulta(f"Columna desconocida: {columna}")
+
+    def acepta_zona(self, zona):
+        for nombre, texto in self.zonas:
+            if nombre == "contains":
+                if texto not in zona:
+                    return False
+            elif (zona == texto) != (nombre in ("=", "eq")):
+                return False
+        return True
+
+    def mascara(self, muestras):
+        mascara = np.ones(len(muestras), dtype=bool)
+        for campo, funcion, valor in self.condiciones:
+            mascara &= funcion(valores_mostrados(muestras, campo), valor)
+        return mascara
+
+
+class _Fuentes:
+    # Vistas ordenadas por t de cada zona: segmentos en disco y, al final, lo reciente del buffer
+    def __init__(self, dispositivos, directorio_datos, desde, hasta):
+        self.ids = []
+        self.vistas = []
+        self.zonas = []
+        for dispositivo in sorted(dispositivos, key=lambda d: d.id):
+            reciente = dispositivo.almacen.memoria.rango(desde, hasta)
+            reciente = reciente[:np.searchsorted(reciente["t"], hasta, "left")]
+            # El disco aporta solo lo anterior al buffer (lo demás ya está en memoria)
+            directorio = os.path.join(directorio_datos, dispositivo.id)
+            limite = float(reciente["t"][0]) if len(reciente) else hasta
+            for vista in vistas_segmentos(directorio, desde, limite):
+                self._sumar(len(self.ids), vista)
+            if len(reciente):
+                # Con el reloj hacia atrás varias filas comparten el instante del borde: las
+                # del buffer son las últimas en disco con ese instante, el resto solo está ahí
+                empates = list(vistas_segmentos(directorio, limite, np.nextafter(limite, np.inf)))
+                solo_disco = sum(len(vista) for vista in empates) - int(np.searchsorted(reciente["t"], limite, "right"))
+                for vista in empates:
+                    if solo_disco <= 0:
+                        break
+                    self._sumar(len(self.ids), vista[:solo_disco])
+                    solo_disco -= len(vista)
+            if len(reciente):
+                self._sumar(len(self.ids), reciente)
+            self.ids.append(dispositivo.id)
+
+    def _sumar(self, zona, vista):
+        self.vistas.append(vista)
+        self.zonas.append(zona)
+
+    def total(self):
+        return sum(len(vista) for vista in self.vistas)
+
+    def bloques(self):
+        # (zona, muestras) de a lo sumo BLOQUE filas, ya copiadas a memoria
+        for zona, vista in zip(self.zonas, self.vistas):
+            for k in range(0, len(vista), BLOQUE):
+                yield zona, np.array(vista[k:k + BLOQUE])
+
+
+def _pagina_por_hora(fuentes, inicio, fin):
+    # Filas [inicio, fin) en orden ascendente por (t, zona, llegada) sin recorrer el historial
+    tiempos = [vista["t"] for vista in fuentes.vistas]
+    primero = kesimo_instante(tiempos, inicio)
+    ultimo = kesimo_instante(tiempos, fin - 1)
+    antes, partes, zonas = 0, [], []
+    for zona, vista, t in zip(fuentes.zonas, fuentes.vistas, tiempos):
+        desde = int(np.searchsorted(t, primero, "left"))
+        hasta = int(np.searchsorted(t, ultimo, "right"))
+        antes += desde
+        if desde < hasta:
+            partes.append(np.array(vista[desde:hasta]))
+            zonas.append(np.full(hasta - desde, zona))
+    muestras = np.concatenate(partes)
+    zonas = np.concatenate(zonas)
+    orden = np.lexsort((zonas, muestras["t"]))[inicio - antes:fin - antes]
+    return zonas[orden], muestras[orden]
+
+
+def _orden(columna, zonas, muestras, secuencia, descendente):
+    # Orden total: columna, hora, zona y llegada; así cada fila cae siempre en la misma página
+    claves = [secuencia, zonas, muestras["t"]]
+    if columna == COLUMNA_ZONA:
+        claves = [secuencia, muestras["t"], zonas]
+    elif columna in SENSORES:
+        claves.append(muestras[columna])
+    orden = np.lexsort(claves)
+    return orden[::-1] if descendente else orden
+
+
+def _pagina_recorrida(fuentes, filtro, columna, descendente, inicio, fin, total):
+    # Las mejores `fin` filas se conservan mientras se recorren los bloques; si la página
+    # está en la segunda mitad se busca desde el otro extremo, con el orden invertido
+    invertir = inicio > total - fin
+    if invertir:
+        inicio, fin, descendente = max(total - fin, 0), total - inicio, not descendente
+    zonas = np.empty(0, dtype=np.intp)
+    muestras = np.empty(0, dtype=DTYPE_MUESTRA)
+    secuencia = np.empty(0, dtype=np.int64)
+    leidas = 0
+    for zona, bloque in fuentes.bloques():
+        mascara = filtro.mascara(bloque)
+        zonas = np.concatenate((zonas, np.full(int(mascara.sum()), zona)))
+        muestras = np.concatenate((muestras, bloque[mascara]))
+        secuencia = np.concatenate((secuencia, leidas + np.flatnonzero(mascara)))
+        leidas += len(bloque)
+        if len(muestras) > fin:
+            mejores = _orden(columna, zonas, muestras, secuencia, descendente)[:fin]
+            zonas, muestras, secuencia = zonas[mejores], muestras[mejores], secuencia[mejores]
+    orden = _orden(columna, zonas, muestras, secuencia, descendente)[inicio:fin]
+    if invertir:
+        orden = orden[::-1]
+    return zonas[orden], muestras[orden]
+
+
+def consultar(dispositivos, directorio_datos, filter_query, sort_by, inicio, fin, corte):
+    """(ids de zona, muestras, total): las filas [inicio, fin) de la tabla con ese filtro y
+    orden, entre lo ingresado antes de `corte` (así las páginas no se corren al llegar datos)."""
+    filtro = Filtro(filter_query)
+    dispositivos = [d for d in dispositivos if filtro.acepta_zona(d.id)]
+    fuentes = _Fuentes(dispositivos, directorio_datos, filtro.desde, min(filtro.hasta, corte))
+    orden = (sort_by or [{"column_id": COLUMNA_HORA, "direction": "desc"}])[0]
+    columna, descendente = orden["column_id"], orden["direction"] == "desc"
+    if filtro.condiciones:
+        total = sum(int(filtro.mascara(bloque).sum()) for _, bloque in fuentes.bloques())
+    else:
+        total = fuentes.total()
+    fin = min(fin, total)
+    if inicio >= fin:
+        return [], np.empty(0, dtype=DTYPE_MUESTRA), total
+    if columna == COLUMNA_HORA and not filtro.condiciones:
+        if descendente:
+            zonas, muestras = _pagina_por_hora(fuentes, total - fin, total - inicio)
+            zonas, muestras = zonas[::-1], muestras[::-1]
+        else:
+            zonas, muestras = _pagina_por_hora(fuentes, inicio, fin)
+    else:
+        zonas, muestras = _pagina_recorrida(fuentes, filtro, columna, descendente, inicio, fin, total)
+    return [fuentes.ids[zona] for zona in zonas], muestras, total
+
+
+def recientes(dispositivos, directorio_datos, n):
+    """(ids de zona, muestras, total) de las n filas más nuevas, de la más nueva a la más
+    vieja, leyendo solo el final de cada buffer. None si algún buffer no alcanza."""
+    ids, partes, zonas, total = [], [], [], 0
+    for dispositivo in sorted(dispositivos, key=lambda d: d.id):
+        memoria = dispositivo.almacen.memoria
+        ultimas = memoria.ultimos(n)
+        primero = memoria.primer_instante()
+        en_disco = 0 if primero is None else \
+            contar_segmentos(os.path.join(directorio_datos, dispositivo.id), -np.inf, primero)
+        if en_disco and len(ultimas) < n:
+            # El buffer no tiene n filas pero hay historial más viejo en disco
+            return None
+        total += en_disco + len(memoria)
+        partes.append(ultimas)
+        zonas.append(np.full(len(ultimas), len(ids)))
+        ids.append(dispositivo.id)
+    if not partes:
+        return [], np.empty(0, dtype=DTYPE_MUESTRA), 0
+    muestras = np.concatenate(partes)
+    zonas = np.concatenate(zonas)
+    # Mismo orden que consultar(): hora, zona y llegada, de atrás para adelante
+    orden = np.lexsort((zonas, muestras["t"]))[::-1][:n]
+    return [ids[zona] for zona in zonas[orden]], muestras[orden], total
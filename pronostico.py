@@ -0,0 +1,211 @@
+import math
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from almacenamiento import instante_actual
+from instantanea import UMBRALES
+
+# Pronóstico de la humedad del suelo para la tarjeta de riego, actualizado con cada
+# muestra en O(1) (amortizado) en lugar de recorrer la última hora en cada tick:
+#
+#   tasa de secado    suavizado exponencial doble (Holt): un nivel con constante de
+#                     tiempo TAU_NIVEL y su pendiente con TAU_SECADO
+#   regresión         recta de mínimos cuadrados sobre los últimos VENTANA_REGRESION
+#                     segundos: da la humedad actual sin el ruido de una lectura entera
+#   lecturas óptimas  contador de la última hora que suma al entrar una muestra y
+#                     resta al salir de la ventana (también si la zona dejó de reportar)
+#
+# Las muestras se juntan en cubetas de RESOLUCION segundos (n, suma, óptimas): las
+# ventanas guardan a lo sumo una entrada por segundo sin importar la tasa de la placa.
+# Con eso se estima cuánto falta para que el suelo llegue a HUMEDAD_SECA y cuántos
+# minutos de riego hacen falta para volver a HUMEDAD_OBJETIVO.
+
+HUMEDAD_SECA, HUMEDAD_SATURADA = UMBRALES["humedad"]
+HUMEDAD_OBJETIVO = HUMEDAD_SECA
+# Cuánto sube la humedad regando (%/min); por defecto la regla de siempre, 2 min por punto
+TASA_RIEGO = float(os.environ.get("PROY_TASA_RIEGO", "0.5"))
+TAU_NIVEL = 60.0
+TAU_SECADO = 900.0
+VENTANA_REGRESION = 600.0
+VENTANA_OPTIMAS = 3600.0
+RESOLUCION = 1.0
+MIN_CUBETAS_REGRESION = 60
+PESO_MINIMO = 0.5  # la tendencia suavizada se usa después de ~TAU_SECADO * ln 2 de historia
+TASA_MINIMA = 1e-3  # %/min; por debajo se considera que no se está secando
+
+
+@dataclass(frozen=True)
+class Estimacion:
+    humedad: float                       # actual según la regresión (o la última lectura)
+    tasa_secado: float                   # %/min; positiva si el suelo se seca
+    minutos_hasta_seco: Optional[float]  # None si no se está secando
+    minutos_riego: float                 # 0 si no hace falta regar
+    optimas: int                         # lecturas en el rango óptimo en la última hora
+
+
+class Pronostico:
+    def __init__(self, tau_nivel=TAU_NIVEL, tau=TAU_SECADO, ventana_regresion=VENTANA_REGRESION,
+                 ventana_optimas=VENTANA_OPTIMAS, resolucion=RESOLUCION):
+        self.tau_nivel = tau_nivel
+        self.tau = tau
+        self.ventana_regresion = ventana_regresion
+        self.ventana_optimas = ventana_optimas
+        self.resolucion = resolucion
+        # Última muestra, nivel suavizado y su pendiente (con corrección del arranque en cero)
+        self._t = None
+        self._h = None
+        self._nivel = None
+        self._pendiente = 0.0
+        self._peso = 0.0
+        # Cubeta abierta
+        self._cubeta = None
+        self._n = 0
+        self._suma = 0.0
+        self._optimas = 0
+        # Cubetas cerradas: (inicio, n, suma) para la regresión y (inicio, óptimas) para el contador
+        self._regresion = deque()
+        self._cuenta = deque()
+        # Sumas ponderadas Σw, Σwx, Σwy, Σwx², Σwxy con x relativo a _origen
+        self._origen = 0.0
+        self._sumas = [0.0] * 5
+        self._retiradas = 0
+        self.optimas = 0
+        self._lock = threading.Lock()
+
+    def agregar(self, t, humedad):
+        with self._lock:
+            self._agregar(t, humedad)
+
+    def agregar_lote(self, muestras):
+        columnas = (muestras["t"].tolist(), muestras["humedad"].tolist())
+        with self._lock:
+            for t, humedad in zip(*columnas):
+                self._agregar(t, humedad)
+
+    def _agregar(self, t, humedad):
+        if self._nivel is None:
+            self._nivel = humedad
+        elif t > self._t:
+            dt = t - self._t
+            previsto = self._nivel + self._pendiente * dt
+            nivel = previsto + (1.0 - math.exp(-dt / self.tau_nivel)) * (humedad - previsto)
+            beta = 1.0 - math.exp(-dt / self.tau)
+            self._pendiente += beta * ((nivel - self._nivel) / dt - self._pendiente)
+            self._peso += beta * (1.0 - self._peso)
+            self._nivel = nivel
+        self._t, self._h = t, humedad
+        cubeta = math.floor(t / self.resolucion) * self.resolucion
+        if cubeta != self._cubeta:
+            self._cerrar()
+            self._cubeta = cubeta
+        self._n += 1
+        self._suma += humedad
+        self._optimas += HUMEDAD_SECA <= humedad <= HUMEDAD_SATURADA
+
+    def _cerrar(self):
+        if self._n == 0:
+            return
+        self._regresion.append((self._cubeta, self._n, self._suma))
+        self._sumar(self._cubeta, self._n, self._suma, 1)
+        self._cuenta.append((self._cubeta, self._optimas))
+        self.optimas += self._optimas
+        self._n, self._suma, self._optimas = 0, 0.0, 0
+        # Lo que salió de las ventanas se resta
+        while self._regresion and self._cubeta - self._regresion[0][0] > self.ventana_regresion:
+            self._sumar(*self._regresion.popleft(), -1)
+            self._retiradas += 1
+        while self._cuenta and self._cubeta - self._cuenta[0][0] > self.ventana_optimas:
+            self.optimas -= self._cuenta.popleft()[1]
+        # Sumar y restar acumula error de redondeo: se rehacen las sumas cada tantas
+        # cubetas como tiene la ventana (sigue siendo O(1) amortizado)
+        if self._retiradas > len(self._regresion):
+            self._recalcular()
+
+    def _sumar(self, inicio, n, suma, signo, sumas=None):
+        sumas = self._sumas if sumas is None else sumas
+        x = inicio - self._origen
+        sumas[0] += signo * n
+        sumas[1] += signo * n * x
+        sumas[2] += signo * suma
+        sumas[3] += signo * n * x * x
+        sumas[4] += signo * x * suma
+
+    def _recalcular(self):
+        self._origen = self._regresion[0][0] if self._regresion else (self._cubeta or 0.0)
+        self._sumas = [0.0] * 5
+        for cubeta in self._regresion:
+            self._sumar(*cubeta, 1)
+        self._retiradas = 0
+
+    def cargar(self, muestras):
+        """Arranca el pronóstico con la historia reciente (muestras ordenadas por t), sin recorrerla de a una."""
+        if len(muestras) == 0:
+            return
+        t = muestras["t"]
+        muestras = muestras[np.searchsorted(t, t[-1] - self.ventana_optimas - self.resolucion, "left"):]
+        t = muestras["t"].astype(np.float64)
+        humedad = muestras["humedad"].astype(np.float64)
+        cubetas = np.floor(t / self.resolucion) * self.resolucion
+        bordes = np.concatenate(([0], np.flatnonzero(np.diff(cubetas)) + 1))
+        n = np.diff(np.append(bordes, len(muestras)))
+        sumas = np.add.reduceat(humedad, bordes)
+        optimas = np.add.reduceat(((humedad >= HUMEDAD_SECA) & (humedad <= HUMEDAD_SATURADA)).astype(np.int64), bordes)
+        # La pendiente inicial sale de una recta sobre los últimos TAU_SECADO segundos
+        recientes = t >= t[-1] - self.tau
+        pendiente = 0.0
+        if np.ptp(t[recientes]) > 0:
+            pendiente = float(np.polyfit(t[recientes] - t[-1], humedad[recientes], 1)[0])
+        with self._lock:
+            for inicio, cantidad, suma, buenas in zip(cubetas[bordes].tolist(), n.tolist(), sumas.tolist(),
+                                                      optimas.tolist()):
+                self._cerrar()
+                self._cubeta, self._n, self._suma, self._optimas = inicio, cantidad, suma, buenas
+            self._t, self._h = float(t[-1]), float(humedad[-1])
+            self._nivel = float(humedad[t >= t[-1] - self.tau_nivel].mean())
+            self._peso = 1.0 - math.exp(-np.ptp(t[recientes]) / self.tau)
+            self._pendiente = pendiente * self._peso
+            self._recalcular()
+
+    def estimar(self, ahora=None):
+        ahora = instante_actual() if ahora is None else ahora
+        with self._lock:
+            if self._t is None:
+                return None
+            # La última hora se cuenta hasta ahora, no hasta la última muestra
+            while self._cuenta and ahora - self._cuenta[0][0] > self.ventana_optimas:
+                self.optimas -= self._cuenta.popleft()[1]
+            sumas = list(self._sumas)
+            if self._n:
+                self._sumar(self._cubeta, self._n, self._suma, 1, sumas)
+            cubetas = len(self._regresion) + (self._n > 0)
+            humedad = self._h
+            w, wx, wy, wxx, wxy = sumas
+            denominador = w * wxx - wx * wx
+            if cubetas >= MIN_CUBETAS_REGRESION and denominador > 0:
+                pendiente = (w * wxy - wx * wy) / denominador
+                humedad = (wy - pendiente * wx) / w + pendiente * (self._t - self._origen)
+                humedad = min(max(humedad, 0.0), 100.0)
+            else:
+                pendiente = None
+            # La pendiente suavizada es más estable que la recta de la ventana; mientras
+            # tiene poca historia se usa la recta y, sin ninguna de las dos, no hay pronóstico
+            if self._peso >= PESO_MINIMO:
+                tasa = -self._pendiente / self._peso * 60
+            else:
+                tasa = -pendiente * 60 if pendiente is not None else 0.0
+            optimas = self.optimas + (self._optimas if ahora - self._cubeta <= self.ventana_optimas else 0)
+        if humedad <= HUMEDAD_SECA:
+            hasta_seco = 0.0
+        elif tasa > TASA_MINIMA:
+            hasta_seco = (humedad - HUMEDAD_SECA) / tasa
+        else:
+            hasta_seco = None
+        # Mientras se riega el suelo se sigue secando
+        deficit = HUMEDAD_OBJETIVO - humedad
+        riego = deficit / max(TASA_RIEGO - max(tasa, 0.0), 0.1 * TASA_RIEGO) if deficit > 0 else 0.0
+        return Estimacion(humedad, tasa, hasta_seco, riego, optimas)
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+
+from metricas import contador
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None
+
+# Salida de lecturas para otros programas (controlador de riego, registradores...),
+# como última etapa de la tubería de ingesta:
+#
+#   ServidorPublicacion  socket Unix ("unix:/ruta.sock") o TCP ("tcp:host:puerto") que
+#                        manda a cada suscriptor un registro por muestra y por cambio
+#                        de alerta, en NDJSON o MessagePack (si está instalado msgpack)
+#   PuenteMQTT           publica lo mismo en un broker MQTT (paho-mqtt opcional):
+#                        <tema>/<zona>/muestras y <tema>/<zona>/alertas
+#
+# Cada lote se serializa una sola vez y se reparte a las colas de los suscriptores
+# desde un bucle asyncio propio: la tubería nunca espera a un suscriptor. Cada cola
+# está acotada a `capacidad` registros; cuando un suscriptor lento la llena, según la
+# política se lo desconecta ("desconectar", por defecto: puede reconectarse) o se
+# tiran sus registros más viejos ("descartar").
+#
+#   python publicacion.py unix:/tmp/agroduino.sock    muestra el flujo en la consola
+
+FORMATOS = ("ndjson", "msgpack")
+POLITICAS = ("desconectar", "descartar")
+CAPACIDAD = 4096
+CAMPOS = ("humedad", "agua", "temperatura", "humedad_ambiente")
+
+descartados = contador("publicacion_descartados_total", "Registros que no llegaron a un suscriptor lento",
+                       ("salida", "politica"))
+desconectados = contador("publicacion_desconectados_total", "Suscriptores cortados por no leer a tiempo", ("salida",))
+
+
+def leer_direccion(direccion):
+    """("unix", ruta) o ("tcp", (host, puerto)); sin prefijo se toma host:puerto TCP."""
+    tipo, _, resto = direccion.partition(":")
+    if tipo == "unix":
+        return "unix", resto
+    if tipo != "tcp":
+        resto = direccion
+    host, _, puerto = resto.rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(puerto))
+
+
+def registros_muestras(zona, muestras):
+    columnas = [muestras["t"].tolist()] + [muestras[campo].tolist() for campo in CAMPOS]
+    for fila in zip(*columnas):
+        registro = {"tipo": "muestra", "zona": zona, "t": round(fila[0], 3)}
+        registro.update(zip(CAMPOS, (round(valor, 2) for valor in fila[1:])))
+        yield registro
+
+
+def serializar_muestras(zona, muestras, formato):
+    if formato == "msgpack":
+        return serializar(registros_muestras(zona, muestras), formato)
+    # Como en exportacion.py: columnas formateadas por numpy y una sola unión de texto
+    prefijo = '{"tipo":"muestra","zona":' + json.dumps(zona) + ',"t":'
+    columnas = [np.char.mod("%.3f", muestras["t"]).tolist()]
+    columnas += [np.char.mod("%.2f", muestras[campo]).tolist() for campo in CAMPOS]
+    claves = [f',"{campo}":' for campo in CAMPOS]
+    return "".join(prefijo + fila[0] + "".join(clave + valor for clave, valor in zip(claves, fila[1:])) + "}\n"
+                   for fila in zip(*columnas)).encode("utf-8")
+
+
+def registro_alerta(transicion):
+    return {"tipo": "alerta", **transicion}
+
+
+def serializar(registros, formato):
+    if formato == "msgpack":
+        empaquetar = msgpack.Packer().pack
+        return b"".join(empaquetar(registro) for registro in registros)
+    return "".join(json.dumps(registro, separators=(",", ":")) + "\n" for registro in registros).encode("utf-8")
+
+
+class _Suscriptor:
+    __slots__ = ("escritor", "cola", "pendientes", "evento", "cerrado")
+
+    def __init__(self, escritor):
+        self.escritor = escritor
+        self.cola = deque()  # (bytes, registros)
+        self.pendientes = 0
+        self.evento = asyncio.Event()
+        self.cerrado = False
+
+
+class ServidorPublicacion:
+    def __init__(self, direccion, formato="ndjson", capacidad=CAPACIDAD, politica="desconectar"):
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato de publicación desconocido: {formato}")
+        if formato == "msgpack" and msgpack is None:
+            raise ValueError("El formato msgpack necesita el paquete msgpack instalado")
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de suscriptores desconocida: {politica}")
+        self.direccion = direccion
+        self.tipo, self.destino = leer_direccion(direccion)
+        self.formato = formato
+        self.capacidad = capacidad
+        self.politica = politica
+        self.suscriptores = set()
+        self._loop = None
+        self._servidor = None
+
+    # --- ciclo de vida -------------------------------------------------
+
+    def iniciar(self, timeout=5.0):
+        listo = threading.Event()
+        threading.Thread(target=lambda: asyncio.run(self._principal(listo)), name="publicacion",
+                         daemon=True).start()
+        if not listo.wait(timeout) or self._servidor is None:
+            raise OSError(f"No se pudo abrir {self.direccion}")
+        print(f"✅ Publicando lecturas en {self.direccion} ({self.formato})")
+        return self
+
+    def detener(self):
+        if self._loop is not None and self._servidor is not None:
+            self._loop.call_soon_threadsafe(self._servidor.close)
+        if self.tipo == "unix" and os.path.exists(self.destino):
+            os.remove(self.destino)
+
+    async def _principal(self, listo):
+        self._loop = asyncio.get_running_loop()
+        try:
+            if self.tipo == "unix":
+                # Un socket que quedó de una ejecución anterior no deja escuchar
+                if os.path.exists(self.destino):
+                    os.remove(self.destino)
+                self._servidor = await asyncio.start_unix_server(self._atender, self.destino)
+            else:
+                self._servidor = await asyncio.start_server(self._atender, *self.destino)
+        except OSError as e:
+            print(f"❌ Publicación en {self.direccion}: {e}")
+            return
+        finally:
+            listo.set()
+        async with self._servidor:
+            try:
+                await self._servidor.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    # --- publicar (desde la tubería) -------------------------------------
+
+    def publicar_lote(self, dispositivo, muestras, llegada=None):
+        # Sin suscriptores no se serializa nada
+        if not self.suscriptores or len(muestras) == 0:
+            return
+        trama = serializar_muestras(dispositivo.id, muestras, self.formato)
+        self._loop.call_soon_threadsafe(self._repartir, trama, len(muestras))
+
+    def publicar_alerta(self, transicion):
+        if self.suscriptores:
+            self._loop.call_soon_threadsafe(self._repartir, serializar([registro_alerta(transicion)], self.formato), 1)
+
+    # --- bucle de la publicación -------------------------------------------
+
+    def _repartir(self, trama, n):
+        for suscriptor in list(self.suscriptores):
+            if suscriptor.cerrado:
+                continue
+            if suscriptor.pendientes + n > self.capacidad:
+                if self.politica == "desconectar":
+                    desconectados.inc(self.direccion)
+                    descartados.inc(self.direccion, self.politica, cantidad=suscriptor.pendientes + n)
+                    suscriptor.cerrado = True
+                    suscriptor.escritor.transport.abort()
+                    suscriptor.evento.set()
+                    continue
+                while suscriptor.cola and suscriptor.pendientes + n > self.capacidad:
+                    _, viejos = suscriptor.cola.popleft()
+                    suscriptor.pendientes -= viejos
+                    descartados.inc(self.direccion, self.politica, cantidad=viejos)
+            suscriptor.cola.append((trama, n))
+            suscriptor.pendientes += n
+            suscriptor.evento.set()
+
+    async def _atender(self, lector, escritor):
+        suscriptor = _Suscriptor(escritor)
+        self.suscriptores.add(suscriptor)
+        try:
+            while not suscriptor.cerrado:
+                await suscriptor.evento.wait()
+                suscriptor.evento.clear()
+                if not suscriptor.cola:
+                    continue
+                # Todo lo acumulado sale en una sola escritura; mientras espera el drain,
+                # lo nuevo se sigue acumulando en su cola (acotada)
+                partes, suscriptor.cola, suscriptor.pendientes = suscriptor.cola, deque(), 0
+                escritor.write(b"".join(trama for trama, _ in partes))
+                await escritor.drain()
+        except (ConnectionError, OSError, asyncio.CancelledError):
+            # Al detener el servidor se cancelan las conexiones abiertas
+            pass
+        finally:
+            self.suscriptores.discard(suscriptor)
+            escritor.close()
+
+
+class PuenteMQTT:
+    def __init__(self, direccion, tema="agroduino", capacidad=CAPACIDAD):
+        _, (self.host, self.puerto) = leer_direccion(direccion if ":" in direccion else f"{direccion}:1883")
+        self.direccion = f"mqtt:{self.host}:{self.puerto}"
+        self.tema = tema
+        self.capacidad = capacidad
+        self._cliente = None
+
+    def iniciar(self):
+        """Conecta en segundo plano; None si paho-mqtt no está instalado."""
+        if mqtt is None:
+            print("⚠️ paho-mqtt no está instalado: sin puente MQTT")
+            return None
+        version = getattr(mqtt, "CallbackAPIVersion", None)
+        self._cliente = mqtt.Client(version.VERSION2) if version is not None else mqtt.Client()
+        # paho guarda en memoria lo que no pudo mandar: acotado como las demás colas
+        self._cliente.max_queued_messages_set(self.capacidad)
+        self._cliente.connect_async(self.host, self.puerto)
+        self._cliente.loop_start()
+        print(f"✅ Puente MQTT hacia {self.host}:{self.puerto} (tema {self.tema})")
+        return self
+
+    def detener(self):
+        if self._cliente is not None:
+            self._cliente.loop_stop()
+            self._cliente.disconnect()
+
+    def _publicar(self, tema, registros):
+        for registro in registros:
+            carga = json.dumps(registro, separators=(",", ":"))
+            if self._cliente.publish(tema, carga, qos=0).rc != mqtt.MQTT_ERR_SUCCESS:
+                descartados.inc(self.direccion, "descartar")
+
+    def publicar_lote(self, dispositivo, muestras, llegada=None):
+        if not self._cliente.is_connected():
+            descartados.inc(self.direccion, "descartar", cantidad=len(muestras))
+            return
+        self._publicar(f"{self.tema}/{dispositivo.id}/muestras", registros_muestras(dispositivo.id, muestras))
+
+    def publicar_alerta(self, transicion):
+        if self._cliente.is_connected():
+            self._publicar(f"{self.tema}/{transicion['zona']}/alertas", [registro_alerta(transicion)])
+
+
+def suscribirse(direccion):
+    """Generador de líneas NDJSON de un ServidorPublicacion (para scripts y la consola)."""
+    tipo, destino = leer_direccion(direccion)
+    conexion = socket.socket(socket.AF_UNIX if tipo == "unix" else socket.AF_INET, socket.SOCK_STREAM)
+    conexion.connect(destino)
+    with conexion, conexion.makefile("rb") as flujo:
+        for linea in flujo:
+            yield json.loads(linea)
+
+
+if __name__ == '__main__':
+    try:
+        for registro in suscribirse(sys.argv[1]):
+            print(registro)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,228 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+import urllib.parse
+import urllib.request
+
+import dash_bootstrap_components as dbc
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Recursos estáticos del tablero y compresión de las respuestas.
+#
+# PROY_RECURSOS elige de dónde salen Bootstrap, Font Awesome y jQuery:
+#   cdn    de los CDN, como siempre
+#   local  de vendor/: un paquete CSS y uno JS (los .min de los CDN, sin @import
+#          remotos ni mapas de fuentes), con la huella del contenido en el nombre y
+#          caché de un año; las fuentes de Font Awesome igual. Sin red no se cuelga
+#          el primer pintado esperando a un CDN
+#   auto   local si vendor/ está completo, si no cdn (por defecto)
+#
+#   python recursos.py    descarga una vez los archivos de los CDN a vendor/
+#
+# comprimir_respuestas() comprime con brotli (si está instalado) o gzip el HTML, el
+# layout, los callbacks y los JS/CSS de Dash; lo que no cambia (huella o ETag) se
+# comprime una sola vez. cachear_layout() arma el JSON del layout una vez y lo sirve
+# con ETag, así una recarga con el layout ya en caché recibe un 304.
+
+MODO = os.environ.get("PROY_RECURSOS", "auto")
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vendor")
+RUTA = "/recursos/"
+
+ESTILOS_CDN = [
+    dbc.themes.DARKLY,
+    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css",
+]
+SCRIPTS_CDN = [
+    "https://code.jquery.com/jquery-3.6.0.min.js",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js",
+]
+
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+MIN_COMPRIMIR = 512  # bytes; por debajo la cabecera de compresión no compensa
+TIPOS_COMPRIMIBLES = {"application/json", "text/html", "text/css", "application/javascript", "text/javascript",
+                      "image/svg+xml", "font/ttf", "application/vnd.ms-fontobject"}
+CALIDAD_BROTLI = 5  # rápida para las respuestas de cada tick
+
+_RE_URL = re.compile(r"""url\(\s*['"]?([^'")]+?)['"]?\s*\)""")
+_RE_IMPORT_REMOTO = re.compile(r"""@import\s+(?:url\()?\s*['"]?https?://[^;]*;""")
+_RE_MAPA = re.compile(r"/[*/]#\s*sourceMappingURL=[^\n]*?(?:\*/|$)", re.MULTILINE)
+
+mimetypes.add_type("font/woff2", ".woff2")
+mimetypes.add_type("font/woff", ".woff")
+mimetypes.add_type("font/ttf", ".ttf")
+
+
+def nombre_local(url):
+    return os.path.basename(urllib.parse.urlparse(url).path)
+
+
+def _referencias(css):
+    # url(...) relativas de una hoja de estilos (las fuentes de Font Awesome)
+    for ref in _RE_URL.findall(css):
+        if not ref.startswith(("data:", "http:", "https:", "#")):
+            yield ref
+
+
+def descargar(directorio=DIRECTORIO):
+    """Baja los recursos de los CDN y los archivos que referencian sus hojas de estilo."""
+    os.makedirs(directorio, exist_ok=True)
+    for url in ESTILOS_CDN + SCRIPTS_CDN:
+        pendientes = [url]
+        while pendientes:
+            actual = pendientes.pop()
+            with urllib.request.urlopen(actual, timeout=30) as respuesta:
+                datos = respuesta.read()
+            with open(os.path.join(directorio, nombre_local(actual)), "wb") as archivo:
+                archivo.write(datos)
+            print(f"✅ {nombre_local(actual)} ({len(datos) / 1024:.0f} KB)")
+            if actual.endswith(".css"):
+                pendientes += [urllib.parse.urljoin(actual, ref) for ref in set(_referencias(datos.decode("utf-8")))]
+
+
+def elegir_codificacion(aceptadas):
+    aceptadas = aceptadas.lower()
+    if brotli is not None and "br" in aceptadas:
+        return "br"
+    if "gzip" in aceptadas:
+        return "gzip"
+    return None
+
+
+def comprimir(datos, codificacion, calidad=CALIDAD_BROTLI):
+    if codificacion == "br":
+        return brotli.compress(datos, quality=calidad)
+    return gzip.compress(datos, 6)
+
+
+class Recursos:
+    def __init__(self, modo=MODO, directorio=DIRECTORIO):
+        if modo not in ("cdn", "local", "auto"):
+            raise ValueError(f"Modo de recursos desconocido: {modo}")
+        self.estilos = list(ESTILOS_CDN)
+        self.scripts = list(SCRIPTS_CDN)
+        self.local = False
+        self._archivos = {}     # nombre con huella -> (datos, mimetype)
+        self._comprimidos = {}  # (nombre, codificación) -> datos
+        self._lock = threading.Lock()
+        if modo == "cdn":
+            return
+        paquetes = [os.path.join(directorio, nombre_local(url)) for url in ESTILOS_CDN + SCRIPTS_CDN]
+        faltan = [os.path.basename(ruta) for ruta in paquetes if not os.path.isfile(ruta)]
+        if faltan:
+            if modo == "local":
+                print(f"⚠️ Faltan en {directorio}: {', '.join(faltan)} (python recursos.py). Se usan los CDN.")
+            return
+        # Fuentes y demás archivos sueltos primero: las hojas de estilo apuntan a sus nombres con huella
+        urls = {}
+        for nombre in sorted(os.listdir(directorio)):
+            ruta = os.path.join(directorio, nombre)
+            if ruta not in paquetes and os.path.isfile(ruta):
+                with open(ruta, "rb") as archivo:
+                    urls[nombre] = self._publicar(nombre, archivo.read())
+        estilos = []
+        for url in ESTILOS_CDN:
+            with open(os.path.join(directorio, nombre_local(url)), encoding="utf-8") as archivo:
+                estilos.append(self._css_local(archivo.read(), urls))
+        scripts = []
+        for url in SCRIPTS_CDN:
+            with open(os.path.join(directorio, nombre_local(url)), encoding="utf-8") as archivo:
+                scripts.append(_RE_MAPA.sub("", archivo.read()))
+        self.estilos = [self._publicar("estilos.css", "\n".join(estilos).encode("utf-8"))]
+        self.scripts = [self._publicar("scripts.js", ";\n".join(scripts).encode("utf-8"))]
+        self.local = True
+
+    @staticmethod
+    def _css_local(css, urls):
+        # Sin @import remotos (las fuentes de Google del tema): sin red bloquearían la hoja
+        css = _RE_IMPORT_REMOTO.sub("", _RE_MAPA.sub("", css))
+
+        def reemplazar(m):
+            nombre = nombre_local(m.group(1))
+            return f"url({urls[nombre]})" if nombre in urls else m.group(0)
+        return _RE_URL.sub(reemplazar, css)
+
+    def _publicar(self, nombre, datos):
+        base, extension = os.path.splitext(nombre)
+        con_huella = f"{base}.{hashlib.sha256(datos).hexdigest()[:12]}{extension}"
+        tipo = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+        self._archivos[con_huella] = (datos, tipo)
+        return RUTA + con_huella
+
+    def registrar(self, server):
+        server.route(RUTA + "<nombre>")(self.servir)
+
+    def servir(self, nombre):
+        if nombre not in self._archivos:
+            return Response("No encontrado", status=404)
+        datos, tipo = self._archivos[nombre]
+        encabezados = {"Cache-Control": CACHE_INMUTABLE, "Vary": "Accept-Encoding"}
+        codificacion = elegir_codificacion(request.headers.get("Accept-Encoding", ""))
+        if codificacion is not None and tipo.split(";")[0] in TIPOS_COMPRIMIBLES:
+            # Se comprime con la mejor calidad la primera vez que se pide y queda guardado
+            with self._lock:
+                comprimido = self._comprimidos.get((nombre, codificacion))
+                if comprimido is None:
+                    comprimido = self._comprimidos[nombre, codificacion] = comprimir(datos, codificacion, 11)
+            datos = comprimido
+            encabezados["Content-Encoding"] = codificacion
+        return Response(datos, mimetype=tipo, headers=encabezados)
+
+
+def comprimir_respuestas(server, minimo=MIN_COMPRIMIR):
+    # Respuestas que no cambian (con huella en la URL o con ETag): comprimidas una vez
+    guardadas = {}
+
+    @server.after_request
+    def comprimir_respuesta(respuesta):
+        if (respuesta.status_code != 200 or respuesta.direct_passthrough or respuesta.is_streamed
+                or "Content-Encoding" in respuesta.headers or respuesta.mimetype not in TIPOS_COMPRIMIBLES):
+            return respuesta
+        respuesta.vary.add("Accept-Encoding")
+        codificacion = elegir_codificacion(request.headers.get("Accept-Encoding", ""))
+        datos = respuesta.get_data()
+        if codificacion is None or len(datos) < minimo:
+            return respuesta
+        etag = respuesta.get_etag()[0]
+        if etag is not None or (respuesta.cache_control.max_age or 0) >= 86400:
+            clave = (request.path, etag, codificacion)
+            comprimido = guardadas.get(clave)
+            if comprimido is None:
+                comprimido = guardadas[clave] = comprimir(datos, codificacion)
+        else:
+            comprimido = comprimir(datos, codificacion)
+        respuesta.set_data(comprimido)
+        respuesta.headers["Content-Encoding"] = codificacion
+        return respuesta
+
+
+def cachear_layout(app):
+    """Sirve el layout (estático) serializado una sola vez, con ETag."""
+    ruta = app.config.requests_pathname_prefix + "_dash-layout"
+    cache = {}
+
+    @app.server.before_request
+    def layout_cacheado():
+        if request.path != ruta:
+            return None
+        if not cache:
+            datos = app.serve_layout().get_data()
+            cache.update(datos=datos, etag=hashlib.sha256(datos).hexdigest()[:16])
+        if request.if_none_match.contains(cache["etag"]):
+            return Response(status=304)
+        respuesta = Response(cache["datos"], mimetype="application/json")
+        respuesta.set_etag(cache["etag"])
+        respuesta.cache_control.no_cache = True
+        return respuesta
+
+
+if __name__ == '__main__':
+    descargar(sys.argv[1] if len(sys.argv) > 1 else DIRECTORIO)
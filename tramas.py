@@ -0,0 +1,89 @@
+import re
+from collections import namedtuple
+
+# Parser de tramas del Arduino. Acepta dos formatos por línea:
+#
+#   Texto (el de siempre):
+#     Humedad Suelo: 45% | Temperatura: 23.5°C | Humedad Ambiente: 60.0%
+#
+#   CSV compacto con checksum (suma módulo 256 de los bytes entre '$' y '*', en hex):
+#     $A,45,23.5,60.0*BA
+#
+# Se trabaja sobre los bytes crudos sin decodificar: el texto con una sola expresión
+# precompilada y el CSV con un único split por comas.
+
+Lectura = namedtuple("Lectura", ["humedad", "temperatura", "humedad_ambiente"])
+
+_NUM = rb"(-?\d+(?:\.\d+)?)"
+
+_RE_TEXTO = re.compile(
+    rb"Humedad Suelo:\s*(-?\d+)\s*%\s*\|\s*"
+    rb"Temperatura:\s*" + _NUM + rb"\s*(?:\xc2\xb0|\xb0)?C\s*\|\s*"
+    rb"Humedad Ambiente:\s*" + _NUM + rb"\s*%"
+)
+
+_PREFIJO_TEXTO = b"Humedad Suelo"
+_INICIO_CSV = ord("$")
+_TIPO_CSV = b"$A"
+
+
+def checksum(payload):
+    return sum(payload) & 0xFF
+
+
+def formatear_csv(humedad, temperatura, humedad_ambiente):
+    """Arma una trama CSV con checksum, tal como la enviaría el firmware."""
+    payload = f"A,{int(humedad)},{temperatura:.1f},{humedad_ambiente:.1f}".encode("ascii")
+    return b"$" + payload + b"*" + f"{checksum(payload):02X}".encode("ascii")
+
+
+class ParserTramas:
+    def __init__(self):
+        self.validas = 0
+        self.invalidas = 0
+        self.checksum_erroneo = 0
+        self.ignoradas = 0
+        self.ultima_invalida = None
+
+    def _invalida(self, linea):
+        self.invalidas += 1
+        self.ultima_invalida = bytes(linea)
+        return None
+
+    def parsear(self, linea):
+        """Devuelve una Lectura, o None si la línea no es una trama válida."""
+        if not linea:
+            return None
+        if linea[0] == _INICIO_CSV:
+            cuerpo, separador, suma = linea.partition(b"*")
+            campos = cuerpo.split(b",")
+            if not separador or len(campos) != 4 or campos[0] != _TIPO_CSV:
+                return self._invalida(linea)
+            try:
+                if (sum(cuerpo) - _INICIO_CSV) & 0xFF != int(suma, 16):
+                    self.checksum_erroneo += 1
+                    return self._invalida(linea)
+                lectura = Lectura(int(campos[1]), float(campos[2]), float(campos[3]))
+            except ValueError:
+                return self._invalida(linea)
+            self.validas += 1
+            return lectura
+
+        m = _RE_TEXTO.search(linea)
+        if m is None:
+            if _PREFIJO_TEXTO in linea:
+                return self._invalida(linea)
+            # Mensajes de arranque/depuración del firmware: no son tramas
+            self.ignoradas += 1
+            return None
+        hum, temp, hum_amb = m.groups()
+        self.validas += 1
+        return Lectura(int(hum), float(temp), float(hum_amb))
+
+    def estadisticas(self):
+        return {
+            "validas": self.validas,
+            "invalidas": self.invalidas,
+            "checksum_erroneo": self.checksum_erroneo,
+            "ignoradas": self.ignoradas,
+        }
@@ -0,0 +1,157 @@
+import abc
+import os
+import random
+import threading
+import time
+
+# Transportes sustitutos de la placa, para correr el tablero y los benchmarks sin
+# hardware. Cada uno abre un pseudo-terminal (POSIX) y escribe tramas en el lado
+# maestro; el lado esclavo es un puerto serial más que el motor abre con
+# serial.Serial, así que lector, parser y almacenamiento son los mismos que con
+# un Arduino real. Se describen como un puerto de serial.tools.list_ports
+# (device, description, serial_number) para que el gestor los descubra igual.
+#
+#   SimuladorSerial     -> genera "Humedad Suelo: ..% | Temperatura: ..°C | Humedad Ambiente: ..%"
+#   ReproductorCaptura  -> repite una captura grabada, con sus tiempos o a tasa fija
+#
+# Formato de captura: una trama por línea, tal como la mandó la placa. Si la línea
+# empieza con "<segundos>\t", ese número es el instante relativo de la trama.
+
+
+class TransportePty(abc.ABC):
+    description = "Arduino (simulado)"
+
+    def __init__(self, serial_number, tasa=1.0):
+        if os.name != "posix":
+            raise OSError("Los transportes simulados necesitan pseudo-terminales (POSIX)")
+        import tty
+        self.serial_number = serial_number
+        self.tasa = tasa
+        self._maestro, self._esclavo = os.openpty()
+        tty.setraw(self._maestro)
+        tty.setraw(self._esclavo)
+        self.device = os.ttyname(self._esclavo)
+        # Sin bloquear: si nadie lee el esclavo, las tramas se pierden como en un puerto real
+        os.set_blocking(self._maestro, False)
+        self.enviadas = 0
+        self.ultimo_envio = None  # time.perf_counter() de la última trama escrita
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._escribir, name=f"transporte-{self.serial_number}", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join()
+        for fd in (self._maestro, self._esclavo):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    @abc.abstractmethod
+    def tramas(self):
+        """Iterador de (instante relativo o None, trama en bytes)."""
+
+    def _enviar(self, lote):
+        datos = b"".join(linea + b"\r\n" for linea in lote)
+        try:
+            n = os.write(self._maestro, datos)
+        except OSError:
+            # Buffer del pty lleno (nadie lee) o pty cerrado: el lote se pierde
+            return
+        self.enviadas += len(lote) if n == len(datos) else datos.count(b"\n", 0, n)
+        self.ultimo_envio = time.perf_counter()
+
+    def _escribir(self):
+        # Las tramas sin instante salen a `tasa` por segundo; a tasas altas se escriben
+        # en lotes cada pocos milisegundos en lugar de dormir entre cada una
+        inicio = time.perf_counter()
+        debidas = 0.0
+        lote = []
+        for instante, linea in self.tramas():
+            if self._detener.is_set():
+                return
+            if instante is not None:
+                espera = inicio + instante - time.perf_counter()
+            else:
+                debidas += 1
+                espera = inicio + debidas / self.tasa - time.perf_counter()
+            if espera > 0.005:
+                if lote:
+                    self._enviar(lote)
+                    lote = []
+                if self._detener.wait(espera):
+                    return
+            lote.append(linea)
+            if len(lote) >= 256:
+                self._enviar(lote)
+                lote = []
+        if lote:
+            self._enviar(lote)
+
+
+class SimuladorSerial(TransportePty):
+    def __init__(self, serial_number="SIM0", tasa=1.0, semilla=None):
+        super().__init__(serial_number, tasa)
+        self._azar = random.Random(semilla)
+
+    def tramas(self):
+        # Paseo aleatorio dentro de rangos creíbles para una cama del invernadero
+        humedad, temperatura, humedad_ambiente = 50.0, 24.0, 55.0
+        while True:
+            humedad = min(100.0, max(0.0, humedad + self._azar.uniform(-1.0, 1.0)))
+            temperatura = min(45.0, max(5.0, temperatura + self._azar.uniform(-0.2, 0.2)))
+            humedad_ambiente = min(100.0, max(0.0, humedad_ambiente + self._azar.uniform(-0.5, 0.5)))
+            yield None, (f"Humedad Suelo: {int(humedad)}% | Temperatura: {temperatura:.1f}°C | "
+                         f"Humedad Ambiente: {humedad_ambiente:.1f}%").encode("utf-8")
+
+
+def leer_captura(ruta):
+    """Lista de (instante relativo o None, trama) de un archivo de captura."""
+    tramas = []
+    with open(ruta, "rb") as archivo:
+        for linea in archivo:
+            linea = linea.rstrip(b"\r\n")
+            if not linea:
+                continue
+            instante = None
+            cabeza, tab, resto = linea.partition(b"\t")
+            if tab:
+                try:
+                    instante = float(cabeza)
+                    linea = resto
+                except ValueError:
+                    pass
+            tramas.append((instante, linea))
+    return tramas
+
+
+class ReproductorCaptura(TransportePty):
+    def __init__(self, ruta, serial_number=None, tasa=1.0, repetir=True, respetar_tiempos=True):
+        super().__init__(serial_number or "REP-" + os.path.splitext(os.path.basename(ruta))[0], tasa)
+        self.ruta = ruta
+        self.repetir = repetir
+        self.respetar_tiempos = respetar_tiempos
+        self._tramas = leer_captura(ruta)
+        if not self._tramas:
+            raise ValueError(f"Captura vacía: {ruta}")
+
+    def tramas(self):
+        desfase = 0.0
+        while True:
+            ultimo = 0.0
+            for instante, linea in self._tramas:
+                if self.respetar_tiempos and instante is not None:
+                    ultimo = instante
+                    yield desfase + instante, linea
+                else:
+                    yield None, linea
+            if not self.repetir:
+                return
+            # La siguiente vuelta arranca un período después de la última trama
+            desfase += ultimo + 1.0 / self.tasa
@@ -0,0 +1,166 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metricas import contador, histograma
+
+# Tubería de ingesta por etapas:
+#
+#   lector serial -> parser -> cola acotada -> consumidores por lotes
+#                  (bucle asyncio)             (hilo propio: almacén, agregados, alertas...)
+#
+# El bucle de eventos solo lee y parsea; cada lectura del puerto deja en la cola un
+# bloque de muestras ya con su instante. Un hilo consumidor junta lotes (hasta
+# `tamano_lote` muestras o `intervalo_lote` segundos desde la más vieja) y se los
+# pasa, placa por placa, a cada consumidor en orden. Así un disco lento o una etapa
+# pesada nunca frenan la lectura del puerto serie. Una etapa puede devolver otro
+# arreglo (p. ej. sin las muestras en cuarentena) y las siguientes reciben ese; si
+# queda vacío, el lote de esa placa termina ahí. Con intervalo_lote=0 se entrega
+# apenas hay algo: a tasas bajas no suma latencia y bajo carga los lotes se forman
+# solos con lo que llega mientras los consumidores trabajan.
+#
+# Si la cola se llena manda la política:
+#   descartar_viejas  se tiran las muestras más viejas sin procesar (por defecto)
+#   descartar_nuevas  se tiran las que llegan
+#   esperar           contrapresión: el lector deja de leer ese puerto hasta que haya
+#                     lugar y los bytes esperan en el buffer del sistema operativo
+# Todo descarte queda contado en /metrics.
+
+POLITICAS = ("descartar_viejas", "descartar_nuevas", "esperar")
+
+encoladas = contador("tuberia_encoladas_total", "Muestras que entraron a la cola de ingesta")
+descartadas = contador("tuberia_descartadas_total", "Muestras descartadas por la cola llena", ("politica",))
+errores = contador("tuberia_errores_total", "Excepciones de los consumidores de la tubería", ("consumidor",))
+tamano_lotes = histograma("tuberia_lote_muestras", "Muestras por lote entregado a los consumidores",
+                          limites=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000))
+duracion_lotes = histograma("tuberia_lote_segundos", "Tiempo de los consumidores por lote", ("consumidor",))
+
+
+class Tuberia:
+    def __init__(self, consumidores, capacidad=65536, tamano_lote=256, intervalo_lote=0.0,
+                 politica="descartar_viejas"):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de cola desconocida: {politica}")
+        # consumidor(dispositivo, muestras, llegada): muestras es un arreglo DTYPE_MUESTRA de una placa;
+        # si devuelve un arreglo, reemplaza a `muestras` para los consumidores siguientes
+        self.consumidores = list(consumidores)
+        self.capacidad = capacidad
+        self.tamano_lote = tamano_lote
+        self.intervalo_lote = intervalo_lote
+        self.politica = politica
+        self._cola = deque()  # (dispositivo, muestras, llegada, encolado)
+        self._pendientes = 0
+        self._condicion = threading.Condition()
+        self._activa = False
+        self._hilo = None
+
+    @property
+    def pendientes(self):
+        return self._pendientes
+
+    def llena(self):
+        return self._pendientes >= self.capacidad
+
+    def agregar_consumidor(self, consumidor):
+        self.consumidores.append(consumidor)
+
+    def encolar(self, dispositivo, muestras, llegada=None):
+        """Deja un bloque de muestras de una placa para los consumidores. Nunca bloquea."""
+        n = len(muestras)
+        if n == 0:
+            return
+        with self._condicion:
+            if self._pendientes + n > self.capacidad:
+                if self.politica == "descartar_nuevas":
+                    descartadas.inc(self.politica, cantidad=n)
+                    return
+                if self.politica == "descartar_viejas":
+                    self._descartar_viejas(self._pendientes + n - self.capacidad)
+                # "esperar": el lector ya frenó antes de leer; este bloque entra igual
+            vacia = not self._cola
+            self._cola.append((dispositivo, muestras, llegada, time.monotonic()))
+            self._pendientes += n
+            encoladas.inc(cantidad=n)
+            # Se despierta al consumidor para que arranque el plazo del lote o porque ya se completó
+            if vacia or self._pendientes >= self.tamano_lote:
+                self._condicion.notify()
+
+    def _descartar_viejas(self, sobran):
+        descartadas_ahora = 0
+        while sobran > 0 and self._cola:
+            dispositivo, muestras, llegada, encolado = self._cola[0]
+            if len(muestras) <= sobran:
+                self._cola.popleft()
+                quitadas = len(muestras)
+            else:
+                self._cola[0] = (dispositivo, muestras[sobran:], llegada, encolado)
+                quitadas = sobran
+            sobran -= quitadas
+            descartadas_ahora += quitadas
+        self._pendientes -= descartadas_ahora
+        descartadas.inc(self.politica, cantidad=descartadas_ahora)
+
+    def iniciar(self):
+        self._activa = True
+        self._hilo = threading.Thread(target=self._consumir, name="tuberia-ingesta", daemon=True)
+        self._hilo.start()
+        return self
+
+    def detener(self, timeout=5.0):
+        """Procesa lo que quedó en la cola y termina el hilo consumidor."""
+        with self._condicion:
+            self._activa = False
+            self._condicion.notify()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def _tomar_lote(self):
+        with self._condicion:
+            while True:
+                if self._cola:
+                    vence = self._cola[0][3] + self.intervalo_lote
+                    if self._pendientes >= self.tamano_lote or time.monotonic() >= vence or not self._activa:
+                        break
+                    self._condicion.wait(max(vence - time.monotonic(), 0))
+                elif not self._activa:
+                    return None
+                else:
+                    self._condicion.wait()
+            lote, n = [], 0
+            while self._cola and n < self.tamano_lote:
+                bloque = self._cola.popleft()
+                lote.append(bloque)
+                n += len(bloque[1])
+            self._pendientes -= n
+            return lote
+
+    def _consumir(self):
+        while True:
+            lote = self._tomar_lote()
+            if lote is None:
+                return
+            # Bloques de la misma placa se juntan en un arreglo, en orden de llegada;
+            # la latencia se mide desde el bloque más viejo del lote
+            por_placa = {}
+            for dispositivo, muestras, llegada, _ in lote:
+                por_placa.setdefault(dispositivo.id, [dispositivo, [], llegada])[1].append(muestras)
+            for dispositivo, bloques, llegada in por_placa.values():
+                muestras = np.concatenate(bloques) if len(bloques) > 1 else bloques[0]
+                tamano_lotes.observar(len(muestras))
+                for consumidor in self.consumidores:
+                    nombre = getattr(consumidor, "__name__", type(consumidor).__name__)
+                    inicio = time.perf_counter()
+                    try:
+                        resultado = consumidor(dispositivo, muestras, llegada)
+                    except Exception as e:
+                        # Una etapa que falla no tumba la ingesta ni frena a las demás
+                        errores.inc(nombre)
+                        print(f"❌ Error en la etapa {nombre} con {dispositivo.id}: {e}")
+                        resultado = None
+                    duracion_lotes.observar(time.perf_counter() - inicio, nombre)
+                    if resultado is not None:
+                        muestras = resultado
+                        if len(muestras) == 0:
+                            break